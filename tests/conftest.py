@@ -0,0 +1,35 @@
+"""Общие фикстуры тестов
+
+Config читает config.ini из текущей папки при импорте модулей uatf, поэтому тесты идут во временной папке,
+которая создается до сбора тестов
+"""
+import os
+import tempfile
+
+import pytest
+
+
+def pytest_configure(config):
+    work_dir = tempfile.mkdtemp(prefix='uatf-tests-')
+    with open(os.path.join(work_dir, 'config.ini'), 'w', encoding='utf-8') as file:
+        file.write('[GENERAL]\n[REGRESSION]\n')
+    os.chdir(work_dir)
+
+
+@pytest.fixture
+def regression_options(monkeypatch):
+    """Меняет опции REGRESSION на время теста: regression_options(COLOR_SPACE='yiq', ...)"""
+
+    from uatf.config import Config
+    from uatf.ui.layout import main
+
+    def set_options(**options):
+        for name, value in options.items():
+            monkeypatch.setitem(Config().options['REGRESSION'], name, value)
+        if 'COLOR_SPACE' in options:
+            # функция разницы цветов эталонного движка выбирается при импорте main
+            from uatf.ui.layout.color_lab import equal_ciede2000
+            from uatf.ui.layout.color_yiq import delta_yiq
+            monkeypatch.setattr(main, 'equal_img', delta_yiq if options['COLOR_SPACE'] == 'yiq' else equal_ciede2000)
+
+    return set_options
@@ -0,0 +1,84 @@
+"""Векторное определение сглаживания AntialiasingDetector против эталонного is_aa"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from uatf.ui.layout.antialiasing import AntialiasingDetector, NEIGHBOURS, is_aa, luma_plane, shift_plane
+
+
+def _few_colors(seed, shape=(13, 17), alpha=False):
+    """Пятна 2x2 из трех цветов: одинаковых соседей много, и сглаживание находится и отвергается"""
+
+    rng = np.random.default_rng(seed)
+    palette = np.array([[255, 255, 255, 255], [0, 0, 0, 255], [128, 90, 40, 255]], dtype=np.uint8)
+    if alpha:
+        palette[1:, 3] = [60, 120]
+    spots = rng.integers(0, 3, ((shape[0] + 1) // 2, (shape[1] + 1) // 2))
+    return palette[spots.repeat(2, axis=0).repeat(2, axis=1)[:shape[0], :shape[1]]]
+
+
+def _antialiased(offset):
+    """Эллипсы со сглаженными краями: рисуются в 4 раза крупнее и уменьшаются"""
+
+    image = Image.new('RGBA', (128, 96), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([10 + offset, 8, 70 + offset, 60], fill=(20, 40, 200, 255))
+    draw.ellipse([60, 40 + offset, 120, 90 + offset], fill=(200, 40, 20, 255))
+    return np.asarray(image.resize((32, 24), Image.BOX))
+
+
+def _is_aa_python(image1, image2):
+    """Маска сглаживания по is_aa для каждого пикселя, как в эталонном движке"""
+
+    height, width = image1.shape[:2]
+    pixel1 = Image.fromarray(image1, 'RGBA').load()
+    pixel2 = Image.fromarray(image2, 'RGBA').load()
+    expected = np.zeros((height, width), dtype=bool)
+    for y in range(height):
+        for x in range(width):
+            expected[y, x] = is_aa(pixel1, x, y, width, height, pixel2) or is_aa(pixel2, x, y, width, height, pixel1)
+    return expected
+
+
+PAIRS = {
+    'few colors': lambda: (_few_colors(1), _few_colors(2)),
+    'few colors with alpha': lambda: (_few_colors(3, alpha=True), _few_colors(4, alpha=True)),
+    'antialiased lines': lambda: (_antialiased(0), _antialiased(2)),
+    'three rows': lambda: (_few_colors(5, (3, 21)), _few_colors(6, (3, 21))),
+    'three columns': lambda: (_few_colors(7, (21, 3)), _few_colors(8, (21, 3))),
+}
+
+
+@pytest.mark.parametrize('pair', PAIRS.values(), ids=PAIRS.keys())
+def test_detect_matches_is_aa(pair):
+    image1, image2 = pair()
+    ys, xs = np.nonzero(np.ones(image1.shape[:2], dtype=bool))
+    expected = _is_aa_python(image1, image2)
+    assert expected.any()
+    actual = AntialiasingDetector(image1, image2).detect(xs, ys).reshape(expected.shape)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_detect_with_precomputed_luma():
+    image1, image2 = _antialiased(0), _antialiased(3)
+    ys, xs = np.nonzero(np.ones(image1.shape[:2], dtype=bool))
+    expected = AntialiasingDetector(image1, image2).detect(xs, ys)
+    actual = AntialiasingDetector(image1, image2, luma_plane(image2)).detect(xs, ys)
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('dx, dy', NEIGHBOURS)
+def test_shift_plane_takes_neighbour(dx, dy):
+    plane = np.arange(20, dtype=float).reshape(4, 5)
+    shifted = shift_plane(plane, dx, dy)
+    for y in range(4):
+        for x in range(5):
+            if 0 <= x + dx < 5 and 0 <= y + dy < 4:
+                assert shifted[y, x] == plane[y + dy, x + dx]
+            else:
+                assert np.isnan(shifted[y, x])
+
+
+def test_equal_siblings_skip_border():
+    counts = AntialiasingDetector.equal_siblings(np.zeros((3, 4)))
+    np.testing.assert_array_equal(counts, [[3, 5, 5, 3], [5, 8, 8, 5], [3, 5, 5, 3]])
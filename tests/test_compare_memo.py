@@ -0,0 +1,132 @@
+"""Кэш результатов сравнения CompareMemo: ключ, устаревание и вытеснение"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.config import Config
+from uatf.ui.layout import compare_memo
+from uatf.ui.layout.compare_memo import CompareMemo
+from uatf.ui.layout.main import LayoutCompare, fill_transparent
+
+
+def _image(seed=0) -> Image.Image:
+    pixels = np.random.default_rng(seed).integers(0, 256, (20, 30, 4), dtype=np.uint8)
+    pixels[..., 3] = 255
+    return Image.fromarray(pixels, 'RGBA')
+
+
+def _changed(image: Image.Image, delta: int) -> Image.Image:
+    """Копия, в которой у блока 4x4 изменен красный канал"""
+
+    pixels = np.array(image)
+    pixels[5:9, 5:9, 0] = (pixels[5:9, 5:9, 0].astype(int) + delta) % 256
+    return Image.fromarray(pixels, 'RGBA')
+
+
+@pytest.fixture
+def memo(tmp_path, regression_options, monkeypatch):
+    """Включенный кэш в отдельной папке артефактов"""
+
+    monkeypatch.setitem(Config().options['GENERAL'], 'ARTIFACT_PATH', str(tmp_path))
+    regression_options(COMPARE_MEMO_SIZE=1)
+    monkeypatch.setattr(CompareMemo, 'instance', None)
+    yield CompareMemo()
+    if CompareMemo.instance._conn is not None:
+        CompareMemo.instance._conn.close()
+
+
+SETTINGS = dict(tolerance=2.3, fail_fast=0, max_diff_pixels=0, max_diff_ratio=0, comparator='ciede2000')
+
+
+@pytest.mark.parametrize('name, value', [('tolerance', 5), ('comparator', 'ssim'), ('fail_fast', 10),
+                                         ('max_diff_pixels', 3), ('max_diff_ratio', 0.1)])
+def test_key_depends_on_settings(memo, name, value):
+    standard, current = _image(), _changed(_image(), 3)
+    key = memo.key(standard, current, **SETTINGS)
+    assert memo.key(standard, current, **SETTINGS) == key
+    assert memo.key(standard, current, **dict(SETTINGS, **{name: value})) != key
+
+
+@pytest.mark.parametrize('option, value', [('COLOR_SPACE', 'yiq'), ('COMPARE_ENGINE', 'python'),
+                                           ('ANTIALIASING', True), ('ANTIALIASING_TOLERANCE', 99),
+                                           ('HIGHLIGHT_DIFF', True), ('DIFF_AREA_BORDER', 3),
+                                           ('SHIFT_DETECTION', True), ('MAX_SHIFT', 1)])
+def test_key_depends_on_options(memo, regression_options, option, value):
+    standard, current = _image(), _changed(_image(), 3)
+    key = memo.key(standard, current, **SETTINGS)
+    regression_options(**{option: value})
+    assert memo.key(standard, current, **SETTINGS) != key
+
+
+def test_key_depends_on_mask(memo):
+    """Скрытая при снимке область закрашивается на текущем изображении и меняет его хэш"""
+
+    standard, current = _image(), _image()
+    key = memo.key(standard, current, **SETTINGS)
+    assert memo.key(standard, fill_transparent(_image(), [[2, 2, 5, 5]]), **SETTINGS) != key
+    assert memo.key(standard, fill_transparent(_image(), [[2, 2, 6, 5]]), **SETTINGS) != \
+        memo.key(standard, fill_transparent(_image(), [[2, 2, 5, 5]]), **SETTINGS)
+
+
+@pytest.mark.parametrize('change', [dict(tolerance=50), dict(comparator='ssim', tolerance=0.5),
+                                    dict(max_diff_pixels=16)])
+def test_changed_settings_are_compared_again(memo, tmp_path, change):
+    """Кэшированный вердикт не переносится на сравнение с другими настройками"""
+
+    layout = LayoutCompare(None)
+    standard, current = _image(), _changed(_image(), 30)
+    diff_name = str(tmp_path / 'check~diff.png')
+    assert not layout._compare_image(diff_name, standard, current, 2.3, comparator='ciede2000')
+    assert memo.misses == 1
+    settings = dict(dict(tolerance=2.3, comparator='ciede2000'), **change)
+    assert layout._compare_image(diff_name, standard, current, **settings)
+    assert (memo.hits, memo.misses) == (0, 2)
+    # повторное сравнение с теми же настройками берется из кэша вместе с пояснением и изображением отличий
+    assert not layout._compare_image(diff_name, standard, current, 2.3, comparator='ciede2000')
+    assert (memo.hits, memo.misses) == (1, 2)
+
+
+def test_old_entries_expire(memo, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(compare_memo, 'time', SimpleNamespace(time=lambda: now))
+    memo.put('old', True, '', None)
+    now += compare_memo.MAX_AGE / 2
+    memo.put('recent', True, '', None)
+    now += compare_memo.MAX_AGE / 2 + 1
+    memo.put('new', False, 'отличия', b'png')
+    assert memo.get('old') is None
+    assert memo.get('recent') == (True, '', None)
+    assert memo.get('new') == (False, 'отличия', b'png')
+
+
+def test_expired_entries_removed_on_open(memo, monkeypatch):
+    memo.put('old', True, '', None)
+    memo._conn.close()
+    monkeypatch.setattr(CompareMemo, 'instance', None)
+    later = compare_memo.time.time() + compare_memo.MAX_AGE + 1
+    monkeypatch.setattr(compare_memo, 'time', SimpleNamespace(time=lambda: later))
+    assert CompareMemo().get('old') is None
+
+
+def test_least_recently_used_evicted_over_size(memo, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(compare_memo, 'time', SimpleNamespace(time=lambda: now))
+    diff = b'x' * 400 * 1024
+    for key in ('first', 'second'):
+        memo.put(key, False, '', diff)
+        now += 1
+    # обращение продлевает жизнь записи
+    assert memo.get('first') is not None
+    now += 1
+    memo.put('third', False, '', diff)
+    assert memo.get('second') is None
+    assert memo.get('first') is not None
+    assert memo.get('third') is not None
+    assert memo._db.execute('SELECT sum(size) FROM memo').fetchone()[0] <= memo.max_bytes
+
+
+def test_entry_over_size_not_kept(memo):
+    memo.put('huge', False, '', b'x' * (memo.max_bytes + 1))
+    assert memo.get('huge') is None
@@ -0,0 +1,99 @@
+"""Векторизованные движки дают те же вердикты и изображения отличий, что эталонный попиксельный обход"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from uatf.ui.layout.comparators import get_comparator
+from uatf.ui.layout.main import LayoutCompare
+
+
+def _picture(offset: int = 0) -> Image.Image:
+    """Фигуры со сглаженными краями: рисуем в 4 раза крупнее и уменьшаем"""
+
+    image = Image.new('RGBA', (160, 96), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((20 + offset, 12, 120 + offset, 80), fill=(40, 90, 200, 255))
+    draw.line((0, 90, 150 + offset, 4), fill=(0, 0, 0, 255), width=3)
+    draw.text((10, 60), 'UATF', fill=(10, 10, 10, 255))
+    return image.resize((40, 24), Image.LANCZOS)
+
+
+def _pairs():
+    rng = np.random.default_rng(7)
+    white = np.full((24, 40, 4), 255, dtype=np.uint8)
+
+    one_pixel = white.copy()
+    one_pixel[5, 7, :3] = 250
+    black_block = white.copy()
+    black_block[8:16, 10:20, :3] = 0
+    noise = rng.integers(0, 256, (24, 40, 4), dtype=np.uint8)
+    noisy = noise.copy()
+    noisy[rng.random((24, 40)) < 0.2] += rng.integers(1, 6, 4, dtype=np.uint8)
+    colored = white.copy()
+    colored[2:6, 2:30, :3] = (200, 50, 50)
+    transparent = colored.copy()
+    transparent[2:6, 2:30, 3] = 230
+    return {
+        'one_pixel': (white, one_pixel),
+        'black_block': (white, black_block),
+        'noise': (noise, noisy),
+        'alpha': (colored, transparent),
+        'antialiasing': (np.asarray(_picture()), np.asarray(_picture(1))),
+        'size': (white, white[:20, :36]),
+    }
+
+
+PAIRS = _pairs()
+
+
+def _compare(engine: str, standard: np.ndarray, current: np.ndarray, diff_name: str, **kwargs):
+    layout = LayoutCompare(None)
+    is_equal = layout._compare_by_pixel(Image.fromarray(current), Image.fromarray(standard), diff_name,
+                                        layout._get_tolerance(None, engine), comparator=get_comparator(engine),
+                                        **kwargs)
+    diff = np.asarray(Image.open(diff_name).convert('RGBA')) if not is_equal else None
+    return is_equal, layout._diff_description, diff
+
+
+def _assert_same_as_python(tmp_path, standard: np.ndarray, current: np.ndarray, **kwargs):
+    expected = _compare('python', standard, current, str(tmp_path / 'python.png'), **kwargs)
+    actual = _compare(None, standard, current, str(tmp_path / 'numpy.png'), **kwargs)
+    assert actual[:2] == expected[:2]
+    if expected[2] is not None:
+        np.testing.assert_array_equal(actual[2], expected[2])
+
+
+@pytest.mark.parametrize('antialiasing', [False, True])
+@pytest.mark.parametrize('color_space', ['lab', 'yiq'])
+@pytest.mark.parametrize('pair', sorted(PAIRS))
+def test_engines_match_python(tmp_path, regression_options, color_space, antialiasing, pair):
+    regression_options(COLOR_SPACE=color_space, ANTIALIASING=antialiasing, COMPARATOR='')
+    _assert_same_as_python(tmp_path, *PAIRS[pair])
+
+
+@pytest.mark.parametrize('budget', [{'max_diff_pixels': 10}, {'max_diff_pixels': 200}, {'fail_fast': 5},
+                                    {'fail_fast': 5, 'max_diff_pixels': 10}, {'highlight': True}])
+@pytest.mark.parametrize('color_space', ['lab', 'yiq'])
+@pytest.mark.parametrize('pair', ['antialiasing', 'black_block'])
+def test_budget_matches_python(tmp_path, regression_options, color_space, pair, budget):
+    budget = dict(budget)
+    regression_options(COLOR_SPACE=color_space, ANTIALIASING=True, COMPARATOR='',
+                       HIGHLIGHT_DIFF=budget.pop('highlight', False))
+    _assert_same_as_python(tmp_path, *PAIRS[pair], **budget)
+
+
+@pytest.mark.parametrize('engine, color_space, options, expected', [
+    ('pixelmatch', 'lab', {}, 8.1),
+    ('python', 'yiq', {}, 8.1),
+    ('python', 'yiq', {'YIQ_TOLERANCE': 20}, 20),
+    (None, 'yiq', {'YIQ_TOLERANCE': 20}, 20),
+    (None, 'lab', {'YIQ_TOLERANCE': 20}, 50),
+    ('python', 'lab', {}, 50),
+    ('ssim', 'lab', {}, 0.05),
+])
+def test_tolerance_scale(regression_options, engine, color_space, options, expected):
+    regression_options(COLOR_SPACE=color_space, COMPARATOR='', TOLERANCE=50, **options)
+    layout = LayoutCompare(None)
+    layout._tolerance = 50
+    assert layout._get_tolerance(None, engine) == expected
+    assert layout._get_tolerance(3, engine) == 3
@@ -0,0 +1,31 @@
+"""Фоновое сравнение в пуле процессов"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.ui.layout.compare_pool import ComparePool
+from uatf.ui.layout.main import compare_in_process
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ComparePool, 'instance', None)
+    pool = ComparePool()
+    pool.processes = 1
+    yield pool
+    pool.shutdown()
+
+
+def test_worker_uses_test_process_options(tmp_path, regression_options, pool):
+    # движок задан только в процессе теста, процесс пула запущен через spawn и config.ini его не содержит;
+    # при допуске 1 ssim не находит отличий, а ciede2000 по умолчанию нашел бы черный квадрат
+    regression_options(COMPARATOR='ssim')
+    standard = np.full((16, 16, 4), 255, dtype=np.uint8)
+    current = standard.copy()
+    current[4:8, 4:8, :3] = 0
+    src = str(tmp_path / 'standard.png')
+    Image.fromarray(standard, 'RGBA').save(src)
+
+    future = pool.submit(compare_in_process, Image.fromarray(current, 'RGBA'), src, str(tmp_path / 'diff.png'), 1)
+    assert future.result(timeout=60) == (True, '')
+    assert pool._executor._mp_context.get_start_method() == 'spawn'
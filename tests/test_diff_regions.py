@@ -0,0 +1,118 @@
+"""Области изменений diff_regions и расширение маски dilate"""
+import numpy as np
+import pytest
+
+from uatf.ui.layout.main import LayoutCompare
+from uatf.ui.layout.pixel_diff import diff_regions, dilate
+
+
+def _mask(height, width, points):
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y in points:
+        mask[y, x] = True
+    return mask
+
+
+def _dilate_by_window(mask, radius):
+    """Расширение маски перебором окна вокруг каждого пикселя"""
+
+    height, width = mask.shape
+    result = np.zeros_like(mask)
+    for y in range(height):
+        for x in range(width):
+            result[y, x] = mask[max(y - radius, 0):y + radius + 1, max(x - radius, 0):x + radius + 1].any()
+    return result
+
+
+def _regions_by_pairs(mask, border):
+    """Области по определению: пиксели в одной области, если их области +-border пересекаются"""
+
+    ys, xs = np.nonzero(mask)
+    points = list(zip(xs.tolist(), ys.tolist()))
+    component = list(range(len(points)))
+    for i, (x1, y1) in enumerate(points):
+        for j in range(i):
+            x2, y2 = points[j]
+            if abs(x1 - x2) < 2 * border and abs(y1 - y2) < 2 * border:
+                old, new = component[i], component[j]
+                component = [new if label == old else label for label in component]
+    regions = {}
+    for (x, y), label in zip(points, component):
+        x0, y0, x1, y1 = regions.get(label, (x, y, x, y))
+        regions[label] = (min(x0, x), min(y0, y), max(x1, x), max(y1, y))
+    return sorted([x0 - border, y0 - border, x1 + border, y1 + border] for x0, y0, x1, y1 in regions.values())
+
+
+def _regions_by_python(mask, border):
+    """Области, как их собирает построчный обход эталонного движка"""
+
+    diff_area = []
+    for y, x in zip(*np.nonzero(mask)):
+        diff_area = LayoutCompare.compute_diff_area(diff_area, int(x), int(y), border)
+    return sorted(diff_area)
+
+
+@pytest.mark.parametrize('radius', [0, 1, 2, 5, 30])
+def test_dilate_matches_window(radius):
+    mask = np.random.default_rng(radius).random((17, 23)) > 0.93
+    mask[0, 0] = mask[-1, -1] = mask[0, -1] = True
+    np.testing.assert_array_equal(dilate(mask, radius), _dilate_by_window(mask, radius))
+
+
+def test_dilate_keeps_mask():
+    mask = _mask(5, 5, [(2, 2)])
+    dilate(mask, 0)[0, 0] = True
+    assert np.count_nonzero(mask) == 1
+
+
+# (пиксели, область) на маске 40x30 с border=3: области пересекаются, если пиксели ближе 2 * border
+FIXTURES = {
+    'empty': ([], []),
+    'single': ([(10, 10)], [[7, 7, 13, 13]]),
+    'top left corner': ([(0, 0)], [[-3, -3, 3, 3]]),
+    'bottom right corner': ([(39, 29)], [[36, 26, 42, 32]]),
+    'row gap 5 merged': ([(10, 10), (15, 10)], [[7, 7, 18, 13]]),
+    'row gap 6 separate': ([(10, 10), (16, 10)], [[7, 7, 13, 13], [13, 7, 19, 13]]),
+    'column gap 5 merged': ([(10, 10), (10, 15)], [[7, 7, 13, 18]]),
+    'diagonal gap 5 merged': ([(10, 10), (15, 15)], [[7, 7, 18, 18]]),
+    'diagonal gap 6 separate': ([(10, 10), (16, 16)], [[7, 7, 13, 13], [13, 13, 19, 19]]),
+    'anti diagonal merged': ([(15, 10), (10, 15)], [[7, 7, 18, 18]]),
+    'block': ([(x, y) for x in range(20, 24) for y in range(5, 8)], [[17, 2, 26, 10]]),
+}
+
+
+@pytest.mark.parametrize('points, expected', FIXTURES.values(), ids=FIXTURES.keys())
+def test_regions_fixtures(points, expected):
+    mask = _mask(30, 40, points)
+    assert sorted(diff_regions(mask, 3)) == expected
+    assert _regions_by_python(mask, 3) == expected
+
+
+def test_regions_merge_across_row_runs():
+    """Две вертикали расходятся в разные отрезки строк и сходятся только в нижней строке"""
+
+    mask = np.zeros((30, 40), dtype=bool)
+    mask[2:20, 3] = mask[2:20, 35] = True
+    assert sorted(diff_regions(mask, 3)) == [[0, -1, 6, 22], [32, -1, 38, 22]]
+    mask[19, 3:36] = True
+    assert diff_regions(mask, 3) == [[0, -1, 38, 22]]
+
+
+def test_regions_merge_later_run_into_earlier():
+    """Отрезок строки связывает несколько компонент, начатых в предыдущих строках (буква W)"""
+
+    mask = np.zeros((20, 60), dtype=bool)
+    for x in (2, 20, 38, 56):
+        mask[0:10, x] = True
+    mask[10, 2:21] = mask[12, 20:39] = mask[11, 38:57] = True
+    assert diff_regions(mask, 2) == [[0, -2, 58, 14]]
+
+
+@pytest.mark.parametrize('border', [1, 2, 4, 10])
+@pytest.mark.parametrize('seed', range(4))
+def test_regions_match_pairwise(seed, border):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((31, 47)) > 0.985
+    # отличия у самых границ изображения
+    mask[0, rng.integers(47)] = mask[-1, rng.integers(47)] = mask[rng.integers(31), 0] = True
+    assert sorted(diff_regions(mask, border)) == _regions_by_pairs(mask, border)
@@ -0,0 +1,61 @@
+"""Заливка вырезаемых областей одним проходом numpy (FILL_BY_SCRIPT)"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.ui.layout.main import LayoutCompare, fill_transparent
+
+RECTS = [[2, 3, 5, 4], [-3, -2, 6, 5], [15, 10, 10, 10], [-10, 4, 5, 3], [4, 4, 0, 3], [1, 12, 7.9, 2.5]]
+
+
+def _paste(image: Image.Image, fill_rect) -> Image.Image:
+    """Заливка, как в _capture_element без FILL_BY_SCRIPT"""
+
+    for x, y, width, height in fill_rect:
+        image.paste(Image.new('RGBA', (int(width), int(height)), (255, 255, 255, 0)), (x, y))
+    return image
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L'])
+def test_fill_matches_paste(mode):
+    pixels = np.random.default_rng(3).integers(0, 256, (14, 18, 4), dtype=np.uint8)
+    image = Image.fromarray(pixels, 'RGBA').convert(mode)
+    expected = _paste(image.copy(), RECTS)
+    actual = fill_transparent(image, RECTS)
+    assert actual.mode == expected.mode
+    np.testing.assert_array_equal(np.asarray(actual), np.asarray(expected))
+
+
+class FakeElement:
+    """Элемент с прямоугольником getBoundingClientRect, location и size считаются как в selenium"""
+
+    def __init__(self, rect):
+        self.bounding_rect = rect
+
+    def webelement(self):
+        return self
+
+    @property
+    def coordinates(self):
+        return {'x': round(self.bounding_rect[0] + 0.5), 'y': round(self.bounding_rect[1] + 10.25)}
+
+    @property
+    def size(self):
+        return {'width': self.bounding_rect[2], 'height': self.bounding_rect[3]}
+
+
+class FakeDriver:
+    """Прокрутка окна (0.5, 10.25)"""
+
+    @staticmethod
+    def execute_script(script, elements):
+        return [[element.bounding_rect for element in elements], 0.5, 10.25, 1]
+
+
+def test_fill_area_by_script_matches_webdriver_calls():
+    layout = LayoutCompare(FakeDriver())
+    element = FakeElement([10.4, 20.5, 300, 200])
+    fill_elements = [FakeElement([12.5, 30.7, 50.6, 20.2]), FakeElement([9.6, 19.9, 10.5, 10.99])]
+    expected = layout.get_fill_area_by_elements(element.coordinates, fill_elements)
+    actual = layout.get_fill_area_by_script(element, fill_elements)
+    assert [[x, y, int(width), int(height)] for x, y, width, height in expected] == actual
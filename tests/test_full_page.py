@@ -0,0 +1,68 @@
+"""Сравнение всей страницы по полосам дает тот же результат, что сравнение склеенной страницы"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from uatf.ui.layout.comparators import get_comparator
+from uatf.ui.layout.main import LayoutCompare
+from uatf.ui.layout.pixel_diff import TILE_SIZE
+from uatf.ui.layout.sidecar import ReferenceFeatures
+
+
+def _page(offset: int = 0) -> np.ndarray:
+    image = Image.new('RGBA', (384, 800), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for index in range(6):
+        top = 100 + index * 430 + offset
+        draw.ellipse((40, top, 340, top + 180), fill=(40 + index * 30, 90, 200, 255))
+    for seam in range(TILE_SIZE, 200, TILE_SIZE):
+        # сглаженные линии через границы полос: сглаживание и окно SSIM смотрят на соседнюю полосу
+        for left in range(20, 360, 44):
+            draw.line((left, seam * 4 - 12 + offset, left + 30, seam * 4 + 12 + offset), fill=(20, 20, 20, 255),
+                      width=3)
+    return np.asarray(image.resize((96, 200), Image.LANCZOS))
+
+
+def _slices(page: np.ndarray):
+    return [(top, Image.fromarray(page[top:top + TILE_SIZE], 'RGBA')) for top in range(0, len(page), TILE_SIZE)]
+
+
+@pytest.mark.parametrize('sidecar', [False, True])
+@pytest.mark.parametrize('budget', [{}, {'max_diff_pixels': 30}, {'fail_fast': 7}, {'highlight': True}])
+@pytest.mark.parametrize('comparator', ['ciede2000', 'pixelmatch', 'ssim'])
+def test_slices_match_whole_page(tmp_path, regression_options, comparator, budget, sidecar):
+    budget = dict(budget)
+    regression_options(ANTIALIASING=True, HIGHLIGHT_DIFF=budget.pop('highlight', False))
+    standard, current = _page(), _page(1)
+    src = str(tmp_path / 'standard.png')
+    Image.fromarray(standard, 'RGBA').save(src)
+    engine = get_comparator(comparator)
+    layout = LayoutCompare(None)
+    tolerance = layout._get_tolerance(None, comparator)
+
+    expected = layout._compare_image(str(tmp_path / 'whole.png'), Image.fromarray(standard, 'RGBA'),
+                                     Image.fromarray(current, 'RGBA'), tolerance, comparator=comparator, **budget)
+    description = layout._diff_description
+
+    layout._page_slices = lambda: (current.shape[1], current.shape[0], iter(_slices(current)))
+    features = None
+    if sidecar:
+        features = ReferenceFeatures.from_array(standard)
+        # как в load_features: Lab только для движков, которые его используют
+        features.lab = features.lab if engine.uses_lab else None
+    page, is_equal = layout._capture_full_page('page', src, features, tolerance, comparator=engine,
+                                               diff_name=str(tmp_path / 'slices.png'), **budget)
+    assert (is_equal, layout._diff_description) == (expected, description)
+    assert not expected
+    np.testing.assert_array_equal(np.asarray(page), current)
+    np.testing.assert_array_equal(np.asarray(Image.open(tmp_path / 'slices.png')),
+                                  np.asarray(Image.open(tmp_path / 'whole.png')))
+
+
+def test_same_page_is_not_compared(tmp_path):
+    standard = _page()
+    src = str(tmp_path / 'standard.png')
+    Image.fromarray(standard, 'RGBA').save(src)
+    layout = LayoutCompare(None)
+    layout._page_slices = lambda: (standard.shape[1], standard.shape[0], iter(_slices(standard.copy())))
+    assert layout._capture_full_page('page', src, tolerance=2.3) == (None, True)
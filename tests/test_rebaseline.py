@@ -0,0 +1,130 @@
+"""Перенос текущих снимков в эталоны layout_rebaseline"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.config import Config
+from uatf.report.db.db_model_layout import ResultBDLayout
+from uatf.ui.layout import rebaseline
+from uatf.ui.layout.rebaseline import MISSING, UNCHANGED, UPDATED, has_layout_results, promote, select_checks
+from uatf.ui.layout.reference_store import ReferenceStore
+from uatf.ui.layout.sidecar import load_features, write_sidecar
+
+
+def _image(seed) -> Image.Image:
+    pixels = np.random.default_rng(seed).integers(0, 256, (9, 12, 4), dtype=np.uint8)
+    return Image.fromarray(pixels, 'RGBA')
+
+
+@pytest.fixture
+def dirs(tmp_path, regression_options, monkeypatch):
+    """(папка отчета, папка эталонов), тесты идут из папки запуска tmp_path"""
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(Config().options['GENERAL'], 'ARTIFACT_PATH', str(tmp_path / 'artifact'))
+    regression_options(IMAGE_DIR=str(tmp_path / 'capture'), REFERENCE_STORE='')
+    monkeypatch.setattr(ReferenceStore, 'instance', None)
+    return tmp_path / 'artifact' / 'regression', tmp_path / 'capture'
+
+
+def _cur(report_dir, name):
+    return str(report_dir / name.replace('.png', '~cur.png'))
+
+
+ROWS = [
+    ('RegressionMenu', 'test_01_open', 'menu/test_01_open/list.png'),
+    ('RegressionMenu', 'test_02_close', 'menu/test_02_close/list.png'),
+    ('RegressionMenuHeader', 'test_01_open', 'header/test_01_open/title.png'),
+    ('RegressionCard', 'test_01_open', 'card/test_01_open/title.png'),
+]
+
+
+@pytest.mark.parametrize('suites, tests, paths, expected', [
+    (None, None, None, [0, 1, 2, 3]),
+    (['RegressionMenu'], None, None, [0, 1]),
+    (['RegressionMenu*'], None, None, [0, 1, 2]),
+    (['RegressionMenu*'], ['test_01*'], None, [0, 2]),
+    (['RegressionCard', 'RegressionMenuHeader'], None, None, [2, 3]),
+    (None, None, ['*/title.png'], [2, 3]),
+    (None, ['test_01*'], ['menu/*'], [0]),
+    (['Nothing*'], None, None, []),
+])
+def test_select_checks(dirs, suites, tests, paths, expected):
+    report_dir, image_dir = dirs
+    rows = [(suite, test, _cur(report_dir, name)) for suite, test, name in ROWS]
+    checks = select_checks(rows, suites, tests, paths)
+    assert checks == [(_cur(report_dir, ROWS[index][2]), str(image_dir / ROWS[index][2])) for index in expected]
+
+
+def test_select_checks_skips_rows_without_image(dirs):
+    report_dir, image_dir = dirs
+    cur_path = _cur(report_dir, 'menu/list.png')
+    rows = [('RegressionMenu', 'test_01_open', None), ('RegressionMenu', 'test_02_close', ''),
+            ('RegressionMenu', 'test_03_open', cur_path), ('RegressionMenu', 'test_03_open', cur_path)]
+    assert select_checks(rows) == [(cur_path, str(image_dir / 'menu' / 'list.png'))]
+
+
+def test_rows_from_report(dirs):
+    report_dir, _ = dirs
+    assert not has_layout_results()
+    assert not os.path.exists(rebaseline.RESULT_DB)
+    os.makedirs('artifact', exist_ok=True)
+    db = ResultBDLayout()
+    db.setup()
+    db.save_test_result('test_menu.py', 'RegressionMenu', 'test_01_open', 'failed', '', '', 0, '', '', '',
+                        _cur(report_dir, 'menu/list.png'), '')
+    assert has_layout_results()
+    assert db.get_current_images() == [('RegressionMenu', 'test_01_open', _cur(report_dir, 'menu/list.png'))]
+    db.conn.close()
+
+
+def _write(path, image, **params):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path, **params)
+
+
+def test_promote_skips_same_pixels(dirs):
+    """Те же пиксели в png с другим сжатием не перезаписывают эталон"""
+
+    report_dir, image_dir = dirs
+    cur_path, src = _cur(report_dir, 'menu/list.png'), str(image_dir / 'menu' / 'list.png')
+    _write(cur_path, _image(1), compress_level=0)
+    _write(src, _image(1), compress_level=9)
+    data, stat = Path(src).read_bytes(), os.stat(src)
+    assert promote(cur_path, src) == (UNCHANGED, src)
+    assert Path(src).read_bytes() == data
+    assert os.stat(src).st_mtime_ns == stat.st_mtime_ns
+
+
+def test_promote_updates_changed_pixels(dirs):
+    report_dir, image_dir = dirs
+    cur_path, src = _cur(report_dir, 'menu/list.png'), str(image_dir / 'menu' / 'list.png')
+    _write(cur_path, _image(2))
+    _write(src, _image(1))
+    write_sidecar(src, _image(1))
+    assert promote(cur_path, src) == (UPDATED, src)
+    assert Path(src).read_bytes() == Path(cur_path).read_bytes()
+    # прежний sidecar пересчитан для нового эталона
+    features = load_features(src)
+    np.testing.assert_array_equal(features.palette[features.index], np.asarray(_image(2)))
+
+
+def test_promote_new_reference_and_missing_image(dirs):
+    report_dir, image_dir = dirs
+    cur_path, src = _cur(report_dir, 'menu/list.png'), str(image_dir / 'menu' / 'list.png')
+    assert promote(cur_path, src) == (MISSING, cur_path)
+    _write(cur_path, _image(3))
+    assert promote(cur_path, src) == (UPDATED, src)
+    assert not os.path.exists(f'{src}.sidecar')
+    assert promote(cur_path, src) == (UNCHANGED, src)
+
+
+def test_main_needs_report(dirs, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['layout_rebaseline'])
+    with pytest.raises(SystemExit):
+        rebaseline.main()
+    assert not os.path.exists(rebaseline.RESULT_DB)
@@ -0,0 +1,141 @@
+"""Хранилище эталонов ReferenceStore и команда layout_reference_store pack"""
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.ui.layout import reference_store
+from uatf.ui.layout.reference_cache import ReferenceCache
+from uatf.ui.layout.reference_store import ReferenceStore, link_file
+
+
+def _png(seed, size=(12, 9)) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 4), dtype=np.uint8)
+    data = io.BytesIO()
+    Image.fromarray(pixels, 'RGBA').save(data, format='PNG')
+    return data.getvalue()
+
+
+@pytest.fixture
+def image_dir(tmp_path, regression_options, monkeypatch):
+    """Папка эталонов и хранилище во временной папке, хранилище создается заново"""
+
+    regression_options(IMAGE_DIR=str(tmp_path / 'capture'), REFERENCE_STORE=str(tmp_path / 'store'))
+    monkeypatch.setattr(ReferenceStore, 'instance', None)
+    yield tmp_path / 'capture'
+    store = ReferenceStore.instance
+    if store is not None and store._conn is not None:
+        store._conn.close()
+        for file, mapped in store._maps.values():
+            mapped.close()
+            file.close()
+
+
+def test_put_read_round_trip(image_dir):
+    store = ReferenceStore()
+    path = str(image_dir / 'suite' / 'test' / 'check.png')
+    data = _png(1)
+    digest = store.put(path, data)
+    assert store.digest(path) == digest
+    assert store.paths() == ['suite/test/check.png']
+    assert store.read(digest) == data
+    assert store.read_image(digest).tobytes() == Image.open(io.BytesIO(data)).tobytes()
+
+
+def test_same_content_stored_once(image_dir, tmp_path):
+    store = ReferenceStore()
+    data = _png(2)
+    first = store.put(str(image_dir / 'a.png'), data)
+    second = store.put(str(image_dir / 'b.png'), data)
+    assert first == second
+    assert store.paths() == ['a.png', 'b.png']
+    assert os.path.getsize(tmp_path / 'store' / 'pack-0000.pack') == len(data)
+
+
+def test_put_replaces_reference(image_dir):
+    store = ReferenceStore()
+    path = str(image_dir / 'check.png')
+    store.put(path, _png(3))
+    digest = store.put(path, _png(4))
+    assert store.digest(path) == digest
+    assert store.read(digest) == _png(4)
+
+
+def test_read_from_several_packs(image_dir, tmp_path, monkeypatch):
+    """Запись, начинающая новый pack файл, и чтение дописанного после mmap"""
+
+    store = ReferenceStore()
+    blobs = [_png(seed) for seed in range(5)]
+    monkeypatch.setattr(reference_store, 'PACK_SIZE', len(blobs[0]) * 2 + 1)
+    digests = []
+    for index, data in enumerate(blobs):
+        digests.append(store.put(str(image_dir / f'{index}.png'), data))
+        # читаем сразу, чтобы mmap пришлось переоткрыть после следующей записи
+        assert store.read(digests[0]) == blobs[0]
+    assert sorted(os.listdir(tmp_path / 'store')) == ['index.db', 'pack-0000.pack', 'pack-0001.pack',
+                                                       'pack-0002.pack']
+    assert [store.read(digest) for digest in digests] == blobs
+
+
+def test_reference_cache_reads_packed_file(image_dir, monkeypatch):
+    monkeypatch.setattr(ReferenceCache, 'instance', None)
+    store = ReferenceStore()
+    path = str(image_dir / 'check.png')
+    data = _png(5)
+    store.put(path, data)
+    assert not os.path.exists(path)
+    assert ReferenceCache().get(path).tobytes() == Image.open(io.BytesIO(data)).tobytes()
+
+
+def test_link_shares_object(image_dir, tmp_path):
+    store = ReferenceStore()
+    data = _png(6)
+    store.put(str(image_dir / 'a.png'), data)
+    store.put(str(image_dir / 'b.png'), data)
+    objects_dir = str(tmp_path / 'objects')
+    store.link(str(image_dir / 'a.png'), str(tmp_path / 'a.png'), objects_dir)
+    store.link(str(image_dir / 'b.png'), str(tmp_path / 'b.png'), objects_dir)
+    assert len(os.listdir(objects_dir)) == 1
+    assert (tmp_path / 'a.png').read_bytes() == (tmp_path / 'b.png').read_bytes() == data
+    assert os.path.samefile(tmp_path / 'a.png', tmp_path / 'b.png')
+
+
+def test_link_falls_back_to_copy(tmp_path, monkeypatch):
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+
+    src, dst = tmp_path / 'src.png', tmp_path / 'dst.png'
+    src.write_bytes(_png(7))
+    dst.write_bytes(b'old')
+    monkeypatch.setattr(os, 'link', cross_device)
+    link_file(str(src), str(dst))
+    assert dst.read_bytes() == src.read_bytes()
+    assert not os.path.samefile(src, dst)
+
+
+def test_pack_command(image_dir, monkeypatch):
+    blobs = {'suite/one/check.png': _png(8), 'suite/two/check.png': _png(8), 'suite/two/other.png': _png(9)}
+    for name, data in blobs.items():
+        (image_dir / name).parent.mkdir(parents=True, exist_ok=True)
+        (image_dir / name).write_bytes(data)
+    (image_dir / 'notes.txt').write_text('не эталон')
+    monkeypatch.setattr(sys, 'argv', ['layout_reference_store', 'pack', '--remove'])
+    reference_store.main()
+
+    store = ReferenceStore()
+    assert store.paths() == sorted(blobs)
+    for name, data in blobs.items():
+        assert store.read(store.digest(str(image_dir / name))) == data
+        assert not (image_dir / name).exists()
+    assert (image_dir / 'notes.txt').exists()
+    assert store._db.execute('SELECT count(*) FROM objects').fetchone()[0] == 2
+
+
+def test_pack_command_needs_store(image_dir, regression_options, monkeypatch):
+    regression_options(REFERENCE_STORE='')
+    monkeypatch.setattr(sys, 'argv', ['layout_reference_store', 'pack'])
+    with pytest.raises(SystemExit):
+        reference_store.main()
@@ -0,0 +1,73 @@
+"""Поиск сдвига содержимого и его пропуск при небольших отличиях"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from uatf.ui.layout import shift
+from uatf.ui.layout.main import LayoutCompare
+from uatf.ui.layout.pixel_diff import image_to_array
+from uatf.ui.layout.shift import estimate_shift
+
+
+def _page(dx=0, dy=0, size=(300, 200)) -> Image.Image:
+    image = Image.new('RGBA', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for index in range(6):
+        top = 15 + index * 30 + dy
+        draw.rectangle([20 + dx, top, 120 + index * 25 + dx, top + 12], fill=(30 * index, 80, 200, 255))
+        draw.text((150 + dx, top), f'строка {index}', fill='black')
+    return image
+
+
+def _differing(current: np.ndarray, standard: np.ndarray) -> int:
+    return int(np.count_nonzero(np.any(current != standard, axis=2)))
+
+
+def _with_spot(image: Image.Image, size: int) -> Image.Image:
+    image = image.copy()
+    ImageDraw.Draw(image).rectangle([200, 100, 200 + size - 1, 100 + size - 1], fill=(255, 0, 0, 255))
+    return image
+
+
+@pytest.mark.parametrize('current', [_page(3, 0), _page(0, -4), _page(2, 5), _page(), _with_spot(_page(), 3),
+                                     _with_spot(_page(), 40), _with_spot(_page(1, 1), 10)],
+                         ids=['dx', 'dy', 'diagonal', 'same', 'small spot', 'large spot', 'shift and spot'])
+def test_known_differing_gives_same_shift(current):
+    current, standard = image_to_array(current), image_to_array(_page())
+    expected = estimate_shift(current, standard, 10)
+    assert estimate_shift(current, standard, 10, _differing(current, standard)) == expected
+
+
+def test_shift_found():
+    current, standard = image_to_array(_page(2, 5)), image_to_array(_page())
+    assert estimate_shift(current, standard, 10, _differing(current, standard)) == (2, 5)
+
+
+def test_small_change_skips_estimation(monkeypatch):
+    def estimate_axes(*args):
+        raise AssertionError('сдвиг не должен искаться')
+
+    monkeypatch.setattr(shift, '_estimate_axes', estimate_axes)
+    current, standard = image_to_array(_with_spot(_page(), 14)), image_to_array(_page())
+    assert _differing(current, standard) == 14 * 14 <= min(current.shape[:2])
+    assert estimate_shift(current, standard, 10, _differing(current, standard)) == (0, 0)
+
+
+@pytest.mark.parametrize('pyramid', [False, True])
+def test_compare_counts_differing_in_changed_tiles(regression_options, monkeypatch, tmp_path, pyramid):
+    regression_options(SHIFT_DETECTION=True, MAX_SHIFT=10, PYRAMID_DIFF=pyramid)
+    calls = []
+
+    def estimate(current, standard, max_shift, differing=None):
+        calls.append(differing)
+        return estimate_shift(current, standard, max_shift, differing)
+
+    monkeypatch.setattr('uatf.ui.layout.main.estimate_shift', estimate)
+    layout = LayoutCompare(None)
+    diff_name = str(tmp_path / 'diff.png')
+    standard = _page()
+    for current in (_with_spot(standard, 14), _with_spot(standard, 40)):
+        assert not layout._compare_by_pixel_numpy(current, standard, diff_name, 2.3)
+        assert calls[-1] == _differing(image_to_array(current), image_to_array(standard))
+    assert not layout._compare_by_pixel_numpy(_page(2, 5), standard, diff_name, 2.3)
+    assert 'сдвинуто на 2 px по горизонтали и 5 px по вертикали' in layout._diff_description
@@ -0,0 +1,111 @@
+"""Sidecar эталона: запись, чтение и отказ от устаревшего"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from uatf.ui.layout import sidecar
+from uatf.ui.layout.main import LayoutCompare
+from uatf.ui.layout.pixel_diff import image_to_array
+from uatf.ui.layout.reference_store import ReferenceStore
+from uatf.ui.layout.sidecar import ReferenceFeatures, load_features, write_sidecar
+
+
+def _image(seed, size=(40, 30)) -> Image.Image:
+    pixels = np.random.default_rng(seed).integers(0, 4, (size[1], size[0], 4), dtype=np.uint8) * 60
+    return Image.fromarray(pixels, 'RGBA')
+
+
+def _assert_features_of(features: ReferenceFeatures, image: Image.Image):
+    expected = ReferenceFeatures.from_array(image_to_array(image))
+    np.testing.assert_array_equal(features.palette[features.index], image_to_array(image))
+    np.testing.assert_array_equal(features.tiles, expected.tiles)
+    np.testing.assert_array_equal(features.lab, expected.lab)
+    np.testing.assert_array_equal(features.luma, expected.luma)
+
+
+@pytest.fixture
+def reference(tmp_path):
+    path = tmp_path / 'check.png'
+    image = _image(1)
+    image.save(path)
+    write_sidecar(str(path), image)
+    return path
+
+
+def test_round_trip(reference):
+    features = load_features(str(reference))
+    _assert_features_of(features, _image(1))
+    assert load_features(str(reference), lab=False).lab is None
+
+
+def test_reference_rewritten_after_sidecar(reference):
+    """Эталон перезаписан другим изображением, sidecar остался от прежнего"""
+
+    stat = os.stat(reference)
+    _image(2, (41, 30)).save(reference)
+    os.utime(reference, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert load_features(str(reference)) is None
+
+
+def test_reference_touched_with_same_size(reference):
+    """Размер png не изменился, но изменилось время записи"""
+
+    stat = os.stat(reference)
+    os.utime(reference, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert os.path.getsize(reference) == stat.st_size
+    assert load_features(str(reference)) is None
+
+
+def test_other_version_ignored(reference, monkeypatch):
+    monkeypatch.setattr(sidecar, 'SIDECAR_VERSION', sidecar.SIDECAR_VERSION + 1)
+    assert load_features(str(reference)) is None
+
+
+def test_truncated_sidecar_ignored(reference):
+    path = f'{reference}.sidecar'
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) // 2)
+    assert load_features(str(reference)) is None
+
+
+def test_missing_sidecar(tmp_path):
+    path = tmp_path / 'check.png'
+    _image(1).save(path)
+    assert load_features(str(path)) is None
+
+
+def test_store_sidecar_follows_content(tmp_path, regression_options, monkeypatch):
+    """Sidecar эталона из хранилища привязан к хэшу содержимого, новый эталон не видит старый sidecar"""
+
+    regression_options(IMAGE_DIR=str(tmp_path / 'capture'), REFERENCE_STORE=str(tmp_path / 'store'))
+    monkeypatch.setattr(ReferenceStore, 'instance', None)
+    store = ReferenceStore()
+    src = str(tmp_path / 'capture' / 'check.png')
+    try:
+        store.put_image(src, _image(1))
+        write_sidecar(src, _image(1))
+        _assert_features_of(load_features(src), _image(1))
+        store.put_image(src, _image(2))
+        assert load_features(src) is None
+    finally:
+        store._conn.close()
+
+
+def test_stale_sidecar_not_used_in_compare(reference, regression_options):
+    """Хэши плиток прежнего эталона совпали бы с текущим изображением, похожим на прежний эталон"""
+
+    regression_options(REFERENCE_SIDECARS=True)
+    stat = os.stat(reference)
+    _image(2).save(reference)
+    os.utime(reference, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    diff_name = f'{reference}~diff.png'
+    layout = LayoutCompare(None)
+    with Image.open(reference) as standard:
+        stale = ReferenceFeatures.load(f'{reference}.sidecar')
+        assert layout._compare_image(diff_name, standard, _image(1), 2.3, features=stale, comparator='ciede2000')
+        features = layout._load_features(str(reference), 'ciede2000')
+        assert features is None
+        assert not layout._compare_image(diff_name, standard, _image(1), 2.3, features=features,
+                                         comparator='ciede2000')
@@ -87,12 +87,56 @@ DEFAULT_VALUES = {
                                                                               "для запуска алгоритма "
                                                                               "определение сглаживания"),
         Option('CAPTURE_DELAY', 0, action='store', type=float, help='задержка перед созданием скриншота'),
+        Option('STABLE_FRAMES', 0, action='store', type=int,
+               help='Снимать, когда столько снимков подряд совпадают, вместо фиксированной CAPTURE_DELAY, '
+                    '0 - снимать сразу'),
+        Option('STABLE_TIMEOUT', 5, action='store', type=float,
+               help='Максимальное время ожидания стабильного изображения для STABLE_FRAMES в сек.'),
+        Option('FREEZE_ANIMATIONS', False, action='store', type=type_bool,
+               help='Останавливать анимации, transition и каретку на время снимка'),
         Option('GENERATE_IMAGE', False, action='store', type=type_bool, help='Генерировать новые эталоны'),
         Option('REGRESSION_THEME', "", action='store', type=str, help='имя темы (пример: "dark_default" для скриншота: '
                                                                       '"chrome_dark_default_1920_1080.png")'),
         Option('GENERATE_HTML_REPORT', False, action='store', type=type_bool,
                help='Генерировать ли html отчет по тестам верстки'),
         Option('COLOR_SPACE', 'lab', action='store', type=str, help='Цветовое пространство в котором сравниваем цвета'),
+        Option('COMPARE_ENGINE', 'numpy', action='store', type=str,
+               help='Движок попиксельного сравнения: numpy (векторизованный) или python (эталонный попиксельный)'),
+        Option('COMPARATOR', '', action='store', type=str,
+               help='Движок сравнения: python, pixelmatch (YIQ), ciede2000 (Lab), ssim; '
+                    'пусто - по COMPARE_ENGINE и COLOR_SPACE'),
+        Option('YIQ_TOLERANCE', 0, action='store', type=float,
+               help='Допуск движков pixelmatch и python при COLOR_SPACE = yiq в шкале разницы YIQ, '
+                    '0 - порог pixelmatch 8.1'),
+        Option('SSIM_TOLERANCE', 0, action='store', type=float,
+               help='Допуск движка ssim (1 - SSIM, от 0 до 1), 0 - 0.05'),
+        Option('DIFF_AREA_BORDER', 0, action='store', type=int,
+               help='Радиус объединения отличий в области для HIGHLIGHT_DIFF, '
+                    '0 - 1/100 большей стороны изображения, но не меньше 10'),
+        Option('SHIFT_DETECTION', False, action='store', type=type_bool,
+               help='Искать сдвиг содержимого относительно эталона и сравнивать совмещённые изображения'),
+        Option('MAX_SHIFT', 100, action='store', type=int, help='Максимальный искомый сдвиг содержимого в px'),
+        Option('PYRAMID_DIFF', False, action='store', type=type_bool,
+               help='Искать изменившиеся участки по пирамиде отличий (блоки 8 и 64 px) вместо хэшей плиток'),
+        Option('REFERENCE_CACHE_SIZE', 256, action='store', type=int,
+               help='Объем кэша декодированных эталонов в МБ, 0 - не кэшировать'),
+        Option('SHARED_CACHE_SIZE', 0, action='store', type=int,
+               help='Объем общего для потоков run_tests кэша эталонов в разделяемой памяти в МБ, 0 - выключен'),
+        Option('COMPARE_PROCESSES', 0, action='store', type=int,
+               help='Число процессов для фонового сравнения скриншотов, 0 - сравнивать сразу в тесте'),
+        Option('FILL_BY_SCRIPT', False, action='store', type=type_bool,
+               help='Прямоугольники fill_element получать одним вызовом скрипта, а не запросами location и size '
+                    'для каждого элемента, и заливать все области одним проходом numpy'),
+        Option('CLIP_SCREENSHOT', True, action='store', type=type_bool,
+               help='Снимать области окна через CDP Page.captureScreenshot с clip, а не обрезкой скриншота окна'),
+        Option('REFERENCE_STORE', '', action='store', type=str,
+               help='Папка хранилища эталонов с дедупликацией по содержимому (pack файлы), '
+                    'пусто - эталоны только файлами в IMAGE_DIR'),
+        Option('COMPARE_MEMO_SIZE', 0, action='store', type=int,
+               help='Объем кэша результатов сравнения в МБ (artifact/compare_memo.db), 0 - не кэшировать'),
+        Option('REFERENCE_SIDECARS', False, action='store', type=type_bool,
+               help='Писать при GENERATE_IMAGE и использовать при сравнении sidecar эталонов '
+                    '(Lab, яркость и хэши плиток)'),
 
     ],
     'CUSTOM': [
@@ -1,13 +1,14 @@
-from typing import Optional, List
+from typing import Optional, List, Union
 
 import pytest
 
 from ...helper import delay
 try:
     from ...ui import Element
-    from ...ui.layout.main import LayoutCompare
+    from ...ui.layout.main import LayoutCompare, Variant
+    from ...ui.layout.compare_pool import ComparePool
 except ModuleNotFoundError:
-    Element = LayoutCompare = None
+    Element = LayoutCompare = ComparePool = Variant = None
 
 from ...config import Config
 
@@ -32,6 +33,11 @@ class Layout:
             raise ValueError('Пока не поддерживаем тесты без классов')
         self._config = Config()
         self._capture_index = 0
+        # сравнения в пуле процессов: (имя, PendingCompare)
+        self._pending = []
+        self._async_compare = bool(ComparePool().processes) and not self._config.get('GENERATE_IMAGE', 'REGRESSION')
+        # внутри capture_many ожидания перед снимком уже выполнены
+        self._in_batch = False
 
     def _check_uniq_name(self, name):
         """Проверка на уникальность имени сабтеста внутри теста"""
@@ -62,12 +68,16 @@ class Layout:
         :param fill_rect: вырезаемые прямоугольники, формат: [ [x0,y0,width,height], ...], x0 и y0 берутся относительно
                           координат родительского элемента
         :param fill_element: вырезаемые элементы, формат: [ element1, element2, ...]
-        :param tolerance: максимально допустимая разница между цветами
+        :param tolerance: максимально допустимая разница между цветами, шкала зависит от движка сравнения:
+                          ciede2000 - разница CIEDE2000 (TOLERANCE), pixelmatch - разница в YIQ
+                          (YIQ_TOLERANCE), python - как у движка COLOR_SPACE, ssim - 1 - SSIM (SSIM_TOLERANCE)
         """
         if fill_rect is None:
             fill_rect = []
 
-        if fill_element:
+        if fill_element and self._config.get('FILL_BY_SCRIPT', 'REGRESSION'):
+            fill_rect.extend(self._layout_testing.get_fill_area_by_script(element, fill_element))
+        elif fill_element:
             coordinates = element.coordinates
             fill_rect2 = self._layout_testing.get_fill_area_by_elements(coordinates, fill_element)
             fill_rect.extend(fill_rect2)
@@ -80,7 +90,15 @@ class Layout:
             fill: bool = False,
             fill_rect: Optional[List[List[int]]] = None,
             wait_react_load: bool = False,
-            tolerance: Optional[float] = None):
+            tolerance: Optional[float] = None,
+            fail_fast: int = 0,
+            max_diff_pixels: int = 0,
+            max_diff_ratio: float = 0,
+            comparator: Optional[str] = None,
+            mask: Optional[List[Union[str, Element]]] = None,
+            mask_blank: bool = False,
+            variants: Optional[List[Union[dict, Variant]]] = None,
+            full_page: bool = False):
         """Сохраняет изображение для утилиты сравнения
 
         :param name - Имя скриншота
@@ -94,32 +112,127 @@ class Layout:
         :param fill - Закрашивать области или обрезать
         :param fill_rect - закрашиваемые области, формат [ [x0,y0,width,height], ...]
         :param wait_react_load - Проверка асинхронной загрузки всех подмодулей для react
-        :param tolerance: максимально допустимая разница между цветами
+        :param tolerance: максимально допустимая разница между цветами, шкала зависит от движка сравнения:
+                          ciede2000 - разница CIEDE2000 (TOLERANCE), pixelmatch - разница в YIQ
+                          (YIQ_TOLERANCE), python - как у движка COLOR_SPACE, ssim - 1 - SSIM (SSIM_TOLERANCE)
+        :param fail_fast: остановить сравнение после стольких отличающихся пикселей сверх допуска
+        :param max_diff_pixels: допустимое число отличающихся пикселей
+        :param max_diff_ratio: допустимая доля отличающихся пикселей от площади изображения
+        :param comparator: движок сравнения: python, pixelmatch, ciede2000, ssim, по умолчанию COMPARATOR
+        :param mask: css селекторы и элементы, которые скрываются на странице на время снимка
+        :param mask_blank: закрасить элементы из mask черным, а не скрыть
+        :param variants: варианты снимка в текущей сессии, каждый сравнивается со своим эталоном в своем сабтесте
+                         name[вариант], например [{'resolution': '1280x800'}, {'color_scheme': 'dark'},
+                         {'device': 'iPhone X'}], поля как у Variant
+        :param full_page: снимок всей страницы, а не окна; полосы сравниваются с эталоном по мере снимка
         """
 
         if not name:
             name = str(self._capture_index)
             self._capture_index += 1
 
-        if not self._subtests._is_need_run(name, True):
-            return
+        if mask and self._in_batch:
+            raise ValueError('В capture_many mask задается для всего кадра, а не для отдельной проверки')
+        if variants and self._in_batch:
+            raise ValueError('В capture_many кадр снимается один раз, варианты не поддерживаются')
+        if full_page and self._in_batch:
+            raise ValueError('В capture_many проверки вырезаются из снимка окна, full_page не поддерживается')
+
+        compare_kwargs = dict(suite=self._class_name, test=self._test_name, check_name=name,
+                              width=width, height=height, left=left, top=top, element=element,
+                              bottom=bottom, right=right, fill=fill, fill_rect=fill_rect,
+                              tolerance=tolerance, fail_fast=fail_fast,
+                              max_diff_pixels=max_diff_pixels, max_diff_ratio=max_diff_ratio,
+                              comparator=comparator, full_page=full_page)
 
-        self._check_uniq_name(name)
+        variants = [Variant(**variant) if isinstance(variant, dict) else variant for variant in variants or []]
+        for variant in variants or [None]:
+            subtest_name = f'{name}[{variant.label}]' if variant else name
+            if not self._subtests._is_need_run(subtest_name, True):
+                continue
+            self._check_uniq_name(subtest_name)
+            self._capture_check(subtest_name, variant, compare_kwargs, element, wait_react_load, mask, mask_blank)
+        if not self._in_batch:
+            self.wait_comparisons()
+
+    def _capture_check(self, name: str, variant: Optional[Variant], compare_kwargs: dict,
+                       element: Optional[Element], wait_react_load: bool,
+                       mask: Optional[List[Union[str, Element]]], mask_blank: bool):
+        """Снимок и сравнение одной проверки в сабтесте name"""
+
+        if self._async_compare:
+            # снимок делаем сразу, а сравнение уходит в пул, результат попадет в сабтест в конце capture
+            # или capture_many, пока идет тело теста
+            try:
+                with self._layout_testing.emulate(variant):
+                    self._prepare_capture(element, wait_react_load)
+                    with self._layout_testing.mask(mask, mask_blank):
+                        self._pending.append((name, self._layout_testing.compare_async(**compare_kwargs)))
+            except Exception as error:
+                with self._subtests._test(name, layout=True):
+                    raise error
+            return
 
         with self._subtests._test(name, layout=True):
+            with self._layout_testing.emulate(variant):
+                self._prepare_capture(element, wait_react_load)
+                with self._layout_testing.mask(mask, mask_blank):
+                    self._layout_testing.compare(**compare_kwargs)
+
+    def _prepare_capture(self, element: Optional[Element], wait_react_load: bool):
+        """Ожидания перед снятием скриншота"""
+
+        if self._in_batch:
+            return
 
-            # в react компонент с ассинхронной загрузкой добавляется в дом дерево не дожидаясь загрузки всех модулей
-            if element and wait_react_load:
-                element.check_react_async_load()
+        # в react компонент с ассинхронной загрузкой добавляется в дом дерево не дожидаясь загрузки всех модулей
+        if element and wait_react_load:
+            element.check_react_async_load()
 
-            capture_delay = int(self._config.get('CAPTURE_DELAY', 'REGRESSION'))
-            if capture_delay:
-                delay(capture_delay, 'Задержка перед снятием скриншота')
+        capture_delay = int(self._config.get('CAPTURE_DELAY', 'REGRESSION'))
+        if capture_delay:
+            delay(capture_delay, 'Задержка перед снятием скриншота')
+
+    def capture_many(self, checks: List[dict], mask: Optional[List[Union[str, Element]]] = None,
+                     mask_blank: bool = False):
+        """Несколько проверок по одному скриншоту окна
+
+        Прямоугольники элементов получаем одним вызовом скрипта, окно снимаем один раз,
+        каждая проверка вырезается из общего кадра и попадает в свой сабтест
+
+        :param checks: параметры capture для каждой проверки,
+                       например [{'name': 'header', 'element': header}, {'name': 'menu', 'element': menu, 'top': 5}]
+        :param mask: css селекторы и элементы, которые скрываются на странице на время снимка
+        :param mask_blank: закрасить элементы из mask черным, а не скрыть
+        """
+
+        checks = [dict(check) for check in checks]
+        for check in checks:
+            if check.get('element') and check.pop('wait_react_load', False):
+                check['element'].check_react_async_load()
+        self._prepare_capture(None, False)
+
+        elements = [check['element'] for check in checks if check.get('element')]
+        with self._layout_testing.mask(mask, mask_blank), self._layout_testing.frame(elements):
+            self._in_batch = True
+            try:
+                for check in checks:
+                    self.capture(**check)
+            finally:
+                self._in_batch = False
+        self.wait_comparisons()
+
+    def wait_comparisons(self):
+        """Дожидается фоновых сравнений и записывает их результаты в сабтесты
+
+        Вызывается в конце capture и capture_many, чтобы отличия попали в фазу call с кадром теста
+        в трейсбэке, и в teardown фикстуры для сравнений, прерванных исключением
+        """
 
-            self._layout_testing.compare(suite=self._class_name, test=self._test_name, check_name=name,
-                                         width=width, height=height, left=left, top=top, element=element,
-                                         bottom=bottom, right=right, fill=fill, fill_rect=fill_rect,
-                                         tolerance=tolerance)
+        pending, self._pending = self._pending, []
+        for name, comparison in pending:
+            with self._subtests._test(name, layout=True):
+                comparison.result()
 
     def capture_with_offset(
             self, name: Optional[str] = None, element: Optional[Element] = None,
@@ -140,7 +253,9 @@ class Layout:
         :param left - Отступ слева (Приоритет над value_x)
         :param right - Отступ справа (Приоритет над value_x)
         :param wait_react_load - Проверка асинхронной загрузки всех подмодулей для react
-        :param tolerance: максимально допустимая разница между цветами
+        :param tolerance: максимально допустимая разница между цветами, шкала зависит от движка сравнения:
+                          ciede2000 - разница CIEDE2000 (TOLERANCE), pixelmatch - разница в YIQ
+                          (YIQ_TOLERANCE), python - как у движка COLOR_SPACE, ssim - 1 - SSIM (SSIM_TOLERANCE)
         """
         _left = _top = _bottom = _right = all
         if x is not None:
@@ -163,4 +278,6 @@ class Layout:
 def layout(subtests, request):
     """fixture for layout regression testing"""
 
-    yield Layout(subtests, request)
+    layout_ = Layout(subtests, request)
+    yield layout_
+    layout_.wait_comparisons()
@@ -14,6 +14,7 @@ from ..report.report_layout import ReportLayout
 from ..logfactory import log
 from ..config import Config, DEFAULT_VALUES
 from ..ui.layout.main import RegressionError
+from ..ui.layout.compare_pool import ComparePool
 
 Report = collections.namedtuple('Report', ('file_name', 'suite_name', 'test_name', 'status'))
 REPORT_LIST: List[Report] = []
@@ -130,6 +131,8 @@ def pytest_runtest_makereport(item: pytest.Item, call: CallInfo[None]):
 
 def pytest_sessionfinish(session: Session, exitstatus: Union[int, pytest.ExitCode]):
     from ..cache import CacheResults
+    # не держим процессы пула сравнения до выхода интерпретатора
+    ComparePool().shutdown()
     cache = CacheResults()
     if REPORT_LIST:
         cache.save_test_result(REPORT_LIST)
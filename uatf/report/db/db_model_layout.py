@@ -30,3 +30,9 @@ class ResultBDLayout(DBBase):
                             (file_name, suite_name, test_name, status, start_time,
                              stop_time, std_out, description, logs_file_path, dif_path, cur_path, ref_path))
         self.conn.commit()
+
+    def get_current_images(self) -> list:
+        """Строки (suite_name, test_name, cur_path) всех результатов"""
+
+        self.cursor.execute('SELECT suite_name, test_name, cur_path FROM test_results')
+        return self.cursor.fetchall()
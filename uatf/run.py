@@ -245,21 +245,31 @@ class RunTests:
             from .report.db.db_model_layout import ResultBDLayout
             ResultBDLayout().setup()
 
-        self._generate_list_of_file_for_run()
-        self._basic_run()
-
-        if bool(self.restart_after_build_mode):
-            log('Поиск упавших тестов')
-            exists_failed = self.cache.exists_failed_tests()
-            if exists_failed:
-                log('Упавшие тесты найдены, перезапускаем')
-                self.restart_after_build_mode = False
-                self._start_failed = True
-                self._rerun = True
-                self._generate_list_of_file_for_run()
-                self._basic_run()
-            else:
-                log('Все тесты прошли успешно')
+        shared_cache = None
+        shared_cache_size = int(self.config.get('SHARED_CACHE_SIZE', 'REGRESSION') or 0)
+        if shared_cache_size > 0:
+            from .ui.layout.shared_cache import SharedCacheHost
+            shared_cache = SharedCacheHost(shared_cache_size)
+
+        try:
+            self._generate_list_of_file_for_run()
+            self._basic_run()
+
+            if bool(self.restart_after_build_mode):
+                log('Поиск упавших тестов')
+                exists_failed = self.cache.exists_failed_tests()
+                if exists_failed:
+                    log('Упавшие тесты найдены, перезапускаем')
+                    self.restart_after_build_mode = False
+                    self._start_failed = True
+                    self._rerun = True
+                    self._generate_list_of_file_for_run()
+                    self._basic_run()
+                else:
+                    log('Все тесты прошли успешно')
+        finally:
+            if shared_cache:
+                shared_cache.close()
 
         log('Формируем zip артефакт')
         file_name = shutil.make_archive('artifacts', 'zip', 'artifact')
@@ -14,6 +14,24 @@ from ..logfactory import log
 from urllib import parse
 
 
+def send_cdp_cmd(driver: WebDriver, cmd: str, params: Optional[dict] = None):
+    """Выполнение cdp комманды https://github.com/SeleniumHQ/selenium/issues/8672
+
+    _request не проверяет ответ, ошибку драйвера (не Chrome, неизвестная команда, неверные параметры)
+    поднимаем как WebDriverException через error_handler, как это делает WebDriver.execute
+    """
+
+    if params is None:
+        params = dict()
+
+    resource = f"/session/{driver.session_id}/chromium/send_command_and_get_result"
+    url = driver.command_executor._url + resource
+    body = json.dumps({'cmd': cmd, 'params': params})
+    response = driver.command_executor._request('POST', url, body)
+    driver.error_handler.check_response(response)
+    return response.get('value')
+
+
 class Browser:
     """Класс для работы с браузером"""
 
@@ -352,14 +370,7 @@ class Browser:
     def __send_cdp_cmd(self, cmd, params: Optional[dict] = None):
         """Выполнение cdp комманды https://github.com/SeleniumHQ/selenium/issues/8672"""
 
-        if params is None:
-            params = dict()
-
-        resource = f"/session/{self.driver.session_id}/chromium/send_command_and_get_result"
-        url = self.driver.command_executor._url + resource
-        body = json.dumps({'cmd': cmd, 'params': params})
-        response = self.driver.command_executor._request('POST', url, body)
-        return response.get('value')
+        return send_cdp_cmd(self.driver, cmd, params)
 
     def move_cursor_by_offset(self, x, y):
         """Перемещает курсор на координаты, относительно текущиего положения
@@ -1,4 +1,7 @@
 # http://www.eejournal.ktu.lt/index.php/elt/article/view/10058/5000
+from typing import Optional
+
+import numpy as np
 
 
 def is_aa(img, x1, y1, width, height, img2=None):
@@ -74,3 +77,79 @@ def is_aa(img, x1, y1, width, height, img2=None):
     # (definitely not anti-aliased), this pixel is anti-aliased
     return (not is_aa(img, min_x, min_y, width, height) and not is_aa(img2, min_x, min_y, width, height)) or \
            (not is_aa(img, max_x, max_y, width, height) and not is_aa(img2, max_x, max_y, width, height))
+
+
+# соседние пиксели в порядке обхода is_aa: сначала по x, затем по y
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def luma_plane(image: np.ndarray) -> np.ndarray:
+    """Яркость каждого пикселя RGBA изображения после смешивания с белым фоном, как в is_aa"""
+
+    alpha = image[..., 3] / 255
+    r = 255 + (image[..., 0] - 255.) * alpha
+    g = 255 + (image[..., 1] - 255.) * alpha
+    b = 255 + (image[..., 2] - 255.) * alpha
+    return r * 0.29889531 + g * 0.58662247 + b * 0.11448223
+
+
+def shift_plane(plane: np.ndarray, dx: int, dy: int) -> np.ndarray:
+    """Плоскость, в которой в точке (x, y) лежит значение соседа (x + dx, y + dy), за границей NaN"""
+
+    height, width = plane.shape
+    shifted = np.full(plane.shape, np.nan)
+    shifted[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = \
+        plane[max(dy, 0):height - max(-dy, 0), max(dx, 0):width - max(-dx, 0)]
+    return shifted
+
+
+class AntialiasingDetector:
+    """Определение сглаживания сразу для всех пикселей-кандидатов
+
+    Повторяет логику is_aa(img1, x, y, ..., img2) or is_aa(img2, x, y, ..., img1):
+    яркость считается один раз на изображение, число одинаковых соседей - сдвигами целых плоскостей
+    """
+
+    def __init__(self, image1: np.ndarray, image2: np.ndarray, luma2: Optional[np.ndarray] = None):
+        self._luma1 = luma_plane(image1)
+        self._luma2 = luma_plane(image2) if luma2 is None else luma2
+        # больше 2 одинаковых соседей на обоих изображениях - точно не сглаживание
+        self._many_equal = (self.equal_siblings(self._luma1) > 2) & (self.equal_siblings(self._luma2) > 2)
+
+    @staticmethod
+    def equal_siblings(luma: np.ndarray) -> np.ndarray:
+        """Число соседей с такой же яркостью для каждого пикселя"""
+
+        count = np.zeros(luma.shape, dtype=np.uint8)
+        for dx, dy in NEIGHBOURS:
+            count += shift_plane(luma, dx, dy) == luma
+        return count
+
+    def detect(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Маска пикселей-кандидатов, отличие которых вызвано сглаживанием"""
+
+        return self._detect(self._luma1, xs, ys) | self._detect(self._luma2, xs, ys)
+
+    def _detect(self, luma: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        height, width = luma.shape
+        offsets = np.array(NEIGHBOURS)
+        near_x = xs + offsets[:, 0, None]
+        near_y = ys + offsets[:, 1, None]
+        exists = (near_x >= 0) & (near_x < width) & (near_y >= 0) & (near_y < height)
+        near_x = near_x.clip(0, width - 1)
+        near_y = near_y.clip(0, height - 1)
+
+        # разница яркости между пикселем и каждым из 8 соседей
+        delta = luma[ys, xs] - luma[near_y, near_x]
+        zeroes = np.count_nonzero(exists & (delta == 0), axis=0)
+        negatives = np.count_nonzero(exists & (delta < 0), axis=0)
+        positives = np.count_nonzero(exists & (delta > 0), axis=0)
+
+        # первый самый темный и первый самый яркий сосед в порядке обхода is_aa
+        columns = np.arange(len(xs))
+        darkest = np.argmin(np.where(exists, delta, np.inf), axis=0)
+        brightest = np.argmax(np.where(exists, delta, -np.inf), axis=0)
+        many_equal = self._many_equal[near_y, near_x]
+
+        return (zeroes <= 2) & (negatives > 0) & (positives > 0) & \
+            (many_equal[darkest, columns] | many_equal[brightest, columns])
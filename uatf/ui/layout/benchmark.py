@@ -0,0 +1,227 @@
+"""Бенчмарк сравнения изображений в тестах верстки
+
+Пары скриншотов генерируются без браузера, результаты выводятся в JSON,
+чтобы сравнивать производительность между версиями.
+Запускается из папки с config.ini:
+
+    layout_benchmark --resolutions 800x600 1920x1080 --densities 0 0.05 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from . import main as layout_main
+from .comparators import COMPARATORS, get_comparator
+from .pixel_diff import HIGHLIGHT_COLOR, diff_regions, image_to_array
+
+RESOLUTIONS = ('800x600', '1366x768', '1920x1080', '3840x2160')
+DENSITIES = (0, 0.001, 0.05, 0.5)
+# эталонный python на больших разрешениях слишком медленный, включается явно
+DEFAULT_COMPARATORS = ('pixelmatch', 'ciede2000', 'ssim')
+# compute_diff_area перебирает области для каждого пикселя, на больших отличиях не дождаться
+MAX_AREA_POINTS = 20000
+
+
+def synthetic_screenshot(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """Похожее на скриншот изображение RGBA: фон, карточки и строки "текста" с плавными краями"""
+
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    image[:] = (246, 247, 249, 255)
+    palette = rng.integers(0, 256, (12, 3), dtype=np.uint8)
+    for _ in range(max(width * height // 40000, 4)):
+        card_width, card_height = rng.integers(40, max(width // 3, 41)), rng.integers(20, max(height // 4, 21))
+        left, top = rng.integers(0, width), rng.integers(0, height)
+        image[top:top + card_height, left:left + card_width, :3] = palette[rng.integers(0, len(palette))]
+        # строки текста: короткие тёмные штрихи с переходом через полутона, как при сглаживании шрифтов
+        for line in range(top + 6, top + card_height - 8, 14):
+            strokes = np.flatnonzero(rng.random(card_width) < 0.35) + left
+            strokes = strokes[strokes < width - 1]
+            image[line:line + 8, strokes, :3] = 40
+            image[line:line + 8, strokes + 1, :3] = 140
+    return image
+
+
+def synthetic_pair(width: int, height: int, density: float = 0, antialiasing: bool = False,
+                   size_mismatch: bool = False, seed: int = 0) -> Tuple[Image.Image, Image.Image]:
+    """Пара (текущее, эталон)
+
+    :param density: доля пикселей, которые отличаются, изменения собираются в прямоугольные блоки
+    :param antialiasing: добавить шум сглаживания на краях штрихов
+    :param size_mismatch: текущее изображение меньше эталона
+    """
+
+    rng = np.random.default_rng(seed)
+    standard = synthetic_screenshot(width, height, rng)
+    current = standard.copy()
+
+    changed = np.zeros((height, width), dtype=bool)
+    target = int(density * width * height)
+    while np.count_nonzero(changed) < target:
+        block_width, block_height = rng.integers(4, max(width // 8, 5)), rng.integers(4, max(height // 8, 5))
+        left, top = rng.integers(0, width), rng.integers(0, height)
+        changed[top:top + block_height, left:left + block_width] = True
+    current[changed, :3] = 255 - current[changed, :3]
+
+    if antialiasing:
+        edges = np.zeros((height, width), dtype=bool)
+        edges[:, 1:] = np.any(standard[:, 1:, :3] != standard[:, :-1, :3], axis=2)
+        noise = edges & (rng.random((height, width)) < 0.3) & ~changed
+        current[noise, :3] = np.clip(current[noise, :3].astype(np.int16) + rng.integers(-40, 41, (1, 3)),
+                                     0, 255).astype(np.uint8)
+
+    if size_mismatch:
+        current = current[:height - height // 50, :width - width // 50]
+    return Image.fromarray(current, 'RGBA'), Image.fromarray(standard, 'RGBA')
+
+
+def measure(func: Callable, repeat: int) -> Dict[str, float]:
+    """Лучшее время из repeat запусков и пиковая память, выделенная python и numpy"""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_memory_bytes': peak}
+
+
+def _diff_points(current: Image.Image, standard: Image.Image, diff_name: str) -> Optional[np.ndarray]:
+    """Координаты подсвеченных пикселей последнего сравнения"""
+
+    try:
+        with Image.open(diff_name) as diff:
+            highlighted = np.all(image_to_array(diff) == HIGHLIGHT_COLOR, axis=2)
+    except FileNotFoundError:
+        return None
+    if current.size != standard.size:
+        return None
+    return np.argwhere(highlighted)
+
+
+def run_case(layout: layout_main.LayoutCompare, case: Dict, repeat: int, work_dir: str,
+             comparator: Optional[str] = None) -> List[Dict]:
+    """Замеры всех функций на одной паре изображений"""
+
+    current, standard = synthetic_pair(**case)
+    pixels = case['width'] * case['height']
+    diff_name = os.path.join(work_dir, 'diff.png')
+    if os.path.exists(diff_name):
+        os.remove(diff_name)
+    tolerance = float(layout._get_tolerance(None, comparator))
+    engine = get_comparator(comparator)
+    results = []
+
+    def add(function: str, measured: Dict[str, float], **extra):
+        seconds = measured['seconds']
+        results.append({**case, 'function': function, **measured,
+                        'pixels_per_second': pixels / seconds if seconds else None, **extra})
+
+    is_equal = []
+    add('_compare_image', measure(lambda: is_equal.append(layout._compare_image(
+        diff_name, standard, current, tolerance, comparator=comparator)), repeat), is_equal=is_equal[-1])
+    add('_compare_by_pixel', measure(lambda: layout._compare_by_pixel(current, standard, diff_name, tolerance,
+                                                                      comparator=engine), repeat))
+
+    points = _diff_points(current, standard, diff_name)
+    if points is None or not len(points):
+        return results
+    border = layout._diff_area_border(case['width'], case['height'])
+    mask = np.zeros((case['height'], case['width']), dtype=bool)
+    mask[points[:, 0], points[:, 1]] = True
+
+    def compute_diff_area():
+        diff_area = []
+        for y, x in points.tolist():
+            diff_area = layout.compute_diff_area(diff_area, x, y, border)
+
+    if len(points) <= MAX_AREA_POINTS:
+        add('compute_diff_area', measure(compute_diff_area, repeat), diff_pixels=len(points))
+    add('diff_regions', measure(lambda: diff_regions(mask, border), repeat), diff_pixels=len(points))
+    regions = diff_regions(mask, border)
+    add('draw_diff_mask', measure(lambda: layout.draw_diff_mask(case['width'], case['height'], regions), repeat),
+        regions=len(regions))
+    return results
+
+
+def cases(resolutions: List[str], densities: List[float]) -> List[Dict]:
+    """Набор пар: все разрешения и плотности отличий, плюс шум сглаживания и несовпадение размеров"""
+
+    result = []
+    for resolution in resolutions:
+        width, height = map(int, resolution.split('x'))
+        for density in densities:
+            result.append({'width': width, 'height': height, 'density': density,
+                           'antialiasing': False, 'size_mismatch': False})
+        result.append({'width': width, 'height': height, 'density': 0.001,
+                       'antialiasing': True, 'size_mismatch': False})
+        result.append({'width': width, 'height': height, 'density': 0,
+                       'antialiasing': False, 'size_mismatch': True})
+    return result
+
+
+def _parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Бенчмарк сравнения изображений в тестах верстки')
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), help='разрешения WIDTHxHEIGHT')
+    parser.add_argument('--densities', nargs='+', type=float, default=list(DENSITIES),
+                        help='доли отличающихся пикселей')
+    parser.add_argument('--comparators', nargs='+', choices=list(COMPARATORS), default=list(DEFAULT_COMPARATORS),
+                        help='движки сравнения')
+    parser.add_argument('--repeat', type=int, default=3, help='число замеров, берётся лучший')
+    parser.add_argument('--output', help='файл для результатов, по умолчанию stdout')
+    # остальные аргументы (например --COMPARE_ENGINE python) разбирает Config
+    options, _ = parser.parse_known_args(args)
+    return options
+
+
+def main(args: Optional[List[str]] = None):
+    """Точка входа layout_benchmark"""
+
+    from ... import __version__
+    options = _parse_args(args)
+    config = layout_main.config
+    layout = layout_main.LayoutCompare(None)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for comparator in options.comparators:
+            for seed, case in enumerate(cases(options.resolutions, options.densities)):
+                case['seed'] = seed
+                for result in run_case(layout, case, options.repeat, work_dir, comparator):
+                    results.append({'comparator': comparator, **result})
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'uatf': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'comparators': {name: COMPARATORS[name].cost._asdict() for name in options.comparators},
+        'antialiasing': bool(config.get('ANTIALIASING', 'REGRESSION')),
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
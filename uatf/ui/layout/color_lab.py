@@ -1,5 +1,13 @@
 from math import pow, sqrt, atan2, pi, cos, sin, exp
 
+import numpy as np
+
+
+# линеаризованные значения канала sRGB (0..255), умноженные на 100, как в rgb_to_xyz
+SRGB_TO_LINEAR = np.array([
+    (pow(((c / 255 + 0.055) / 1.055), 2.4) if c / 255 > 0.04045 else c / 255 / 12.92) * 100 for c in range(256)
+])
+
 
 def rgb_to_xyz(rgb):
     """Преобразуем RGB в XYZ"""
@@ -112,4 +120,84 @@ def equal_ciede2000(rgb1, rgb2):
         (d_c_prime / (k_c * s_c)) * (d_c_prime / (k_c * s_c)) +
         (d_h_prime / (k_h * s_h)) * (d_h_prime / (k_h * s_h)) +
         (d_c_prime / (k_c * s_c)) * (d_h_prime / (k_h * s_h)) * r_t)
-    return delta
\ No newline at end of file
+    return delta
+
+
+def rgb_to_lab_array(rgb):
+    """Векторизованный rgb_to_lab для массива пикселей формы (N, 3+)
+
+    Альфа-канал, как и в rgb_to_lab, не учитывается.
+    Lab считается один раз для каждого уникального цвета, линеаризация sRGB берется из таблицы
+    """
+
+    keys = (rgb[:, 0].astype(np.uint32) << 16) | (rgb[:, 1].astype(np.uint32) << 8) | rgb[:, 2]
+    colors, inverse = np.unique(keys, return_inverse=True)
+    r = SRGB_TO_LINEAR[colors >> 16]
+    g = SRGB_TO_LINEAR[(colors >> 8) & 255]
+    b = SRGB_TO_LINEAR[colors & 255]
+
+    # Observer = 2°, Illuminant = D65
+    xyz = np.stack((
+        (r * 0.4124 + g * 0.3576 + b * 0.1805) / 95.047,
+        (r * 0.2126 + g * 0.7152 + b * 0.0722) / 100.000,
+        (r * 0.0193 + g * 0.1192 + b * 0.9505) / 108.883,
+    ), axis=1)
+    xyz = np.where(xyz > 0.008856, np.power(xyz, 1 / 3), (7.787 * xyz) + (16 / 116))
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    lab = np.stack(((116 * y) - 16, 500 * (x - y), 200 * (y - z)), axis=1)
+    return lab[inverse.reshape(-1)]
+
+
+def ciede2000_array(lab1, lab2):
+    """Векторизованный CIEDE2000 для массивов Lab цветов формы (N, 3)"""
+
+    l1, a1, b1 = lab1[:, 0], lab1[:, 1], lab1[:, 2]
+    l2, a2, b2 = lab2[:, 0], lab2[:, 1], lab2[:, 2]
+    l_bar_prime = 0.5 * (l1 + l2)
+    c1 = np.sqrt(a1 * a1 + b1 * b1)
+    c2 = np.sqrt(a2 * a2 + b2 * b2)
+    c_bar = 0.5 * (c1 + c2)
+    c_bar7 = c_bar * c_bar * c_bar * c_bar * c_bar * c_bar * c_bar
+    g = 0.5 * (1.0 - np.sqrt(c_bar7 / (c_bar7 + 6103515625.0)))
+    a1_prime = a1 * (1.0 + g)
+    a2_prime = a2 * (1.0 + g)
+    c1_prime = np.sqrt(a1_prime * a1_prime + b1 * b1)
+    c2_prime = np.sqrt(a2_prime * a2_prime + b2 * b2)
+    c_bar_prime = 0.5 * (c1_prime + c2_prime)
+    h1_prime = (np.arctan2(b1, a1_prime) * 180.0) / pi
+    h1_prime = np.where(h1_prime < 0.0, h1_prime + 360.0, h1_prime)
+    h2_prime = (np.arctan2(b2, a2_prime) * 180.0) / pi
+    h2_prime = np.where(h2_prime < 0.0, h2_prime + 360.0, h2_prime)
+    h_bar_prime = np.where(np.abs(h1_prime - h2_prime) > 180.0,
+                           0.5 * (h1_prime + h2_prime + 360.0), 0.5 * (h1_prime + h2_prime))
+    t = 1.0 - 0.17 * np.cos(pi * (h_bar_prime - 30.0) / 180.0) + 0.24 * np.cos(pi * (2.0 * h_bar_prime) / 180.0) \
+        + 0.32 * np.cos(pi * (3.0 * h_bar_prime + 6.0) / 180.0) - 0.20 * np.cos(pi * (4.0 * h_bar_prime - 63.0) / 180.0)
+
+    dh_prime = np.where(np.abs(h2_prime - h1_prime) <= 180.0, h2_prime - h1_prime,
+                        np.where(h2_prime <= h1_prime, h2_prime - h1_prime + 360.0, h2_prime - h1_prime - 360.0))
+    d_l_prime = l2 - l1
+    d_c_prime = c2_prime - c1_prime
+    d_h_prime = 2.0 * np.sqrt(c1_prime * c2_prime) * np.sin(pi * (0.5 * dh_prime) / 180.0)
+    s_l = 1.0 + ((0.015 * (l_bar_prime - 50.0) * (l_bar_prime - 50.0)) / np.sqrt(
+        20.0 + (l_bar_prime - 50.0) * (l_bar_prime - 50.0)))
+    s_c = 1.0 + 0.045 * c_bar_prime
+    s_h = 1.0 + 0.015 * c_bar_prime * t
+    d_theta = 30.0 * np.exp(-((h_bar_prime - 275.0) / 25.0) * ((h_bar_prime - 275.0) / 25.0))
+    c_bar_prime7 = c_bar_prime * c_bar_prime * c_bar_prime * c_bar_prime * c_bar_prime * c_bar_prime * c_bar_prime
+    r_c = np.sqrt(c_bar_prime7 / (c_bar_prime7 + 6103515625.0))
+    r_t = -2.0 * r_c * np.sin(pi * (2.0 * d_theta) / 180.0)
+    with np.errstate(invalid='ignore'):
+        return np.sqrt(
+            (d_l_prime / s_l) * (d_l_prime / s_l) +
+            (d_c_prime / s_c) * (d_c_prime / s_c) +
+            (d_h_prime / s_h) * (d_h_prime / s_h) +
+            (d_c_prime / s_c) * (d_h_prime / s_h) * r_t)
+
+
+def equal_ciede2000_array(rgb1, rgb2, lab2=None):
+    """Векторизованный equal_ciede2000 для массивов пикселей формы (N, 3+)
+
+    lab2 - уже посчитанный Lab второго массива (из sidecar эталона)
+    """
+
+    return ciede2000_array(rgb_to_lab_array(rgb1), rgb_to_lab_array(rgb2) if lab2 is None else lab2)
@@ -2,10 +2,22 @@
 http://www.progmat.uaem.mx:8080/artVol2Num2/Articulo3Vol2Num2.pdf
 https://github.com/mapbox/pixelmatch
 """
+import numpy as np
+
+# ALPHA_BLEND[alpha, channel] - значение канала после смешивания с белым фоном, как в equal_yiq
+ALPHA_BLEND = 255 + (np.arange(256)[None, :] - 255.) * (np.arange(256)[:, None] / 255)
+# цвета с разницей меньше порога считаются одинаковыми
+YIQ_THRESHOLD = 8.1
 
 
 def equal_yiq(rgba1, rgba2):
 
+    return delta_yiq(rgba1, rgba2) < YIQ_THRESHOLD
+
+
+def delta_yiq(rgba1, rgba2):
+    """Разница между цветами в YIQ, та же шкала, что у delta_yiq_array"""
+
     a1 = rgba1[3] / 255 if len(rgba1) > 3 else 1
     a2 = rgba2[3] / 255 if len(rgba2) > 3 else 1
 
@@ -21,5 +33,31 @@ def equal_yiq(rgba1, rgba2):
     q = (rgb1[0] * 0.21147017 - rgb1[1] * 0.52261711 + rgb1[2] * 0.31114694) - \
         (rgb2[0] * 0.21147017 - rgb2[1] * 0.52261711 + rgb2[2] * 0.31114694)
 
-    delta = 0.5053 * y * y + 0.299 * i * i + 0.1957 * q * q
-    return delta < 8.1
+    return 0.5053 * y * y + 0.299 * i * i + 0.1957 * q * q
+
+
+def delta_yiq_array(rgba1, rgba2):
+    """Разница между цветами в YIQ для массивов пикселей формы (N, 4)
+
+    Смешивание с белым фоном по альфа-каналу берется из таблицы ALPHA_BLEND
+    """
+
+    r1, g1, b1 = (ALPHA_BLEND[rgba1[:, 3], rgba1[:, channel]] for channel in range(3))
+    r2, g2, b2 = (ALPHA_BLEND[rgba2[:, 3], rgba2[:, channel]] for channel in range(3))
+
+    y = (r1 * 0.29889531 + g1 * 0.58662247 + b1 * 0.11448223) - \
+        (r2 * 0.29889531 + g2 * 0.58662247 + b2 * 0.11448223)
+
+    i = (r1 * 0.59597799 - g1 * 0.27417610 - b1 * 0.32180189) - \
+        (r2 * 0.59597799 - g2 * 0.27417610 - b2 * 0.32180189)
+
+    q = (r1 * 0.21147017 - g1 * 0.52261711 + b1 * 0.31114694) - \
+        (r2 * 0.21147017 - g2 * 0.52261711 + b2 * 0.31114694)
+
+    return 0.5053 * y * y + 0.299 * i * i + 0.1957 * q * q
+
+
+def equal_yiq_array(rgba1, rgba2):
+    """Векторизованный equal_yiq для массивов пикселей формы (N, 4)"""
+
+    return delta_yiq_array(rgba1, rgba2) < YIQ_THRESHOLD
@@ -0,0 +1,218 @@
+"""Движки сравнения изображений тестов верстки
+
+Движок выбирается опцией COMPARATOR или параметром comparator у Layout.capture.
+Каждый движок объявляет профиль затрат (Cost), чтобы для проверки можно было взять
+самый дешевый достаточный движок. Свой движок регистрируется декоратором register_comparator
+"""
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Type
+
+import numpy as np
+from PIL import Image
+
+from .antialiasing import luma_plane
+from .color_lab import equal_ciede2000_array
+from .color_yiq import YIQ_THRESHOLD, delta_yiq_array
+from .pixel_diff import Box, changed_tiles, diff_mask, truncate_mask
+from ...config import Config
+
+if TYPE_CHECKING:
+    from .main import LayoutCompare
+    from .sidecar import ReferenceFeatures
+
+config = Config()
+
+# радиус окна SSIM, окно (2 * SSIM_RADIUS + 1) x (2 * SSIM_RADIUS + 1)
+SSIM_RADIUS = 3
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+class Cost(NamedTuple):
+    """Профиль затрат движка"""
+
+    # относительное время на мегапиксель изменившейся области, 1 - самый быстрый (замер layout_benchmark)
+    relative: int
+    # дополнительная память при сравнении
+    memory: str
+    # что движок считает отличием
+    detects: str
+
+
+COMPARATORS: Dict[str, Type['Comparator']] = {}
+
+
+def register_comparator(cls: Type['Comparator']) -> Type['Comparator']:
+    """Декоратор класса движка, движок доступен по cls.name"""
+
+    COMPARATORS[cls.name] = cls
+    return cls
+
+
+def default_comparator_name() -> str:
+    """Движок из COMPARATOR, если не задан - по COMPARE_ENGINE и COLOR_SPACE"""
+
+    name = config.get('COMPARATOR', 'REGRESSION')
+    if name:
+        return name
+    if config.get('COMPARE_ENGINE', 'REGRESSION') == 'python':
+        return 'python'
+    return 'pixelmatch' if config.get('COLOR_SPACE', 'REGRESSION') == 'yiq' else 'ciede2000'
+
+
+def get_comparator(name: Optional[str] = None) -> 'Comparator':
+    """Движок по имени, None - движок по умолчанию"""
+
+    name = name or default_comparator_name()
+    if name not in COMPARATORS:
+        raise ValueError(f'Неизвестный движок сравнения {name}, доступны: {", ".join(COMPARATORS)}')
+    return COMPARATORS[name]()
+
+
+class Comparator:
+    """Векторизованный движок: строит маску отличающихся пикселей, остальное делает LayoutCompare"""
+
+    name = ''
+    cost: Cost = None
+    # опция REGRESSION с допуском в шкале движка, если задана - вместо TOLERANCE
+    tolerance_option = ''
+    # допуск, если опция не задана; None - TOLERANCE (шкала CIEDE2000)
+    default_tolerance: Optional[float] = None
+    # использует sidecar эталона и нужен ли в нем Lab
+    uses_features = True
+    uses_lab = False
+
+    def compare(self, layout: 'LayoutCompare', current_image: Image, standard_image: Image, diff_name: str,
+                tolerance: float, fail_fast: int = 0, allowed: int = 0,
+                features: Optional['ReferenceFeatures'] = None) -> bool:
+        return layout._compare_by_pixel_numpy(current_image, standard_image, diff_name, tolerance, fail_fast,
+                                              allowed, features, self)
+
+    def diff_mask(self, current: np.ndarray, standard: np.ndarray, tolerance: float,
+                  antialiasing_tolerance: Optional[float] = None, tiles: Optional[List[Box]] = None,
+                  limit: Optional[int] = None, features: Optional['ReferenceFeatures'] = None) -> np.ndarray:
+        """Маска отличий, параметры как у pixel_diff.diff_mask"""
+
+        raise NotImplementedError
+
+
+@register_comparator
+class PythonComparator(Comparator):
+    """Эталонная реализация попиксельным обходом, цветовое пространство из COLOR_SPACE"""
+
+    name = 'python'
+    cost = Cost(10, 'копии изображений в png', 'разница цветов пикселя больше допуска, сглаживание по is_aa')
+    uses_features = False
+
+    @property
+    def tolerance_option(self) -> str:
+        # допуск в шкале COLOR_SPACE, как у векторизованного движка этого пространства
+        return PixelmatchComparator.tolerance_option if config.get('COLOR_SPACE', 'REGRESSION') == 'yiq' else ''
+
+    @property
+    def default_tolerance(self) -> Optional[float]:
+        return PixelmatchComparator.default_tolerance if config.get('COLOR_SPACE', 'REGRESSION') == 'yiq' else None
+
+    def compare(self, layout: 'LayoutCompare', current_image: Image, standard_image: Image, diff_name: str,
+                tolerance: float, fail_fast: int = 0, allowed: int = 0,
+                features: Optional['ReferenceFeatures'] = None) -> bool:
+        return layout._compare_by_pixel_python(current_image, standard_image, diff_name, tolerance,
+                                               fail_fast, allowed)
+
+
+class ColorDeltaComparator(Comparator):
+    """Разница цветов для каждой отличающейся пары пикселей в изменившихся плитках"""
+
+    delta_func: Callable = None
+
+    def diff_mask(self, current: np.ndarray, standard: np.ndarray, tolerance: float,
+                  antialiasing_tolerance: Optional[float] = None, tiles: Optional[List[Box]] = None,
+                  limit: Optional[int] = None, features: Optional['ReferenceFeatures'] = None) -> np.ndarray:
+        return diff_mask(current, standard, self.delta_func, tolerance, antialiasing_tolerance, tiles, limit,
+                         features)
+
+
+@register_comparator
+class PixelmatchComparator(ColorDeltaComparator):
+    """Разница яркости и цветности в YIQ, как в pixelmatch
+
+    Допуск - взвешенная сумма квадратов разниц Y, I, Q, порог pixelmatch - 8.1
+    """
+
+    name = 'pixelmatch'
+    cost = Cost(1, 'пары отличающихся пикселей', 'разница в YIQ больше допуска, сглаживание')
+    tolerance_option = 'YIQ_TOLERANCE'
+    default_tolerance = YIQ_THRESHOLD
+    delta_func = staticmethod(delta_yiq_array)
+
+
+@register_comparator
+class CIEDE2000Comparator(ColorDeltaComparator):
+    """Воспринимаемая разница цветов CIEDE2000"""
+
+    name = 'ciede2000'
+    cost = Cost(2, 'пары отличающихся пикселей и их Lab', 'разница CIEDE2000 больше допуска, сглаживание')
+    uses_lab = True
+    delta_func = staticmethod(equal_ciede2000_array)
+
+
+def box_mean(plane: np.ndarray, radius: int) -> np.ndarray:
+    """Среднее по окну для каждой точки, plane дополнена на radius с каждой стороны"""
+
+    size = 2 * radius + 1
+    integral = np.zeros((plane.shape[0] + 1, plane.shape[1] + 1))
+    integral[1:, 1:] = plane.cumsum(axis=0).cumsum(axis=1)
+    return (integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size]
+            + integral[:-size, :-size]) / (size * size)
+
+
+def ssim_map(luma1: np.ndarray, luma2: np.ndarray, radius: int = SSIM_RADIUS) -> np.ndarray:
+    """Локальный SSIM по яркости, плоскости дополнены на radius с каждой стороны"""
+
+    mean1, mean2 = box_mean(luma1, radius), box_mean(luma2, radius)
+    var1 = box_mean(luma1 * luma1, radius) - mean1 * mean1
+    var2 = box_mean(luma2 * luma2, radius) - mean2 * mean2
+    covariance = box_mean(luma1 * luma2, radius) - mean1 * mean2
+    return ((2 * mean1 * mean2 + SSIM_C1) * (2 * covariance + SSIM_C2)) / \
+        ((mean1 * mean1 + mean2 * mean2 + SSIM_C1) * (var1 + var2 + SSIM_C2))
+
+
+@register_comparator
+class SSIMComparator(Comparator):
+    """Структурное сходство в окне вокруг пикселя
+
+    Отличающийся пиксель считается отличием, если локальный SSIM меньше 1 - допуск.
+    Сдвиг оттенка без изменения структуры и одиночный шум сглаживания не считаются,
+    ANTIALIASING не используется. Допуск от 0 до 1
+    """
+
+    name = 'ssim'
+    cost = Cost(2, 'плоскости яркости и средних изменившихся плиток', '1 - SSIM в окне 7x7 больше допуска')
+    tolerance_option = 'SSIM_TOLERANCE'
+    default_tolerance = 0.05
+
+    def diff_mask(self, current: np.ndarray, standard: np.ndarray, tolerance: float,
+                  antialiasing_tolerance: Optional[float] = None, tiles: Optional[List[Box]] = None,
+                  limit: Optional[int] = None, features: Optional['ReferenceFeatures'] = None) -> np.ndarray:
+        if tiles is None:
+            tiles = changed_tiles(current, standard)
+        height, width = current.shape[:2]
+        mask = np.zeros((height, width), dtype=bool)
+        found = 0
+        for top, bottom, left, right in tiles:
+            box_top, box_left = max(top - SSIM_RADIUS, 0), max(left - SSIM_RADIUS, 0)
+            box_bottom, box_right = min(bottom + SSIM_RADIUS, height), min(right + SSIM_RADIUS, width)
+            box = np.s_[box_top:box_bottom, box_left:box_right]
+            # окна у края изображения дополняются крайними пикселями
+            pad = ((SSIM_RADIUS - (top - box_top), SSIM_RADIUS - (box_bottom - bottom)),
+                   (SSIM_RADIUS - (left - box_left), SSIM_RADIUS - (box_right - right)))
+            luma1 = np.pad(luma_plane(current[box]), pad, mode='edge')
+            luma2 = features.luma_plane(box) if features is not None else luma_plane(standard[box])
+            luma2 = np.pad(luma2, pad, mode='edge')
+
+            tile = np.any(current[top:bottom, left:right] != standard[top:bottom, left:right], axis=2)
+            tile &= ssim_map(luma1, luma2) < 1 - tolerance
+            mask[top:bottom, left:right] = tile
+            found += int(np.count_nonzero(tile))
+            if limit is not None and found >= limit:
+                return truncate_mask(mask, limit)
+        return mask
@@ -0,0 +1,121 @@
+"""Кэш результатов сравнения скриншотов между запусками"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from ...config import Config
+from ...helper import get_artifact_path
+from ...logfactory import log
+
+config = Config()
+
+# записи, которые не использовались дольше, удаляются
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+def image_hash(image: Image) -> str:
+    """Хэш пикселей изображения, не зависит от сжатия png"""
+
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f'{image.mode}{image.size}'.encode())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+class CompareMemo:
+    """Результаты сравнения в artifact/compare_memo.db рядом с result.db
+
+    Ключ - хэши эталона и текущего изображения и все настройки, влияющие на результат.
+    Хранится вердикт, пояснение к отличиям и изображение с отличиями.
+    Объем ограничен COMPARE_MEMO_SIZE (МБ), 0 - кэш выключен
+    """
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):  # singleton
+        if not cls.instance:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if not hasattr(self, 'max_bytes'):
+            self.max_bytes = int(config.get('COMPARE_MEMO_SIZE', 'REGRESSION') or 0) * 1024 * 1024
+            self.hits = 0
+            self.misses = 0
+            self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(os.path.join(get_artifact_path(), 'compare_memo.db'), timeout=10)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS memo '
+                               '(key text PRIMARY KEY, is_equal integer, description text, diff blob, '
+                               'size integer, used real)')
+            self._evict()
+        return self._conn
+
+    @staticmethod
+    def key(standard_image: Image, current_image: Image, **settings) -> str:
+        """Ключ сравнения: хэши изображений и настройки"""
+
+        settings.update({name: config.get(name, 'REGRESSION') for name in (
+            'COLOR_SPACE', 'COMPARE_ENGINE', 'ANTIALIASING', 'ANTIALIASING_TOLERANCE', 'HIGHLIGHT_DIFF',
+            'DIFF_AREA_BORDER', 'SHIFT_DETECTION', 'MAX_SHIFT')})
+        description = json.dumps(settings, sort_keys=True, default=str)
+        return hashlib.blake2b(f'{image_hash(standard_image)}:{image_hash(current_image)}:{description}'.encode(),
+                               digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[bool, str, Optional[bytes]]]:
+        """(вердикт, пояснение к отличиям, png с отличиями) или None"""
+
+        try:
+            row = self._db.execute('SELECT is_equal, description, diff FROM memo WHERE key = ?', (key,)).fetchone()
+            if row:
+                self._db.execute('UPDATE memo SET used = ? WHERE key = ?', (time.time(), key))
+                self._db.commit()
+        except sqlite3.Error as error:
+            log(f'Кэш результатов сравнения недоступен: {error}', '[d]')
+            return None
+        if row:
+            self.hits += 1
+        else:
+            self.misses += 1
+        log(f'Кэш результатов сравнения: {"попадание" if row else "промах"} '
+            f'(попаданий {self.hits / (self.hits + self.misses):.0%} из {self.hits + self.misses})', '[d]')
+        return (bool(row[0]), row[1], row[2]) if row else None
+
+    def put(self, key: str, is_equal: bool, description: str, diff: Optional[bytes]):
+        size = len(key) + len(description) + len(diff or b'')
+        try:
+            self._db.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, int(is_equal), description, diff, size, time.time()))
+            self._db.commit()
+            self._evict()
+        except sqlite3.Error as error:
+            log(f'Не удалось сохранить результат сравнения в кэш: {error}', '[d]')
+
+    def _evict(self):
+        """Удаляем старые записи и давно не использованные сверх COMPARE_MEMO_SIZE"""
+
+        db = self._conn
+        db.execute('DELETE FROM memo WHERE used < ?', (time.time() - MAX_AGE,))
+        total = db.execute('SELECT coalesce(sum(size), 0) FROM memo').fetchone()[0]
+        if total > self.max_bytes:
+            rows = db.execute('SELECT key, size FROM memo ORDER BY used').fetchall()
+            evicted = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            db.executemany('DELETE FROM memo WHERE key = ?', evicted)
+        db.commit()
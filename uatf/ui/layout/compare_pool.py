@@ -0,0 +1,63 @@
+"""Пул процессов для фонового сравнения скриншотов"""
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+from ...config import Config
+from ...logfactory import log
+
+config = Config()
+
+
+def _init_worker(options: dict):
+    """Опции REGRESSION процесса теста, процесс пула читает config.ini и командную строку заново"""
+
+    config.options['REGRESSION'].update(options)
+
+
+class PendingCompare:
+    """Сравнение, запущенное в пуле, результат обрабатывается в процессе теста"""
+
+    def __init__(self, future: Future, finish: Callable):
+        self._future = future
+        self._finish = finish
+
+    def result(self):
+        """Дожидается сравнения, при отличиях бросает RegressionError"""
+
+        return self._finish(*self._future.result())
+
+
+class ComparePool:
+    """Пул из COMPARE_PROCESSES процессов, создается при первом сравнении
+
+    Процессы запускаются через spawn: fork скопировал бы в них драйвер selenium и соединения sqlite
+    """
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):  # singleton
+        if not cls.instance:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if not hasattr(self, '_executor'):
+            self.processes = int(config.get('COMPARE_PROCESSES', 'REGRESSION') or 0)
+            self._executor = None
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        if self._executor is None:
+            log(f'Запускаем пул сравнения скриншотов из {self.processes} процессов', '[d]')
+            self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker,
+                                                 initargs=(dict(config.options['REGRESSION']),))
+        return self._executor.submit(func, *args, **kwargs)
+
+    def shutdown(self):
+        """Дожидается сравнений и останавливает процессы пула, вызывается в конце сессии pytest"""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,18 +1,63 @@
+import base64
 import io
 import os
-import shutil
-from typing import Optional, List
-
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator, NamedTuple, Optional, List, Tuple, Union
+
+import numpy as np
 from PIL import Image, ImageDraw
 
 from ...helper import get_artifact_path
+from ..browser import send_cdp_cmd
 from ..elements import Element
+from ..run_browser import MOBILE_DEVICES
 from .antialiasing import is_aa
+from .compare_memo import CompareMemo, image_hash
+from .comparators import Comparator, get_comparator
+from .compare_pool import ComparePool, PendingCompare
+from .reference_cache import ReferenceCache
+from .reference_store import ReferenceStore, link_file
+from .shift import estimate_shift, overlap
+from .sidecar import ReferenceFeatures, load_features, write_sidecar
+from .pixel_diff import (HIGHLIGHT_COLOR, TILE_SIZE, image_to_array, changed_tiles, diff_image_by_size,
+                         diff_regions, highlight_diff, pyramid_tiles, tile_hashes, truncate_mask)
 from ...config import Config
 from ...logfactory import log
 
 config = Config()
 
+# минимальный интервал между снимками при ожидании стабильного изображения, несколько кадров анимации
+STABLE_INTERVAL = 0.05
+# высота полосы снимка всей страницы через CDP в пикселях снимка, кратна TILE_SIZE
+PAGE_SLICE_HEIGHT = 16 * TILE_SIZE
+# строки соседних полос, которые видит сравнение полосы: соседи для проверки сглаживания и окно SSIM
+PAGE_SLICE_CONTEXT = 8
+
+
+class Variant(NamedTuple):
+    """Вариант снимка, переключается в текущей сессии браузера (LayoutCompare.emulate)
+
+    Пустое поле - как в настройках запуска
+    """
+
+    # размер области просмотра WxH, в имени эталона вместо BROWSER_RESOLUTION
+    resolution: str = ''
+    # имя темы в имени эталона вместо REGRESSION_THEME, по умолчанию color_scheme
+    theme: str = ''
+    # prefers-color-scheme: light или dark
+    color_scheme: str = ''
+    # устройство из MOBILE_DEVICES, добавляется в имя эталона
+    device: str = ''
+
+    @property
+    def label(self) -> str:
+        return '_'.join(filter(None, (self.theme or self.color_scheme, self.resolution,
+                                      self.device.replace(' ', '_'))))
+
 
 class RegressionError(AssertionError):
 
@@ -27,7 +72,7 @@ class RegressionError(AssertionError):
 
 color_space = config.get('COLOR_SPACE', 'REGRESSION')
 if color_space == 'yiq':
-    from .color_yiq import equal_yiq as equal_img
+    from .color_yiq import delta_yiq as equal_img
 elif color_space == 'lab':
     from .color_lab import equal_ciede2000 as equal_img
 
@@ -55,12 +100,38 @@ def convert_coordinates(fill_rect):
         return fill_rect
 
 
+def fill_transparent(image: Image, fill_rect: List[List[int]]) -> Image:
+    """Заливает области [x0, y0, width, height] прозрачным белым одним проходом numpy
+
+    Результат попиксельно совпадает со вставкой прозрачных прямоугольников через paste:
+    области обрезаются по границам изображения, цвет приводится к режиму изображения
+    """
+
+    pixels = np.array(image)
+    mask = np.zeros(pixels.shape[:2], dtype=bool)
+    for x, y, width, height in fill_rect:
+        mask[max(y, 0):max(y + int(height), 0), max(x, 0):max(x + int(width), 0)] = True
+    pixels[mask] = Image.new('RGBA', (1, 1), (255, 255, 255, 0)).convert(image.mode).getpixel((0, 0))
+    return Image.fromarray(pixels, image.mode)
+
+
 def convert_regression_suite_name(suite):
     """Конвертирует название suite теста верстки"""
 
     return suite.replace('TestRegression', 'Regression')
 
 
+def compare_in_process(current_image: Image, src: str, diff_name: str, tolerance: float, fail_fast: int = 0,
+                       max_diff_pixels: int = 0, max_diff_ratio: float = 0, comparator: Optional[str] = None):
+    """Сравнение в процессе пула COMPARE_PROCESSES, возвращает (результат, пояснение к отличиям)"""
+
+    layout = LayoutCompare(None)
+    is_equal = layout._compare_image(diff_name, ReferenceCache().get(src), current_image, tolerance,
+                                     fail_fast, max_diff_pixels, max_diff_ratio,
+                                     layout._load_features(src, comparator), comparator)
+    return is_equal, layout._diff_description
+
+
 class LayoutCompare:
     """Layout Regression Testing"""
 
@@ -71,9 +142,26 @@ class LayoutCompare:
         self._antialiasing_tolerance = config.get('ANTIALIASING_TOLERANCE', 'REGRESSION')
         self._report_dir = get_artifact_path('regression')
         self._device_pixel_ratio = None
+        # снимок области через CDP, отключается после первой неудачи (не Chrome)
+        self._clip_screenshot = bool(config.get('CLIP_SCREENSHOT', 'REGRESSION'))
+        # снимок всей страницы через CDP captureBeyondViewport, отключается после первой неудачи
+        self._full_page_cdp = True
+        # остановка таймлайна анимаций через CDP, отключается после первой ошибки драйвера (не Chrome),
+        # дальше анимации останавливаются только через document.getAnimations()
+        self._freeze_timeline = True
+        # общий скриншот окна и прямоугольники элементов внутри frame():
+        # id элемента -> (прямоугольник в документе, прямоугольник в пикселях кадра или None)
+        self._frame = None
+        self._frame_rects = {}
+        # скрытые внутри mask() области: (селектор или элемент, [[x, y, width, height], ...])
+        self._masked = []
+        # вариант внутри emulate(), по нему строится имя эталона
+        self._variant: Optional[Variant] = None
+        # пояснение к последнему сравнению, добавляется к сообщению об ошибке
+        self._diff_description = ''
         # координаты для скрина при эмуляции устройств делятся на devicePixelRatio
         # https://developer.mozilla.org/en-US/docs/Web/API/Window/devicePixelRatio
-        if config.get("CHROME_MOBILE_EMULATION", "GENERAL"):
+        if self._driver and config.get("CHROME_MOBILE_EMULATION", "GENERAL"):
             self._device_pixel_ratio = self._driver.execute_script("return window.devicePixelRatio")
 
     def _process_image(
@@ -99,24 +187,24 @@ class LayoutCompare:
         """
 
         if not any((element, width, height, left, top, bottom, right)):
-            image = self._capture_window()
+            image = self._capture_stable(self._capture_window)
             msg = 'Сделали снимок экрана c именем %s' % name
         elif element and not any((width, height, left, top, bottom, right, fill_rect)):
-            image = self._capture_element(element)
+            image = self._capture_stable(partial(self._capture_element, element))
             msg = 'Сделали снимок %s c именем %s' % (element.name_output(), name)
         elif element and fill_rect:
-            image = self._capture_element(element, fill_rect)
+            image = self._capture_stable(partial(self._capture_element, element, fill_rect))
             msg = 'Сделали снимок %s c именем %s' % (element.name_output(), name)
         else:
             try:
                 if element:
-                    left, top, width, height = element.get_bound_with_indent(left, top, bottom, right)
+                    left, top, width, height = self._element_bound(element, left, top, bottom, right)
                 description = (width, height, name, left, top)
                 if fill:
-                    image = self._fill_rect_on_window(left, top, width, height)
+                    image = self._capture_stable(partial(self._fill_rect_on_window, left, top, width, height))
                     msg = 'Закрасили область %sx%s с именем %s и смещением x:%s, y:%s' % description
                 else:
-                    image = self._crop_window(left, top, width, height)
+                    image = self._capture_stable(partial(self._crop_window, left, top, width, height))
                     msg = 'Сделали снимок области %sx%s с именем %s и смещением x:%s, y:%s' % description
             except Exception as err:
                 image = self._create_empty_image()
@@ -124,6 +212,36 @@ class LayoutCompare:
         log(msg)
         return image
 
+    def _capture_stable(self, capture: Callable[[], Image]) -> Image:
+        """Снимок, когда STABLE_FRAMES снимков подряд совпадают, но не дольше STABLE_TIMEOUT
+
+        Снимки сравниваются по хэшу пикселей. Внутри frame() кадр уже снят, снимаем один раз
+        """
+
+        frames = int(config.get('STABLE_FRAMES', 'REGRESSION') or 0)
+        if frames < 2 or self._frame is not None:
+            return capture()
+        timeout = float(config.get('STABLE_TIMEOUT', 'REGRESSION'))
+        start = last_capture = time.perf_counter()
+        image = capture()
+        digest = image_hash(image)
+        captures = same = 1
+        while same < frames and time.perf_counter() - start < timeout:
+            time.sleep(max(STABLE_INTERVAL - (time.perf_counter() - last_capture), 0))
+            last_capture = time.perf_counter()
+            image.close()
+            image = capture()
+            captures += 1
+            current_digest = image_hash(image)
+            same = same + 1 if current_digest == digest else 1
+            digest = current_digest
+        elapsed = time.perf_counter() - start
+        if same >= frames:
+            log(f'Изображение стабилизировалось за {elapsed:.2f} сек., снимков: {captures}')
+        else:
+            log(f'Изображение не стабилизировалось за {timeout} сек., снимков: {captures}, берем последний')
+        return image
+
     @staticmethod
     def _create_empty_image() -> Image:
         """Создаем заглушку"""
@@ -138,11 +256,17 @@ class LayoutCompare:
         :arg height - высота
         """
 
-        png = self._capture_window()
+        clip = self._capture_clip(left, top, width, height)
+        if clip:
+            return clip[0]
+
+        # общий кадр frame() не копируем, обрезка и так создает новое изображение
+        png = self._frame if self._frame is not None else self._capture_window()
         width_ = width or png.width
         height_ = height or png.height
         cropped = png.crop((left, top, left + width_, top + height_))
-        png.close()
+        if png is not self._frame:
+            png.close()
         return cropped
 
     def _fill_rect_on_window(self, left, top, width=0, height=0) -> Image:
@@ -156,7 +280,14 @@ class LayoutCompare:
 
         black = (0, 0, 0)
 
-        png = self._capture_window()
+        clip = self._capture_clip(left, top, width, height)
+        if clip:
+            # вне области всё равно будет закрашено, поэтому окно целиком не снимаем
+            image, window_size = clip
+            png = Image.new(image.mode, window_size, black)
+            png.paste(image, (left, top))
+        else:
+            png = self._capture_window()
         image_width, image_height = png.size
         _width = width or png.width
         _height = height or png.height
@@ -180,6 +311,16 @@ class LayoutCompare:
             fill_rect.append(self._get_fill_area_by_element(coordinates, elem))
         return fill_rect
 
+    def get_fill_area_by_script(self, element: Element, fill_elements: List[Element]) -> list:
+        """Области fill_elements относительно element одним вызовом скрипта (FILL_BY_SCRIPT)
+
+        Координаты округляются так же, как location и size, поэтому области совпадают
+        с get_fill_area_by_elements
+        """
+
+        (left, top, *_), *rects = (rect for rect, _ in self._element_rects([element, *fill_elements]))
+        return [[x - left, y - top, width, height] for x, y, width, height in rects]
+
     @staticmethod
     def _get_fill_area_by_element(coordinates, element) -> list:
         """Получает размер элемента относительно родительского
@@ -204,7 +345,12 @@ class LayoutCompare:
             left: int = 0, top: int = 0, bottom: int = 0, right: int = 0,
             fill: bool = False, msg: str = "",
             fill_rect: Optional[List[List[int]]] = None,
-            tolerance: float = None) -> bool:
+            tolerance: float = None,
+            fail_fast: int = 0,
+            max_diff_pixels: int = 0,
+            max_diff_ratio: float = 0,
+            comparator: Optional[str] = None,
+            full_page: bool = False) -> bool:
         """Сохраняет изображение для утилиты сравнения
 
         :param suite имя сюита
@@ -220,56 +366,189 @@ class LayoutCompare:
         :param fill - Закрашивать области или обрезать
         :param fill_rect - закрашиваемые области, формат [ [x0,y0,width,height], ...]
         :param msg - сообщение об ошибке
-        :param tolerance: максимально допустимая разница между цветами
+        :param tolerance: максимально допустимая разница между цветами,
+                          шкала зависит от движка: ciede2000 - разница CIEDE2000 (TOLERANCE),
+                          pixelmatch - разница в YIQ (YIQ_TOLERANCE, иначе 8.1), python - как у движка COLOR_SPACE,
+                          ssim - 1 - SSIM от 0 до 1 (SSIM_TOLERANCE, иначе 0.05)
+        :param fail_fast: остановить сравнение, как только найдено столько отличающихся пикселей сверх допуска,
+                          на изображении с отличиями будут подсвечены только найденные
+        :param max_diff_pixels: допустимое число отличающихся пикселей
+        :param max_diff_ratio: допустимая доля отличающихся пикселей от площади изображения
+        :param comparator: движок сравнения из comparators.COMPARATORS, по умолчанию COMPARATOR
+        :param full_page: снимок всей страницы полосами, см. _capture_full_page
         """
         file_name = self._get_file_path(check_name, suite, test)
         self._makedirs(file_name)
 
-        current_image = self._process_image(name=check_name, element=element,
-                                            width=width, height=height, left=left, top=top,
-                                            bottom=bottom, right=right, fill=fill, fill_rect=fill_rect)
+        if full_page:
+            self._check_full_page(element, width, height, left, top, bottom, right, fill_rect)
+            src, current_image, is_equal = self._compare_full_page(check_name, file_name, tolerance, fail_fast,
+                                                                   max_diff_pixels, max_diff_ratio, comparator)
+            if is_equal is not None:
+                return self._check_result(is_equal, self._diff_description, check_name, file_name, current_image,
+                                          src, msg=msg, masked=self._masked)
+        else:
+            with self.freeze_animations():
+                current_image = self._process_image(name=check_name, element=element,
+                                                    width=width, height=height, left=left, top=top,
+                                                    bottom=bottom, right=right, fill=fill, fill_rect=fill_rect)
 
         if config.get('GENERATE_IMAGE', 'REGRESSION'):
-            current_image.save(file_name)
+            self._save_standard_image(current_image, file_name)
             return True
 
-        src = self._copy_standard_image(file_name)
-
-        standard_name = file_name.replace('~cur', '~ref')
+        src = self._get_standard_path(file_name)
         diff_name = file_name.replace('~cur', '~diff')
-        standard_image = Image.open(standard_name)
-        tolerance = tolerance if tolerance else self._tolerance
+        standard_image = ReferenceCache().get(src)
+        tolerance = self._get_tolerance(tolerance, comparator)
         is_equal = self._compare_image(diff_name, standard_image=standard_image, current_image=current_image,
-                                       tolerance=tolerance)
-        if not is_equal:
-            current_image.save(file_name)
-            if not msg:
-                msg = f"Текущее изображение '{check_name}' не соответствует ожидаемому"
-            exc = RegressionError(msg, standard=standard_name, current=file_name, diff=diff_name,
-                                  src=src, element=element)
-            raise exc
+                                       tolerance=tolerance, fail_fast=fail_fast, max_diff_pixels=max_diff_pixels,
+                                       max_diff_ratio=max_diff_ratio, features=self._load_features(src, comparator),
+                                       comparator=comparator)
+        return self._check_result(is_equal, self._diff_description, check_name, file_name, current_image, src,
+                                  element, msg, self._masked)
+
+    def compare_async(
+            self, check_name: str, suite: str = '', test: str = '',
+            element: Optional[Element] = None, msg: str = "",
+            tolerance: float = None, fail_fast: int = 0,
+            max_diff_pixels: int = 0, max_diff_ratio: float = 0,
+            comparator: Optional[str] = None, full_page: bool = False, **kwargs) -> PendingCompare:
+        """Делает снимок и отправляет сравнение в пул COMPARE_PROCESSES
+
+        Параметры как у compare, width, height, left, top, bottom, right, fill и fill_rect передаются в kwargs.
+        RegressionError бросается из PendingCompare.result()
+        """
+        file_name = self._get_file_path(check_name, suite, test)
+        self._makedirs(file_name)
+        if full_page:
+            self._check_full_page(element, **kwargs)
+            src, current_image, is_equal = self._compare_full_page(check_name, file_name, tolerance, fail_fast,
+                                                                   max_diff_pixels, max_diff_ratio, comparator)
+            if is_equal is not None:
+                # полосы уже сравнены при снимке, в пул отправлять нечего
+                future = Future()
+                future.set_result((is_equal, self._diff_description))
+                return PendingCompare(future, partial(self._check_result, check_name=check_name,
+                                                      file_name=file_name, current_image=current_image, src=src,
+                                                      msg=msg, masked=list(self._masked)))
         else:
+            with self.freeze_animations():
+                current_image = self._process_image(name=check_name, element=element, **kwargs)
+
+        src = self._get_standard_path(file_name)
+        diff_name = file_name.replace('~cur', '~diff')
+        tolerance = self._get_tolerance(tolerance, comparator)
+        future = ComparePool().submit(compare_in_process, current_image, src, diff_name, tolerance,
+                                      fail_fast, max_diff_pixels, max_diff_ratio, comparator)
+        return PendingCompare(future, partial(self._check_result, check_name=check_name, file_name=file_name,
+                                              current_image=current_image, src=src, element=element, msg=msg,
+                                              masked=list(self._masked)))
+
+    @staticmethod
+    def _check_full_page(element: Optional[Element] = None, width: Optional[int] = None,
+                         height: Optional[int] = None, left: int = 0, top: int = 0, bottom: int = 0,
+                         right: int = 0, fill_rect: Optional[List[List[int]]] = None, **kwargs):
+        if any((element, width, height, left, top, bottom, right, fill_rect)):
+            raise ValueError('Снимок всей страницы не совмещается с element, width, height, отступами и fill_rect')
+
+    def _compare_full_page(self, check_name: str, file_name: str, tolerance: Optional[float] = None,
+                           fail_fast: int = 0, max_diff_pixels: int = 0, max_diff_ratio: float = 0,
+                           comparator: Optional[str] = None) -> Tuple[Optional[str], Optional[Image], Optional[bool]]:
+        """Снимок всей страницы со сравнением полос по мере снимка, параметры как у compare
+
+        :return: (путь до эталона, снимок страницы, результат сравнения или None, если страницу нужно
+                 сравнить целиком: GENERATE_IMAGE, нет эталона того же размера, движок python)
+        """
+
+        self._diff_description = ''
+        src = features = None
+        if not config.get('GENERATE_IMAGE', 'REGRESSION'):
+            src = self._get_standard_path(file_name)
+            features = self._load_features(src, comparator)
+        with self.freeze_animations():
+            return (src, *self._capture_full_page(check_name, src, features, self._get_tolerance(tolerance, comparator),
+                                                  fail_fast, max_diff_pixels, max_diff_ratio,
+                                                  get_comparator(comparator), file_name.replace('~cur', '~diff')))
+
+    def _get_tolerance(self, tolerance: Optional[float], comparator: Optional[str] = None) -> float:
+        """Допуск проверки в шкале движка
+
+        Если не передан: опция допуска движка (YIQ_TOLERANCE, SSIM_TOLERANCE), если она задана, затем
+        допуск движка по умолчанию. TOLERANCE задан в шкале CIEDE2000 и берется только для движков в ней
+        """
+
+        if tolerance:
+            return tolerance
+        engine = get_comparator(comparator)
+        if engine.tolerance_option and config.get(engine.tolerance_option, 'REGRESSION'):
+            return float(config.get(engine.tolerance_option, 'REGRESSION'))
+        if engine.default_tolerance is not None:
+            return engine.default_tolerance
+        return self._tolerance
+
+    def _check_result(self, is_equal: bool, description: str, check_name: str, file_name: str,
+                      current_image: Image, src: str, element: Optional[Element] = None, msg: str = "",
+                      masked: Optional[list] = None) -> bool:
+        """Сохраняем артефакты и бросаем RegressionError, если изображения отличаются
+
+        :param masked: скрытые при снимке области, попадают в сообщение об ошибке
+        """
+
+        if is_equal:
             log(f'Изображения {check_name} идентичны')
             return True
 
+        current_image.save(file_name)
+        self._copy_standard_image(file_name)
+        if not msg:
+            msg = f"Текущее изображение '{check_name}' не соответствует ожидаемому"
+        if description:
+            msg = f'{msg}\n{description}'
+        if masked:
+            msg = f'{msg}\nСкрытые при снимке области [x, y, width, height]: {self._masked_description(masked)}'
+        raise RegressionError(msg, standard=file_name.replace('~cur', '~ref'), current=file_name,
+                              diff=file_name.replace('~cur', '~diff'), src=src, element=element)
+
     def _compare_image(self, diff_name: str, standard_image: Image, current_image: Image,
-                       tolerance: float) -> bool:
+                       tolerance: float, fail_fast: int = 0, max_diff_pixels: int = 0,
+                       max_diff_ratio: float = 0, features: Optional[ReferenceFeatures] = None,
+                       comparator: Optional[str] = None) -> bool:
         """Сравниваем эталонное изображение и текущее"""
 
+        self._diff_description = ''
+        engine = get_comparator(comparator)
+        memo = CompareMemo()
+        memo_key = None
+        if memo.enabled:
+            memo_key = memo.key(standard_image, current_image, tolerance=tolerance, fail_fast=fail_fast,
+                                max_diff_pixels=max_diff_pixels, max_diff_ratio=max_diff_ratio,
+                                comparator=engine.name)
+            cached = memo.get(memo_key)
+            if cached:
+                is_equal, self._diff_description, diff = cached
+                if diff:
+                    with open(diff_name, 'wb') as file:
+                        file.write(diff)
+                return is_equal
+
+        start = time.perf_counter()
         try:
-            current_bytes = io.BytesIO()
-            current_image.save(current_bytes, format="PNG")
-            standard_bytes = io.BytesIO()
-            standard_image.save(standard_bytes, format='PNG')
-
-            # equal bytes
-            if current_bytes.getvalue() == standard_bytes.getvalue():
-                return True
-
-            return self._compare_by_pixel(current_image, standard_image, diff_name, tolerance)
+            is_equal = self._compare_by_pixel(current_image, standard_image, diff_name, tolerance,
+                                              fail_fast, max_diff_pixels, max_diff_ratio, features, engine)
         except Exception as error:
             log('Error compare image:\n%s' % error, '[e]')
             return False
+        finally:
+            log(f'Сравнение изображений заняло {time.perf_counter() - start:.3f} сек.', '[d]')
+
+        if memo_key:
+            diff = None
+            if not is_equal and os.path.exists(diff_name):
+                with open(diff_name, 'rb') as file:
+                    diff = file.read()
+            memo.put(memo_key, is_equal, self._diff_description, diff)
+        return is_equal
 
     # noinspection PyUnresolvedReferences
     @staticmethod
@@ -298,20 +577,179 @@ class LayoutCompare:
 
         return diff_image
 
-    # noinspection PyUnresolvedReferences
     def _compare_by_pixel(self, current_image: Image, standard_image: Image, diff_name: str,
-                          tolerance: float) -> bool:
-        """Сравнение 2 PIL.Image"""
+                          tolerance: float, fail_fast: int = 0, max_diff_pixels: int = 0,
+                          max_diff_ratio: float = 0, features: Optional[ReferenceFeatures] = None,
+                          comparator: Optional[Comparator] = None) -> bool:
+        """Сравнение 2 PIL.Image движком comparator, по умолчанию из COMPARATOR"""
+
+        allowed = self._allowed_diff(current_image.width, current_image.height, max_diff_pixels, max_diff_ratio)
+        comparator = comparator or get_comparator()
+        log(f'Движок сравнения: {comparator.name}', '[d]')
+        return comparator.compare(self, current_image, standard_image, diff_name, tolerance, fail_fast, allowed,
+                                  features)
+
+    @staticmethod
+    def _allowed_diff(width: int, height: int, max_diff_pixels: int = 0, max_diff_ratio: float = 0) -> int:
+        """Допустимое число отличающихся пикселей"""
+
+        return max(int(max_diff_pixels or 0), int((max_diff_ratio or 0) * width * height))
+
+    def _within_budget(self, found: int, allowed: int) -> bool:
+        """Проверка, что число отличающихся пикселей в пределах допуска"""
+
+        if found > allowed:
+            if allowed:
+                self._diff_description = f'Отличается пикселей: {found}, допустимо: {allowed}'
+            return False
+        if found:
+            log(f'Отличается пикселей: {found}, в пределах допуска {allowed}')
+        return True
+
+    @staticmethod
+    def _fail_fast_description(found: int) -> str:
+        return f'Сравнение остановлено после {found} отличающихся пикселей, ' \
+               f'на изображении с отличиями подсвечены только они'
+
+    def _compare_by_pixel_numpy(self, current_image: Image, standard_image: Image, diff_name: str,
+                                tolerance: float, fail_fast: int = 0, allowed: int = 0,
+                                features: Optional[ReferenceFeatures] = None,
+                                comparator: Optional[Comparator] = None) -> bool:
+        """Сравнение 2 PIL.Image на массивах numpy
+
+        :param fail_fast: остановить поиск после стольких отличий сверх allowed
+        :param allowed: допустимое число отличающихся пикселей
+        :param features: предрасчитанные признаки эталона из sidecar
+        :param comparator: векторизованный движок, строящий маску отличий
+        """
+
+        comparator = comparator or get_comparator()
+
+        current = image_to_array(current_image)
+        standard = image_to_array(standard_image)
+        if features is not None and features.index.shape != standard.shape[:2]:
+            features = None
+
+        tiles = None
+        if current.shape == standard.shape:
+            if config.get('PYRAMID_DIFF', 'REGRESSION'):
+                tiles = pyramid_tiles(current, standard)
+            else:
+                tiles = changed_tiles(current, standard,
+                                      standard_hashes=features.tiles if features is not None else None)
+            total_tiles = -(-current.shape[0] // TILE_SIZE) * -(-current.shape[1] // TILE_SIZE)
+            log(f'Изменившихся плиток {TILE_SIZE}x{TILE_SIZE}: {len(tiles)} из {total_tiles}', '[d]')
+            if not tiles:
+                return True
+
+        antialiasing_tolerance = None
+        if config.get('ANTIALIASING', 'REGRESSION'):
+            antialiasing_tolerance = self._antialiasing_tolerance
+
+        if config.get('SHIFT_DETECTION', 'REGRESSION'):
+            differing = None
+            if tiles is not None:
+                # плитки не пересекаются, поэтому это точное число отличающихся без сдвига пикселей
+                differing = sum(int(np.count_nonzero(np.any(current[top:bottom, left:right] !=
+                                                            standard[top:bottom, left:right], axis=2)))
+                                for top, bottom, left, right in tiles)
+            shift = estimate_shift(current, standard, int(config.get('MAX_SHIFT', 'REGRESSION')), differing)
+            if shift != (0, 0):
+                return self._compare_shifted(current, standard, shift, diff_name, tolerance, antialiasing_tolerance,
+                                             allowed, features, comparator)
+
+        # сравнение 2 не равных по размеру
+        if current.shape != standard.shape:
+            diff_image_by_size(current, standard, partial(comparator.diff_mask, tolerance=tolerance),
+                               features).save(diff_name)
+            return False
+
+        # при допуске достаточно найти allowed + 1 отличие, полная маска строится только при падении.
+        # При fail_fast ищем на одно отличие больше: если оно нашлось, обход действительно остановлен
+        limit = allowed + fail_fast + 1 if fail_fast else (allowed + 1 if allowed else None)
+        mask = comparator.diff_mask(current, standard, tolerance, antialiasing_tolerance, tiles, limit, features)
+        found = int(np.count_nonzero(mask))
+        if self._within_budget(found, allowed):
+            return True
+
+        if fail_fast and found >= limit:
+            mask = truncate_mask(mask, limit - 1)
+            self._diff_description = self._fail_fast_description(limit - 1)
+        elif not fail_fast and limit is not None:
+            mask = comparator.diff_mask(current, standard, tolerance, antialiasing_tolerance, tiles,
+                                        features=features)
+            self._within_budget(int(np.count_nonzero(mask)), allowed)
+        self._save_diff(highlight_diff(standard, mask), mask, diff_name)
+        return False
+
+    def _compare_shifted(self, current, standard, shift, diff_name: str, tolerance: float,
+                         antialiasing_tolerance: Optional[float], allowed: int = 0,
+                         features: Optional[ReferenceFeatures] = None, comparator: Optional[Comparator] = None
+                         ) -> bool:
+        """Сравнение со сдвигом содержимого, отличия ищутся только в совмещённой части
+
+        Всё, что в текущем изображении не попало в совмещённую часть, считается изменённым
+        """
+
+        current_box, standard_box = overlap(current.shape, standard.shape, shift)
+        mask = np.ones(current.shape[:2], dtype=bool)
+        if features is not None:
+            features = features.crop(standard_box)
+        comparator = comparator or get_comparator()
+        mask[current_box] = comparator.diff_mask(current[current_box], standard[standard_box], tolerance,
+                                                 antialiasing_tolerance, features=features)
+        if self._within_budget(int(np.count_nonzero(mask)), allowed):
+            return True
+        height, width = mask.shape
+        residual = diff_regions(mask, self._diff_area_border(width, height))
+        self._diff_description = f'Содержимое сдвинуто на {shift[0]} px по горизонтали и {shift[1]} px ' \
+                                 f'по вертикали, остаточные области отличий [x0, y0, x1, y1]: {residual}'
+        log(self._diff_description)
+        self._save_diff(highlight_diff(current, mask), mask, diff_name)
+        return False
+
+    def _save_diff(self, diff_image: Image, mask, diff_name: str):
+        """Сохраняем изображение с отличиями, при HIGHLIGHT_DIFF с выделением областей"""
+
+        if config.get('HIGHLIGHT_DIFF', 'REGRESSION'):
+            height, width = mask.shape
+            diff_area = diff_regions(mask, self._diff_area_border(width, height))
+            diff_image = Image.alpha_composite(diff_image, self.draw_diff_mask(width, height, diff_area))
+        diff_image.save(diff_name)
+
+    @staticmethod
+    def _diff_area_border(width: int, height: int) -> int:
+        """Радиус объединения отличий в области"""
+
+        return int(config.get('DIFF_AREA_BORDER', 'REGRESSION') or 0) or max(max(width, height) // 100, 10)
+
+    # noinspection PyUnresolvedReferences
+    def _compare_by_pixel_python(self, current_image: Image, standard_image: Image, diff_name: str,
+                                 tolerance: float, fail_fast: int = 0, allowed: int = 0) -> bool:
+        """Сравнение 2 PIL.Image, эталонная реализация попиксельным обходом
+
+        :param fail_fast: остановить обход после стольких отличий сверх allowed
+        :param allowed: допустимое число отличающихся пикселей
+        """
+
+        current_bytes = io.BytesIO()
+        current_image.save(current_bytes, format="PNG")
+        standard_bytes = io.BytesIO()
+        standard_image.save(standard_bytes, format='PNG')
+
+        # equal bytes
+        if current_bytes.getvalue() == standard_bytes.getvalue():
+            return True
 
         diff_area = []
         stable_diff_area = []
 
-        highlight_color = (255, 10, 193, 255)
+        highlight_color = HIGHLIGHT_COLOR
         pixel1 = current_image.load()
         pixel2 = standard_image.load()
         width = max(standard_image.width, current_image.width)
         height = max(standard_image.height, current_image.height)
-        border = max(max(width, height) // 100, 10)
+        border = self._diff_area_border(width, height)
 
         # сравнение 2 не равных по размеру
         if standard_image.width != current_image.width or standard_image.height != current_image.height:
@@ -323,11 +761,16 @@ class LayoutCompare:
 
         antialiasing = config.get('ANTIALIASING', 'REGRESSION')
         diff_mask = config.get('HIGHLIGHT_DIFF', 'REGRESSION')
-        is_equal = True
+        found = 0
+        limit = allowed + fail_fast if fail_fast else None
+        # обход остановлен до конца изображения, найдены не все отличия
+        stopped = False
 
         diff_image = standard_image.copy()
         diff_pixels = diff_image.load()
         for y in range(0, height):
+            if stopped:
+                break
             for x in range(0, width):
                 c1 = pixel1[x, y]
                 c2 = pixel2[x, y]
@@ -341,7 +784,10 @@ class LayoutCompare:
                              is_aa(pixel2, x, y, width, height, pixel1)):
                     continue
                 else:
-                    is_equal = False
+                    if limit is not None and found >= limit:
+                        stopped = True
+                        break
+                    found += 1
                     diff_pixels[x, y] = highlight_color
                     if diff_mask:
                         diff_area = self.compute_diff_area(diff_area, x, y, border)
@@ -354,6 +800,9 @@ class LayoutCompare:
                 for rectangle in rectangle_collector:
                     stable_diff_area.append(rectangle)
                     diff_area.remove(rectangle)
+        is_equal = self._within_budget(found, allowed)
+        if not is_equal and stopped:
+            self._diff_description = self._fail_fast_description(found)
         if not is_equal:
             if diff_mask:
                 from PIL import Image
@@ -393,25 +842,29 @@ class LayoutCompare:
     @staticmethod
     def draw_diff_mask(width, height, diff_area):
         """
-        Отрисовка маски изображения
+        Отрисовка маски изображения одним слоем
         :param width:
         :param height:
         :param diff_area:
         :return:
         """
-        rect_size = (width, height)
-        im = Image.new("RGBA", rect_size, (0, 0, 0, 160)).convert("RGBA")
-        for i in diff_area:
-            draw = ImageDraw.Draw(im)
-            draw.rectangle([(i[0] - 5, i[1] - 5), (i[2] + 5, i[3] + 5)], outline='red', width=5)
-        for i in diff_area:
-            rect_size = (i[2] - i[0], i[3] - i[1])
-            x0 = max(i[0], 0)
-            y0 = max(i[1], 0)
-            rect_pos = (x0, y0)
-            rect = Image.new("RGBA", rect_size, (255, 255, 255, 0))
-            im.paste(rect, rect_pos)
-        return im
+
+        def fill(x0, y0, x1, y1, color):
+            """Закрашиваем [x0, x1) x [y0, y1) с обрезкой по границам маски"""
+            mask[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = color
+
+        mask = np.empty((height, width, 4), dtype=np.uint8)
+        mask[:] = (0, 0, 0, 160)
+        # рамка шириной 5 пикселей вокруг области
+        for x0, y0, x1, y1 in diff_area:
+            fill(x0 - 5, y0 - 5, x1 + 6, y0, (255, 0, 0, 255))
+            fill(x0 - 5, y1 + 1, x1 + 6, y1 + 6, (255, 0, 0, 255))
+            fill(x0 - 5, y0, x0, y1 + 1, (255, 0, 0, 255))
+            fill(x1 + 1, y0, x1 + 6, y1 + 1, (255, 0, 0, 255))
+        # сама область прозрачная
+        for x0, y0, x1, y1 in diff_area:
+            fill(max(x0, 0), max(y0, 0), max(x0, 0) + x1 - x0, max(y0, 0) + y1 - y0, (255, 255, 255, 0))
+        return Image.fromarray(mask, 'RGBA')
 
     def _capture_element(self, element, fill_rect=None, fill_element=None) -> Image:
         """Сохраняем изображение элемента
@@ -421,20 +874,508 @@ class LayoutCompare:
                          (x0 и y0 берутся относительно координат родительского элемента)
         :param fill_element: вырезаемые элементы, формат: [ element1, element2, …]
         """
-        png = create_image_from_bytes(element.screenshot_as_png())
+        png = self._crop_frame_element(element) if self._frame is not None else None
+        if png is None:
+            png = create_image_from_bytes(element.screenshot_as_png())
         fill_rect = convert_coordinates(fill_rect)
-        if fill_element:
+        by_script = config.get('FILL_BY_SCRIPT', 'REGRESSION')
+        if fill_element and by_script:
+            fill_rect.extend(self.get_fill_area_by_script(element, fill_element))
+        elif fill_element:
             coordinates = element.coordinates
             for elm in fill_element:
                 fill_rect.append(self._get_fill_area_by_element(coordinates, elm))
-        if fill_rect:
+        if fill_rect and by_script:
+            png = fill_transparent(png, fill_rect)
+        elif fill_rect:
             for i in range(len(fill_rect)):
                 rect = Image.new('RGBA', (int(fill_rect[i][2]), int(fill_rect[i][3])), (255, 255, 255, 0))
                 png.paste(rect, (fill_rect[i][0], fill_rect[i][1]))
         return png
 
+    @contextmanager
+    def mask(self, targets: Optional[List[Union[str, Element]]] = None, blank: bool = False):
+        """Скрывает элементы на странице на время снимков
+
+        Одним скриптом добавляет стиль, который скрывает элементы (visibility: hidden) или закрашивает их
+        черным (blank), и получает их прямоугольники. При выходе стиль удаляется.
+        Скрытые области пишутся в лог и в сообщение об ошибке сравнения
+
+        :param targets: css селекторы и элементы
+        :param blank: закрасить элементы, а не скрыть
+        """
+
+        targets = list(targets or [])
+        if not targets:
+            yield []
+            return
+        token = uuid.uuid4().hex
+        rects = self._driver.execute_script(
+            'var token = arguments[2];'
+            'var style = document.createElement("style");'
+            'style.id = "uatf-mask-" + token;'
+            'style.textContent = (arguments[1]'
+            '    ? "[data-uatf-mask] { background: #000 !important; border-color: #000 !important; '
+            '       color: transparent !important; box-shadow: none !important; }"'
+            '    : "[data-uatf-mask] { visibility: hidden !important; }") +'
+            '    "[data-uatf-mask] *, [data-uatf-mask]::before, [data-uatf-mask]::after '
+            '     { visibility: hidden !important; } [data-uatf-mask] { transition: none !important; }";'
+            'document.head.appendChild(style);'
+            'return arguments[0].map(function (target) {'
+            '    var elements = typeof target === "string" ? document.querySelectorAll(target) : [target];'
+            '    return Array.prototype.map.call(elements, function (element) {'
+            '        element.setAttribute("data-uatf-mask", token);'
+            '        var rect = element.getBoundingClientRect();'
+            '        return [rect.left + window.scrollX, rect.top + window.scrollY, rect.width, rect.height];'
+            '    });'
+            '});',
+            [target if isinstance(target, str) else target.webelement() for target in targets], blank, token)
+        masked = [(target, [[round(x), round(y), int(width), int(height)] for x, y, width, height in target_rects])
+                  for target, target_rects in zip(targets, rects)]
+        previous, self._masked = self._masked, self._masked + masked
+        log(f'{"Закрасили" if blank else "Скрыли"} на время снимка [x, y, width, height]: '
+            f'{self._masked_description(masked)}')
+        try:
+            yield masked
+        finally:
+            self._masked = previous
+            self._driver.execute_script(
+                'var style = document.getElementById("uatf-mask-" + arguments[0]);'
+                'if (style) { style.remove(); }'
+                'document.querySelectorAll("[data-uatf-mask=\'" + arguments[0] + "\']").forEach(function (element) {'
+                '    element.removeAttribute("data-uatf-mask");'
+                '});', token)
+
+    @staticmethod
+    def _masked_description(masked: list) -> str:
+        return ', '.join(f'{target if isinstance(target, str) else target.name_output()} {rects}'
+                         for target, rects in masked)
+
+    @contextmanager
+    def emulate(self, variant: Optional[Variant] = None):
+        """Переключает вариант снимка в текущей сессии через CDP
+
+        Размер области просмотра и устройство задаются Emulation.setDeviceMetricsOverride,
+        цветовая схема - Emulation.setEmulatedMedia. Имена эталонов внутри строятся по варианту.
+        При выходе эмуляция возвращается к настройкам запуска (CHROME_MOBILE_EMULATION)
+
+        :param variant: вариант, None - без переключения
+        """
+
+        if variant is None:
+            yield
+            return
+        metrics = self._device_metrics(variant.resolution, variant.device) \
+            if variant.resolution or variant.device else None
+        previous = self._variant, self._device_pixel_ratio
+        try:
+            if metrics:
+                self._send_cdp_cmd('Emulation.setDeviceMetricsOverride', metrics)
+                self._send_cdp_cmd('Emulation.setTouchEmulationEnabled', {'enabled': metrics['mobile']})
+                self._device_pixel_ratio = metrics['deviceScaleFactor'] if metrics['mobile'] else None
+            if variant.color_scheme:
+                self._send_cdp_cmd('Emulation.setEmulatedMedia',
+                                   {'features': [{'name': 'prefers-color-scheme', 'value': variant.color_scheme}]})
+            self._variant = variant
+            log(f'Переключили вариант снимка: {variant.label}')
+            yield variant
+        finally:
+            self._variant, self._device_pixel_ratio = previous
+            if variant.color_scheme:
+                self._send_cdp_cmd('Emulation.setEmulatedMedia', {'features': []})
+            if metrics:
+                metrics = self._device_metrics()
+                if metrics:
+                    self._send_cdp_cmd('Emulation.setDeviceMetricsOverride', metrics)
+                else:
+                    self._send_cdp_cmd('Emulation.clearDeviceMetricsOverride')
+                self._send_cdp_cmd('Emulation.setTouchEmulationEnabled', {'enabled': bool(metrics)})
+
+    @staticmethod
+    def _device_metrics(resolution: str = '', device: str = '') -> Optional[dict]:
+        """Параметры Emulation.setDeviceMetricsOverride, без устройства - устройство запуска
+
+        :return: None, если эмулировать нечего
+        """
+
+        device = device or config.get('CHROME_MOBILE_EMULATION', 'GENERAL')
+        if not resolution and not device:
+            return None
+        width = height = scale = 0
+        if device:
+            if device not in MOBILE_DEVICES:
+                raise ValueError(f'Неизвестное устройство {device}, доступны: {", ".join(MOBILE_DEVICES)}')
+            width, height, scale = MOBILE_DEVICES[device]
+        if resolution:
+            width, height = (int(size) for size in resolution.split('x'))
+        return {'width': width, 'height': height, 'deviceScaleFactor': scale, 'mobile': bool(device)}
+
+    @contextmanager
+    def freeze_animations(self):
+        """Останавливает анимации на время снимка, если включена FREEZE_ANIMATIONS
+
+        Стиль отключает transition и скрывает каретку, незавершенные transition при этом доходят
+        до конечного состояния. Анимации из document.getAnimations() (CSS и Web Animations)
+        ставятся на паузу: конечные - в конце, бесконечные - в начале. Таймлайн документа
+        останавливается через CDP, чтобы не двигались анимации, начатые во время снимка.
+        При выходе стиль удаляется, анимации возвращаются на прежнее время и продолжаются
+        """
+
+        if not config.get('FREEZE_ANIMATIONS', 'REGRESSION') or self._frame is not None or not self._driver:
+            yield
+            return
+        token = uuid.uuid4().hex
+        count = self._driver.execute_script(
+            'var token = arguments[0];'
+            'var style = document.createElement("style");'
+            'style.id = "uatf-freeze-" + token;'
+            'style.textContent = "*, *::before, *::after { transition: none !important; '
+            '    caret-color: transparent !important; }";'
+            'document.head.appendChild(style);'
+            'var frozen = [];'
+            '(document.getAnimations ? document.getAnimations() : []).forEach(function (animation) {'
+            '    var end = animation.effect ? animation.effect.getComputedTiming().endTime : Infinity;'
+            '    frozen.push([animation, animation.currentTime, animation.playState]);'
+            '    animation.pause();'
+            '    animation.currentTime = isFinite(end) ? end : 0;'
+            '});'
+            'window.__uatfFrozen = window.__uatfFrozen || {};'
+            'window.__uatfFrozen[token] = frozen;'
+            'return frozen.length;', token)
+        timeline = self._set_timeline_rate(0)
+        log(f'Остановили анимации на время снимка: {count}', '[d]')
+        try:
+            yield
+        finally:
+            if timeline:
+                self._set_timeline_rate(1)
+            self._driver.execute_script(
+                'var all = window.__uatfFrozen || {};'
+                'var frozen = all[arguments[0]] || [];'
+                'delete all[arguments[0]];'
+                'var style = document.getElementById("uatf-freeze-" + arguments[0]);'
+                'if (style) { style.remove(); }'
+                'frozen.forEach(function (item) {'
+                '    item[0].currentTime = item[1];'
+                '    if (item[2] === "running") { item[0].play(); }'
+                '});', token)
+
+    def _set_timeline_rate(self, rate: float) -> bool:
+        """Скорость таймлайна анимаций документа через CDP Animation.setPlaybackRate
+
+        :return: False, если CDP недоступен, тогда остановка таймлайна отключается до конца сессии
+        """
+
+        if not self._freeze_timeline:
+            return False
+        try:
+            self._send_cdp_cmd('Animation.setPlaybackRate', {'playbackRate': rate})
+        except Exception as error:
+            log(f'Остановка таймлайна анимаций через CDP недоступна: {error}', '[d]')
+            self._freeze_timeline = False
+            return False
+        return True
+
+    @contextmanager
+    def frame(self, elements: Optional[List[Element]] = None):
+        """Все снимки внутри берутся из одного скриншота окна
+
+        Прямоугольники элементов получаем одним вызовом скрипта до снятия скриншота,
+        снимки элементов вырезаются из общего кадра, а не снимаются каждый отдельно.
+        Элемент, который не целиком в области просмотра, снимается отдельно (_crop_frame_element)
+        """
+
+        elements = list(elements or [])
+        with self.freeze_animations():
+            self._frame_rects = dict(zip(map(id, elements), self._element_rects(elements)))
+            self._frame = self._capture_stable(self._capture_window)
+        log(f'Сделали общий снимок окна для {len(elements)} элементов', '[d]')
+        try:
+            yield self._frame
+        finally:
+            self._frame.close()
+            self._frame = None
+            self._frame_rects = {}
+
+    def _element_rects(self, elements: List[Element]) -> List[Tuple[Tuple[int, int, int, int],
+                                                                     Optional[Tuple[int, int, int, int]]]]:
+        """Прямоугольники элементов [x, y, width, height] одним вызовом скрипта
+
+        Для каждого элемента: прямоугольник в документе, округленный так же, как location и size
+        в get_bound_with_indent, и прямоугольник в области просмотра в пикселях скриншота окна,
+        как его снимает element.screenshot_as_png. При эмуляции скриншот окна уменьшен до css пикселей,
+        а снимок элемента нет, поэтому второго прямоугольника нет
+        """
+
+        if not elements:
+            return []
+        rects, scroll_x, scroll_y, pixel_ratio = self._driver.execute_script(
+            'return [arguments[0].map(function (element) {'
+            '    var rect = element.getBoundingClientRect();'
+            '    return [rect.left, rect.top, rect.width, rect.height];'
+            '}), window.scrollX, window.scrollY, window.devicePixelRatio];',
+            [element.webelement() for element in elements])
+        return [((round(x + scroll_x), round(y + scroll_y), int(width), int(height)),
+                 None if self._device_pixel_ratio else
+                 (round(x * pixel_ratio), round(y * pixel_ratio), round(width * pixel_ratio),
+                  round(height * pixel_ratio)))
+                for x, y, width, height in rects]
+
+    def _element_bound(self, element: Element, left=0, top=0, bottom=0, right=0) -> Tuple[int, int, int, int]:
+        """Границы элемента с отступом, внутри frame() из заранее полученных прямоугольников"""
+
+        rects = self._frame_rects.get(id(element))
+        if rects is None:
+            return element.get_bound_with_indent(left, top, bottom, right)
+        x, y, width, height = rects[0]
+        return x - left, y - top, width + left + right, height + top + bottom
+
+    def _crop_frame_element(self, element: Element) -> Optional[Image]:
+        """Снимок элемента из кадра frame() по его прямоугольнику в области просмотра
+
+        :return: None, если элемента нет среди элементов frame() или он не целиком в кадре,
+                 тогда элемент снимается сам, как вне frame()
+        """
+
+        rects = self._frame_rects.get(id(element))
+        if rects is None or rects[1] is None:
+            return None
+        x, y, width, height = rects[1]
+        if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > self._frame.width \
+                or y + height > self._frame.height:
+            log(f'{element.name_output()} не целиком в общем кадре, снимаем элемент отдельно', '[d]')
+            return None
+        return self._frame.crop((x, y, x + width, y + height))
+
+    def _capture_clip(self, left: int, top: int, width: int, height: int) -> Optional[tuple]:
+        """Снимок только области окна через CDP Page.captureScreenshot
+
+        Координаты в пикселях скриншота окна, как у _crop_window.
+        :return: (изображение области, размер скриншота окна) или None,
+                 если CDP недоступен или область выходит за пределы окна
+        """
+
+        if self._frame is not None or not self._clip_screenshot or not width or not height:
+            return None
+        try:
+            scroll_x, scroll_y, inner_width, inner_height, pixel_ratio = self._driver.execute_script(
+                'return [window.scrollX, window.scrollY, window.innerWidth, window.innerHeight, '
+                'window.devicePixelRatio]')
+            # при эмуляции скриншот окна уменьшается до css пикселей, иначе он в физических пикселях
+            ratio = 1 if self._device_pixel_ratio else pixel_ratio
+            window_size = (round(inner_width * ratio), round(inner_height * ratio))
+            if left < 0 or top < 0 or left + width > window_size[0] or top + height > window_size[1]:
+                return None
+            # clip задается в css пикселях относительно документа
+            clip = {'x': scroll_x + left / ratio, 'y': scroll_y + top / ratio,
+                    'width': width / ratio, 'height': height / ratio,
+                    'scale': 1 / self._device_pixel_ratio if self._device_pixel_ratio else 1}
+            result = self._send_cdp_cmd('Page.captureScreenshot', {'format': 'png', 'clip': clip})
+            image = create_image_from_bytes(base64.b64decode(result['data']))
+        except Exception as error:
+            log(f'Снимок области через CDP недоступен, снимаем окно целиком: {error}', '[d]')
+            self._clip_screenshot = False
+            return None
+        if image.size != (width, height):
+            log(f'Размер снимка области {image.size} не совпал с ожидаемым {(width, height)}, '
+                f'снимаем окно целиком', '[d]')
+            return None
+        return image, window_size
+
+    def _send_cdp_cmd(self, cmd: str, params: Optional[dict] = None):
+        """Выполнение cdp комманды, ошибка драйвера поднимается как WebDriverException"""
+
+        return send_cdp_cmd(self._driver, cmd, params)
+
+    def _capture_full_page(self, name: str, src: Optional[str] = None,
+                           features: Optional[ReferenceFeatures] = None, tolerance: float = 0, fail_fast: int = 0,
+                           max_diff_pixels: int = 0, max_diff_ratio: float = 0,
+                           comparator: Optional[Comparator] = None, diff_name: str = ''
+                           ) -> Tuple[Optional[Image], Optional[bool]]:
+        """Снимок всей страницы по ширине области просмотра, полосами сверху вниз
+
+        Полосы снимаются через CDP Page.captureScreenshot с captureBeyondViewport, если CDP недоступен -
+        прокруткой окна (position: fixed элементы тогда попадут в каждую полосу).
+        Полоса сразу сверяется с той же полосой эталона src: по хэшам плиток из sidecar или по пикселям.
+        Совпавшая полоса отбрасывается, изменившаяся сравнивается движком с полосой эталона, как только
+        снято начало следующей полосы (строки соседних полос нужны для проверки сглаживания).
+        Копии всей страницы и эталона при сравнении не создаются: полоса эталона берется из sidecar или
+        вырезается из декодированного эталона в ReferenceCache. Страница склеивается только для артефактов
+        упавшей проверки.
+
+        :return: (снимок страницы, результат): (None, True), если отличий нет или они в пределах допуска;
+                 (страница, False) - изображение с отличиями уже сохранено в diff_name;
+                 (склеенные полосы, None), если страницу нужно сравнить целиком
+        """
+
+        width, height, slices = self._page_slices()
+        standard = None
+        if features is not None and features.tiles is not None:
+            reference_size = features.index.shape[::-1]
+        elif src:
+            standard = ReferenceCache().get(src)
+            reference_size = standard.size
+        comparator = comparator or get_comparator()
+        by_slices = bool(src) and tuple(reference_size) == (width, height) and comparator.name != 'python'
+        if not by_slices:
+            page = Image.new('RGBA', (width, height))
+            count = 0
+            for top, image in slices:
+                count += 1
+                page.paste(image, (0, top))
+                image.close()
+            log(f'Сделали снимок всей страницы {width}x{height} c именем {name}, полос: {count}, '
+                f'сравниваем страницу целиком')
+            return page, None
+
+        def band(top: int, bottom: int) -> np.ndarray:
+            """Полоса эталона RGBA"""
+
+            if features is not None:
+                return features.palette[features.index[top:bottom]]
+            return image_to_array(standard.crop((0, top, width, bottom)))
+
+        antialiasing_tolerance = self._antialiasing_tolerance if config.get('ANTIALIASING', 'REGRESSION') else None
+        allowed = self._allowed_diff(width, height, max_diff_pixels, max_diff_ratio)
+        # как в _compare_by_pixel_numpy: при fail_fast ищем на одно отличие больше допустимого
+        limit = allowed + fail_fast + 1 if fail_fast else None
+        found = 0
+        # изменившиеся полосы (отступ сверху, снимок полосы, маска отличий или None после остановки fail_fast)
+        changed = []
+
+        def compare_slice(top: int, current: np.ndarray, above: Optional[np.ndarray], below: Optional[np.ndarray]):
+            nonlocal found
+            if limit is not None and found >= limit:
+                changed.append((top, Image.fromarray(current, 'RGBA'), None))
+                return
+            rows = [rows for rows in (above, current, below) if rows is not None]
+            start = top - (len(above) if above is not None else 0)
+            context = np.concatenate(rows) if len(rows) > 1 else current
+            box = np.s_[start:start + len(context)]
+            mask = comparator.diff_mask(context, band(start, start + len(context)), tolerance, antialiasing_tolerance,
+                                        features=features.crop(box) if features is not None else None)
+            mask = mask[top - start:top - start + len(current)]
+            found += int(np.count_nonzero(mask))
+            if limit is not None and found >= limit:
+                mask = truncate_mask(mask, int(np.count_nonzero(mask)) - (found - limit + 1))
+                found = limit
+            changed.append((top, Image.fromarray(current, 'RGBA'), mask))
+
+        count = 0
+        # изменившаяся полоса ждет начала следующей: (отступ сверху, полоса, конец предыдущей полосы)
+        pending = None
+        tail = None
+        for top, image in slices:
+            count += 1
+            current = image_to_array(image)
+            image.close()
+            if pending:
+                compare_slice(*pending, current[:PAGE_SLICE_CONTEXT])
+            if features is not None and features.tiles is not None:
+                row = top // TILE_SIZE
+                hashes = tile_hashes(current)
+                matches = np.array_equal(hashes, features.tiles[row:row + hashes.shape[0]])
+            else:
+                matches = np.array_equal(current, band(top, top + current.shape[0]))
+            pending = None if matches else (top, current, tail)
+            tail = current[-PAGE_SLICE_CONTEXT:]
+        if pending:
+            compare_slice(*pending, None)
+        log(f'Сделали снимок всей страницы {width}x{height} c именем {name}, полос: {count}, '
+            f'отличаются от эталона: {len(changed)}')
+
+        stopped = limit is not None and found >= limit
+        if stopped:
+            found -= 1
+        if self._within_budget(found, allowed):
+            for _, image, _ in changed:
+                image.close()
+            return None, True
+        if stopped:
+            self._diff_description = self._fail_fast_description(found)
+
+        def reference_page() -> Image:
+            page = Image.new('RGBA', (width, height))
+            for top in range(0, height, PAGE_SLICE_HEIGHT):
+                page.paste(Image.fromarray(band(top, min(top + PAGE_SLICE_HEIGHT, height)), 'RGBA'), (0, top))
+            return page
+
+        diff_image = reference_page()
+        diff_mask = np.zeros((height, width), dtype=bool)
+        for top, image, mask in changed:
+            if mask is not None:
+                diff_mask[top:top + image.height] = mask
+                diff_image.paste(highlight_diff(band(top, top + image.height), mask), (0, top))
+        self._save_diff(diff_image, diff_mask, diff_name)
+        diff_image.close()
+
+        page = reference_page()
+        for top, image, _ in changed:
+            page.paste(image, (0, top))
+            image.close()
+        return page, False
+
+    def _page_slices(self) -> Tuple[int, int, Iterator[Tuple[int, Image]]]:
+        """Размер страницы в пикселях снимка и генератор полос (отступ сверху, изображение полосы)
+
+        Отступы полос кратны TILE_SIZE, поэтому плитки полосы совпадают с плитками всей страницы
+        """
+
+        client_width, scroll_height, inner_height, scroll_x, scroll_y, pixel_ratio = self._driver.execute_script(
+            'return [document.documentElement.clientWidth, document.documentElement.scrollHeight, '
+            'window.innerHeight, window.scrollX, window.scrollY, window.devicePixelRatio]')
+        # как в _capture_clip: при эмуляции снимок в css пикселях, иначе в физических
+        ratio = 1 if self._device_pixel_ratio else pixel_ratio
+        width, height = round(client_width * ratio), round(scroll_height * ratio)
+        window_height = max(round(inner_height * ratio) // TILE_SIZE * TILE_SIZE, TILE_SIZE)
+
+        def slices():
+            top = 0
+            try:
+                while top < height:
+                    image = self._page_slice(top, min(PAGE_SLICE_HEIGHT, height - top), width, ratio)
+                    if image is None:
+                        image = self._capture_stable(partial(self._scroll_slice, top,
+                                                             min(window_height, height - top), width, ratio))
+                    yield top, image
+                    top += image.height
+            finally:
+                self._driver.execute_script('window.scrollTo(arguments[0], arguments[1])', scroll_x, scroll_y)
+
+        return width, height, slices()
+
+    def _page_slice(self, top: int, height: int, width: int, ratio: float) -> Optional[Image]:
+        """Полоса страницы через CDP captureBeyondViewport, None если CDP недоступен"""
+
+        if not self._full_page_cdp:
+            return None
+        clip = {'x': 0, 'y': top / ratio, 'width': width / ratio, 'height': height / ratio,
+                'scale': 1 / self._device_pixel_ratio if self._device_pixel_ratio else 1}
+        try:
+            image = self._capture_stable(lambda: create_image_from_bytes(base64.b64decode(self._send_cdp_cmd(
+                'Page.captureScreenshot', {'format': 'png', 'clip': clip, 'captureBeyondViewport': True})['data'])))
+        except Exception as error:
+            log(f'Снимок страницы через CDP недоступен, снимаем прокруткой окна: {error}', '[d]')
+            self._full_page_cdp = False
+            return None
+        # при дробном devicePixelRatio размер может отличаться на пиксель
+        return image if image.size == (width, height) else image.crop((0, 0, width, height))
+
+    def _scroll_slice(self, top: int, height: int, width: int, ratio: float) -> Image:
+        """Полоса страницы из снимка окна, прокрученного к ней"""
+
+        scroll_y = self._driver.execute_script('window.scrollTo(window.scrollX, arguments[0]); return window.scrollY',
+                                               top / ratio)
+        window = self._capture_window()
+        offset = top - round(scroll_y * ratio)
+        image = window.crop((0, offset, width, offset + height))
+        window.close()
+        return image
+
     def _capture_window(self) -> Image:
         """Сохраняем скрин Окна"""
+        if self._frame is not None:
+            return self._frame.copy()
         return create_image_from_bytes(self._driver.get_screenshot_as_png(),
                                        device_pixel_ratio=self._device_pixel_ratio)
 
@@ -445,12 +1386,15 @@ class LayoutCompare:
         if suite_name:
             suite_name = convert_regression_suite_name(suite_name)
 
-        resolution = config.get('BROWSER_RESOLUTION', 'GENERAL')
-        theme = config.get('REGRESSION_THEME', 'REGRESSION')
+        variant = self._variant or Variant()
+        resolution = variant.resolution or config.get('BROWSER_RESOLUTION', 'GENERAL')
+        theme = variant.theme or variant.color_scheme or config.get('REGRESSION_THEME', 'REGRESSION')
         prefix = "" if not theme else f'_{theme}'
         if resolution:
             resolution = resolution.replace('x', '_')
             prefix = f'{prefix}_{resolution}'
+        if variant.device:
+            prefix = f'{prefix}_{variant.device.replace(" ", "_")}'
 
         if config.get('GENERATE_IMAGE', 'REGRESSION'):
             if suite_name:
@@ -471,16 +1415,68 @@ class LayoutCompare:
         if not os.path.isdir(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
 
-    def _copy_standard_image(self, name):
-        """Копируем скрин из папки с эталонами в папку с отчетом"""
+    def _get_standard_path(self, name):
+        """Путь до эталона в папке с эталонами"""
 
-        src = name.replace(self._report_dir, self._standard_dir).replace('~cur', '')
+        src = self._reference_path(name)
 
-        if not os.path.exists(src):
+        if not os.path.exists(src) and not ReferenceStore().digest(src):
             raise FileNotFoundError(f'Не найден эталон для сравнения: {src}')
             # раньше было так
             # empty = Image.new('RGB', (400, 400))
             # empty.save(src)
+        return src
+
+    def _reference_path(self, name: str) -> str:
+        """Путь до эталона для снимка name из папки отчета, существование эталона не проверяется"""
+
+        return name.replace(self._report_dir, self._standard_dir).replace('~cur', '')
+
+    def _copy_standard_image(self, name):
+        """Кладем эталон в папку с отчетом жесткой ссылкой, а не копией"""
+
+        src = self._get_standard_path(name)
         dst = name.replace('~cur', '~ref')
-        shutil.copyfile(src, dst)
+        if os.path.exists(src):
+            link_file(src, dst)
+        else:
+            ReferenceStore().link(src, dst, os.path.join(self._report_dir, '.objects'))
         return src
+
+    @staticmethod
+    def _save_standard_image(image: Image, name: str, data: Optional[bytes] = None, sidecar: bool = False):
+        """Сохраняем новый эталон, при REFERENCE_STORE - в хранилище, при REFERENCE_SIDECARS - и его sidecar
+
+        :param data: готовые байты png изображения, чтобы не сжимать его заново
+        :param sidecar: записать sidecar и без REFERENCE_SIDECARS
+        """
+
+        store = ReferenceStore()
+        if not store.enabled:
+            # ~ref в отчетах - жесткие ссылки на эталон, поэтому файл заменяется новым, а не перезаписывается
+            tmp = f'{name}.{os.getpid()}.tmp'
+            if data is None:
+                image.save(tmp, format='PNG')
+            else:
+                with open(tmp, 'wb') as file:
+                    file.write(data)
+            os.replace(tmp, name)
+        else:
+            if data is None:
+                store.put_image(name, image)
+            else:
+                store.put(name, data)
+            # эталон в папке приоритетнее хранилища, старый файл больше не нужен
+            if os.path.exists(name):
+                os.remove(name)
+        if sidecar or config.get('REFERENCE_SIDECARS', 'REGRESSION'):
+            write_sidecar(name, image)
+
+    @staticmethod
+    def _load_features(src: str, comparator: Optional[str] = None) -> Optional[ReferenceFeatures]:
+        """Признаки эталона из sidecar, если их использует движок сравнения"""
+
+        engine = get_comparator(comparator)
+        if not config.get('REFERENCE_SIDECARS', 'REGRESSION') or not engine.uses_features:
+            return None
+        return load_features(src, lab=engine.uses_lab)
@@ -0,0 +1,323 @@
+"""Векторизованное попиксельное сравнение изображений (numpy)"""
+import hashlib
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .antialiasing import AntialiasingDetector
+from ...logfactory import log
+
+if TYPE_CHECKING:
+    from .sidecar import ReferenceFeatures
+
+HIGHLIGHT_COLOR = (255, 10, 193, 255)
+# размер стороны плитки, на которые разбивается кадр для поиска изменившихся участков
+TILE_SIZE = 64
+# для проверки сглаживания нужны соседи соседей пикселя
+AA_MARGIN = 2
+# при ограничении числа отличий плитки проверяются пачками такого размера
+LIMIT_BATCH_TILES = 16
+# сторона блока нижнего уровня пирамиды отличий: 8 байт маски читаются как одно uint64
+PYRAMID_BLOCK = 8
+# во сколько раз блок верхнего уровня пирамиды больше нижнего
+PYRAMID_FACTOR = TILE_SIZE // PYRAMID_BLOCK
+
+Box = Tuple[int, int, int, int]
+
+
+def image_to_array(image: Image) -> np.ndarray:
+    """Преобразуем PIL.Image в массив RGBA формы (height, width, 4)"""
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    return np.asarray(image)
+
+
+def tile_hashes(image: np.ndarray, tile_size: int = TILE_SIZE) -> np.ndarray:
+    """Хэши сырых байт каждой плитки изображения, массив формы (rows, cols)"""
+
+    height, width = image.shape[:2]
+    rows = range(0, height, tile_size)
+    cols = range(0, width, tile_size)
+    hashes = np.empty((len(rows), len(cols)), dtype='S16')
+    for row, top in enumerate(rows):
+        for col, left in enumerate(cols):
+            tile = image[top:top + tile_size, left:left + tile_size]
+            hashes[row, col] = hashlib.blake2b(tile.tobytes(), digest_size=16).digest()
+    return hashes
+
+
+def changed_tiles(current: np.ndarray, standard: np.ndarray, tile_size: int = TILE_SIZE,
+                  standard_hashes: Optional[np.ndarray] = None) -> List[Box]:
+    """Плитки (top, bottom, left, right), сырые байты которых различаются
+
+    :param standard_hashes: уже посчитанные хэши плиток эталона
+    """
+
+    height, width = current.shape[:2]
+    if standard_hashes is None:
+        standard_hashes = tile_hashes(standard, tile_size)
+    rows, cols = np.nonzero(tile_hashes(current, tile_size) != standard_hashes)
+    return [(int(row) * tile_size, min((int(row) + 1) * tile_size, height),
+             int(col) * tile_size, min((int(col) + 1) * tile_size, width)) for row, col in zip(rows, cols)]
+
+
+def diff_pyramid(current: np.ndarray, standard: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Пирамида отличий (нижний уровень, верхний уровень)
+
+    Нижний уровень - блоки PYRAMID_BLOCK, в которых отличается хоть один пиксель, верхний - max-pooling
+    нижнего блоками PYRAMID_FACTOR. Порог нулевой, поэтому неотмеченный блок точно совпадает с эталоном.
+    Пирамида строится по отличиям, а не по уменьшенным изображениям: усреднение может скрыть отличие
+    """
+
+    height, width = current.shape[:2]
+    cell = PYRAMID_BLOCK * PYRAMID_FACTOR
+    changed = np.zeros((-(-height // cell) * cell, -(-width // cell) * cell), dtype=bool)
+    np.not_equal(current.view(np.uint32)[..., 0], standard.view(np.uint32)[..., 0], out=changed[:height, :width])
+    rows = changed.view(np.uint64).reshape(changed.shape[0] // PYRAMID_BLOCK, PYRAMID_BLOCK, -1)
+    fine = np.bitwise_or.reduce(rows, axis=1) != 0
+    coarse = fine.reshape(fine.shape[0] // PYRAMID_FACTOR, PYRAMID_FACTOR,
+                          fine.shape[1] // PYRAMID_FACTOR, PYRAMID_FACTOR).any(axis=(1, 3))
+    return fine, coarse
+
+
+def pyramid_tiles(current: np.ndarray, standard: np.ndarray) -> List[Box]:
+    """Участки (top, bottom, left, right) для попиксельного сравнения, найденные по пирамиде отличий
+
+    Для каждого блока верхнего уровня с отличиями берется рамка отмеченных блоков нижнего уровня внутри него
+    """
+
+    height, width = current.shape[:2]
+    fine, coarse = diff_pyramid(current, standard)
+    rows, cols = np.nonzero(coarse)
+    if not len(rows):
+        return []
+    cells = fine.reshape(coarse.shape[0], PYRAMID_FACTOR, coarse.shape[1], PYRAMID_FACTOR)[rows, :, cols]
+    in_rows, in_cols = cells.any(axis=2), cells.any(axis=1)
+    tops = (rows * PYRAMID_FACTOR + in_rows.argmax(axis=1)) * PYRAMID_BLOCK
+    bottoms = (rows * PYRAMID_FACTOR + PYRAMID_FACTOR - in_rows[:, ::-1].argmax(axis=1)) * PYRAMID_BLOCK
+    lefts = (cols * PYRAMID_FACTOR + in_cols.argmax(axis=1)) * PYRAMID_BLOCK
+    rights = (cols * PYRAMID_FACTOR + PYRAMID_FACTOR - in_cols[:, ::-1].argmax(axis=1)) * PYRAMID_BLOCK
+    return [(int(top), min(int(bottom), height), int(left), min(int(right), width))
+            for top, bottom, left, right in zip(tops, bottoms, lefts, rights)]
+
+
+def diff_mask(current: np.ndarray, standard: np.ndarray, equal_func: Callable, tolerance: float,
+              antialiasing_tolerance: Optional[float] = None, tiles: Optional[List[Box]] = None,
+              limit: Optional[int] = None, features: Optional['ReferenceFeatures'] = None) -> np.ndarray:
+    """Маска пикселей, которые отличаются больше допустимого
+
+    Анализируются только изменившиеся плитки, в остальных байты совпадают
+
+    :param current: текущее изображение RGBA
+    :param standard: эталонное изображение RGBA того же размера
+    :param equal_func: векторизованная функция разницы цветов
+    :param tolerance: максимально допустимая разница между цветами
+    :param antialiasing_tolerance: максимальная разница для запуска проверки сглаживания,
+                                   None если проверка выключена
+    :param tiles: изменившиеся плитки, если уже посчитаны
+    :param limit: остановиться, как только найдено limit отличающихся пикселей,
+                  в маске тогда ровно limit пикселей (см. truncate_mask)
+    :param features: предрасчитанные Lab и яркость эталона из sidecar
+    """
+
+    if tiles is None:
+        tiles = changed_tiles(current, standard)
+    mask = np.zeros(current.shape[:2], dtype=bool)
+    if limit is None:
+        _mark_diff(mask, current, standard, tiles, equal_func, tolerance, antialiasing_tolerance, features)
+        return mask
+
+    found = 0
+    for start in range(0, len(tiles), LIMIT_BATCH_TILES):
+        batch = tiles[start:start + LIMIT_BATCH_TILES]
+        found += _mark_diff(mask, current, standard, batch, equal_func, tolerance, antialiasing_tolerance, features)
+        if found >= limit:
+            return truncate_mask(mask, limit)
+    return mask
+
+
+def truncate_mask(mask: np.ndarray, limit: int) -> np.ndarray:
+    """Оставляет в маске первые limit отличий построчно по всей маске, остальные снимаются"""
+
+    ys, xs = np.nonzero(mask)
+    mask[ys[limit:], xs[limit:]] = False
+    return mask
+
+
+def _mark_diff(mask: np.ndarray, current: np.ndarray, standard: np.ndarray, tiles: List[Box],
+               equal_func: Callable, tolerance: float, antialiasing_tolerance: Optional[float],
+               features: Optional['ReferenceFeatures'] = None) -> int:
+    """Отмечает в mask отличающиеся пиксели плиток tiles, возвращает их число"""
+
+    rows, cols = [], []
+    for top, bottom, left, right in tiles:
+        tile = np.any(current[top:bottom, left:right] != standard[top:bottom, left:right], axis=2)
+        mask[top:bottom, left:right] = tile
+        tile_ys, tile_xs = np.nonzero(tile)
+        rows.append(tile_ys + top)
+        cols.append(tile_xs + left)
+    if not tiles:
+        return 0
+    ys, xs = np.concatenate(rows), np.concatenate(cols)
+    if not len(ys):
+        return 0
+
+    lab2 = features.lab_at(ys, xs) if features is not None and features.lab is not None else None
+    delta = pairs_delta(equal_func, current[ys, xs], standard[ys, xs], lab2)
+    # NaN не проходит сравнение и, как и раньше, считается отличием
+    passed = delta < tolerance
+    if antialiasing_tolerance is not None:
+        check_aa = np.flatnonzero(~passed & (delta < antialiasing_tolerance))
+        if len(check_aa):
+            passed[check_aa] = _detect_antialiasing(current, standard, tiles, xs[check_aa], ys[check_aa], features)
+    mask[ys[passed], xs[passed]] = False
+    return len(ys) - int(np.count_nonzero(passed))
+
+
+def pairs_delta(equal_func: Callable, colors1: np.ndarray, colors2: np.ndarray,
+                lab2: Optional[np.ndarray] = None) -> np.ndarray:
+    """Разница цветов, посчитанная один раз для каждой уникальной пары (цвет1, цвет2)
+
+    :param lab2: Lab цветов colors2, если уже посчитан
+    """
+
+    keys = (colors1.view(np.uint32).astype(np.uint64) << 32) | colors2.view(np.uint32)
+    pairs, first, inverse = np.unique(keys.reshape(-1), return_index=True, return_inverse=True)
+    log(f'Пикселей с отличиями: {len(keys)}, уникальных пар цветов: {len(pairs)}, '
+        f'повторное использование разницы: {1 - len(pairs) / len(keys):.1%}', '[d]')
+    if lab2 is None:
+        return equal_func(colors1[first], colors2[first])[inverse.reshape(-1)]
+    return equal_func(colors1[first], colors2[first], lab2=lab2[first])[inverse.reshape(-1)]
+
+
+def _detect_antialiasing(current: np.ndarray, standard: np.ndarray, tiles: List[Box],
+                         xs: np.ndarray, ys: np.ndarray, features: Optional['ReferenceFeatures'] = None
+                         ) -> np.ndarray:
+    """Проверка сглаживания кандидатов по плиткам, плитка берется с запасом AA_MARGIN"""
+
+    height, width = current.shape[:2]
+    owner = np.full((height, width), -1, dtype=np.int32)
+    for index, (top, bottom, left, right) in enumerate(tiles):
+        owner[top:bottom, left:right] = index
+    owners = owner[ys, xs]
+
+    result = np.zeros(len(xs), dtype=bool)
+    for index in np.unique(owners):
+        top, bottom, left, right = tiles[index]
+        aa_top, aa_left = max(top - AA_MARGIN, 0), max(left - AA_MARGIN, 0)
+        aa_box = np.s_[aa_top:min(bottom + AA_MARGIN, height), aa_left:min(right + AA_MARGIN, width)]
+        luma = features.luma_plane(aa_box) if features is not None else None
+        detector = AntialiasingDetector(current[aa_box], standard[aa_box], luma)
+        inside = owners == index
+        result[inside] = detector.detect(xs[inside] - aa_left, ys[inside] - aa_top)
+    return result
+
+
+def diff_image_by_size(current: np.ndarray, standard: np.ndarray, mask_func: Callable,
+                       features: Optional['ReferenceFeatures'] = None) -> Image:
+    """Изображение с разницей когда не совпадают размеры
+
+    Всё, что выходит за пределы меньшего изображения, подсвечивается,
+    в общей части отличающиеся пиксели подсвечиваются, остальные берутся из текущего
+
+    :param mask_func: маска отличий общей части, mask_func(current, standard, features=features)
+    """
+
+    height = max(current.shape[0], standard.shape[0])
+    width = max(current.shape[1], standard.shape[1])
+    min_height = min(current.shape[0], standard.shape[0])
+    min_width = min(current.shape[1], standard.shape[1])
+
+    diff = np.empty((height, width, 4), dtype=np.uint8)
+    diff[:] = HIGHLIGHT_COLOR
+    common_current = current[:min_height, :min_width]
+    common_standard = standard[:min_height, :min_width]
+    if features is not None:
+        features = features.crop(np.s_[:min_height, :min_width])
+    mask = mask_func(common_current, common_standard, features=features)
+    diff[:min_height, :min_width] = np.where(mask[..., None], HIGHLIGHT_COLOR, common_current)
+    return Image.fromarray(diff, 'RGBA')
+
+
+def highlight_diff(standard: np.ndarray, mask: np.ndarray) -> Image:
+    """Эталонное изображение с подсвеченными отличающимися пикселями"""
+
+    diff = standard.copy()
+    diff[mask] = HIGHLIGHT_COLOR
+    return Image.fromarray(diff, 'RGBA')
+
+
+def dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    """Расширение маски квадратом со стороной 2 * radius + 1"""
+
+    if radius <= 0:
+        return mask.copy()
+    for axis in (0, 1):
+        moved = np.moveaxis(mask, axis, -1)
+        # число отмеченных пикселей в окне считаем через накопленную сумму
+        count = np.cumsum(np.pad(moved, [(0, 0), (radius + 1, radius)]), axis=-1, dtype=np.int32)
+        mask = np.moveaxis(count[:, 2 * radius + 1:] > count[:, :-2 * radius - 1], -1, axis)
+    return mask
+
+
+def diff_regions(mask: np.ndarray, border: int) -> List[List[int]]:
+    """Области изменений [x0, y0, x1, y1] по маске отличающихся пикселей
+
+    Каждый отличающийся пиксель даёт область +-border, пересекающиеся области объединяются.
+    Пересечение областей равносильно касанию масок, расширенных на border - 1,
+    поэтому связные компоненты расширенной маски ищутся объединением отрезков строк (union-find)
+    """
+
+    ys, xs = np.nonzero(mask)
+    if not len(ys):
+        return []
+
+    # работаем только в пределах отличий, расширенных на радиус
+    radius = border - 1
+    top, left = max(int(ys.min()) - radius, 0), max(int(xs.min()) - radius, 0)
+    bottom, right = int(ys.max()) + radius + 1, int(xs.max()) + radius + 1
+    dilated = dilate(mask[top:bottom, left:right], radius)
+
+    # отрезки строк расширенной маски [start, end)
+    edges = np.diff(np.pad(dilated, [(0, 0), (1, 1)]).astype(np.int8), axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    run_ends = np.nonzero(edges == -1)[1]
+
+    parent = list(range(len(run_rows)))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    row_bounds = np.searchsorted(run_rows, np.arange(dilated.shape[0] + 1))
+    for row in range(1, dilated.shape[0]):
+        prev, prev_end = int(row_bounds[row - 1]), int(row_bounds[row])
+        cur, cur_end = prev_end, int(row_bounds[row + 1])
+        # соседние строки, отрезки связаны по 8-связности
+        while prev < prev_end and cur < cur_end:
+            if run_starts[prev] <= run_ends[cur] and run_starts[cur] <= run_ends[prev]:
+                parent[find(cur)] = find(prev)
+            if run_ends[prev] < run_ends[cur]:
+                prev += 1
+            else:
+                cur += 1
+
+    # компонента каждого отличающегося пикселя по отрезку, в который он попал
+    width = dilated.shape[1] + 1
+    runs = np.searchsorted(run_rows * width + run_starts, (ys - top) * width + xs - left, side='right') - 1
+    components = np.array([find(run) for run in range(len(parent))])[runs]
+    labels, components = np.unique(components, return_inverse=True)
+    components = components.reshape(-1)
+
+    bounds = np.empty((len(labels), 4), dtype=np.int64)
+    bounds[:, :2] = np.iinfo(np.int64).max
+    bounds[:, 2:] = np.iinfo(np.int64).min
+    np.minimum.at(bounds[:, 0], components, xs)
+    np.minimum.at(bounds[:, 1], components, ys)
+    np.maximum.at(bounds[:, 2], components, xs)
+    np.maximum.at(bounds[:, 3], components, ys)
+    return [[x0 - border, y0 - border, x1 + border, y1 + border] for x0, y0, x1, y1 in bounds.tolist()]
@@ -0,0 +1,143 @@
+"""Перенос текущих снимков упавших тестов верстки в эталоны без запуска браузера
+
+Снимки берутся из отчета artifact/result.db (ResultBDLayout, cur_path), эталон для снимка - тот же путь,
+что строит LayoutCompare._get_standard_path. Эталоны с теми же пикселями не перезаписываются,
+при REFERENCE_STORE эталоны кладутся в хранилище, sidecar пересчитывается, если он был или включен
+REFERENCE_SIDECARS. Запускается из папки с config.ini, в которой запускались тесты:
+
+    layout_rebaseline --suite 'RegressionMenu*' --test 'test_01*' --path '*/header/*' --processes 8
+"""
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .main import LayoutCompare, create_image_from_bytes
+from .pixel_diff import image_to_array
+from .reference_store import ReferenceStore
+from .sidecar import sidecar_path
+from ...logfactory import log
+from ...report.db.db_model_layout import ResultBDLayout
+
+UPDATED, UNCHANGED, MISSING, FAILED = 'обновлено', 'без изменений', 'нет снимка', 'ошибка'
+RESULT_DB = os.path.join('artifact', 'result.db')
+
+
+def select_checks(rows: List[tuple], suites: Optional[List[str]] = None, tests: Optional[List[str]] = None,
+                  paths: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """Пары (текущий снимок, эталон) из строк отчета, подходящие под шаблоны
+
+    :param rows: строки (suite_name, test_name, cur_path), ResultBDLayout.get_current_images
+    :param suites: шаблоны fnmatch имени сюита
+    :param tests: шаблоны fnmatch имени теста
+    :param paths: шаблоны fnmatch пути эталона относительно IMAGE_DIR
+    """
+
+    layout = LayoutCompare(None)
+    store = ReferenceStore()
+    checks = {}
+    for suite_name, test_name, cur_path in rows:
+        if not cur_path:
+            continue
+        if suites and not any(fnmatch(suite_name, pattern) for pattern in suites):
+            continue
+        if tests and not any(fnmatch(test_name, pattern) for pattern in tests):
+            continue
+        src = layout._reference_path(cur_path)
+        if paths and not any(fnmatch(store.logical_path(src), pattern) for pattern in paths):
+            continue
+        checks[src] = cur_path
+    return [(cur_path, src) for src, cur_path in checks.items()]
+
+
+def has_layout_results(path: str = RESULT_DB) -> bool:
+    """Есть ли в отчете таблица test_results
+
+    Файл открывается только на чтение: ResultBDLayout на его месте создал бы пустой отчет
+    """
+
+    if not os.path.isfile(path):
+        return False
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=10)
+        try:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'test_results'"
+                                ).fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def _read_reference(src: str) -> Optional[Image.Image]:
+    if os.path.exists(src):
+        with Image.open(src) as image:
+            image.load()
+        return image
+    digest = ReferenceStore().digest(src)
+    return ReferenceStore().read_image(digest) if digest else None
+
+
+def promote(cur_path: str, src: str) -> Tuple[str, str]:
+    """Делаем текущий снимок эталоном, возвращает (результат, эталон или ошибка)"""
+
+    if not os.path.exists(cur_path):
+        return MISSING, cur_path
+    try:
+        with open(cur_path, 'rb') as file:
+            data = file.read()
+        image = create_image_from_bytes(data)
+        image.load()
+        reference = _read_reference(src)
+        if reference is not None and np.array_equal(image_to_array(reference), image_to_array(image)):
+            return UNCHANGED, src
+        # sidecar эталона после перезаписи устареет, пересчитываем его сразу
+        had_sidecar = reference is not None and os.path.exists(sidecar_path(src)[0])
+        os.makedirs(os.path.dirname(src), exist_ok=True)
+        LayoutCompare._save_standard_image(image, src, data, sidecar=had_sidecar)  # pylint: disable=protected-access
+        return UPDATED, src
+    except Exception as error:
+        return FAILED, f'{src}: {error}'
+
+
+def main():
+    """Точка входа layout_rebaseline"""
+
+    parser = argparse.ArgumentParser(description='Перенос текущих снимков упавших тестов верстки в эталоны')
+    parser.add_argument('--suite', nargs='+', help='шаблоны имени сюита, например RegressionMenu*')
+    parser.add_argument('--test', nargs='+', help='шаблоны имени теста')
+    parser.add_argument('--path', nargs='+', help='шаблоны пути эталона относительно IMAGE_DIR')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='число процессов')
+    parser.add_argument('--dry-run', action='store_true', help='только показать, какие эталоны будут обновлены')
+    # остальные аргументы (например --IMAGE_DIR) разбирает Config
+    options, _ = parser.parse_known_args()
+    if not has_layout_results():
+        parser.error(f'не найден отчет тестов верстки {RESULT_DB} (таблица test_results), '
+                     f'запустите из папки, в которой запускались тесты')
+
+    checks = select_checks(ResultBDLayout().get_current_images(), options.suite, options.test, options.path)
+    if options.dry_run:
+        for cur_path, src in checks:
+            log(f'{cur_path} -> {src}')
+        log(f'Будет перенесено снимков: {len(checks)}')
+        return
+
+    results = {UPDATED: [], UNCHANGED: [], MISSING: [], FAILED: []}
+    if checks:
+        cur_paths, sources = zip(*checks)
+        with ProcessPoolExecutor(max_workers=max(options.processes, 1)) as executor:
+            for status, detail in executor.map(promote, cur_paths, sources, chunksize=16):
+                results[status].append(detail)
+    for status in (MISSING, FAILED):
+        for detail in results[status]:
+            log(f'{status}: {detail}', '[e]')
+    log(f'Снимков: {len(checks)}, ' + ', '.join(f'{status}: {len(items)}' for status, items in results.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Кэш декодированных эталонов тестов верстки"""
+import os
+from collections import OrderedDict
+from typing import Tuple, Union
+
+from PIL import Image
+
+from .reference_store import ReferenceStore
+from .shared_cache import SharedReferenceCache
+from ...config import Config
+from ...logfactory import log
+
+config = Config()
+
+
+class ReferenceCache:
+    """Процессный кэш декодированных эталонов
+
+    Ключ - путь до файла, время изменения и размер, поэтому изменённый эталон перечитывается.
+    Эталон, которого нет в папке, берется из хранилища REFERENCE_STORE, ключом тогда служит хэш содержимого.
+    При превышении REFERENCE_CACHE_SIZE (МБ) вытесняются давно не использованные эталоны.
+    При промахе эталон ищется в общем для потоков запуска кэше SharedReferenceCache
+    """
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):  # singleton
+        if not cls.instance:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if not hasattr(self, '_images'):
+            self.max_bytes = int(config.get('REFERENCE_CACHE_SIZE', 'REGRESSION') or 0) * 1024 * 1024
+            self.hits = 0
+            self.misses = 0
+            self.size = 0
+            # путь -> ((mtime, размер файла) или хэш из хранилища, изображение, объём в байтах)
+            self._images = OrderedDict()
+
+    @staticmethod
+    def _image_size(image: Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, path: str) -> Image:
+        """Возвращает декодированный эталон, изображение нельзя изменять"""
+
+        digest = None if os.path.exists(path) else ReferenceStore().digest(path)
+        if digest:
+            key = digest
+        else:
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._images.get(path)
+        if cached and cached[0] == key:
+            self.hits += 1
+            self._images.move_to_end(path)
+            log(f'Эталон {path} взят из кэша (попаданий: {self.hits}, промахов: {self.misses})', '[d]')
+            return cached[1]
+
+        self.misses += 1
+        shared = SharedReferenceCache()
+        shared_key = digest or f'{os.path.abspath(path)}:{key[0]}:{key[1]}'
+        image = shared.get(shared_key)
+        if image is not None:
+            log(f'Эталон {path} взят из общего кэша (попаданий: {self.hits}, промахов: {self.misses})', '[d]')
+            self._put(path, key, image)
+            return image
+        if digest:
+            image = ReferenceStore().read_image(digest)
+        else:
+            with Image.open(path) as image:
+                image.load()
+        log(f'Эталон {path} прочитан с диска (попаданий: {self.hits}, промахов: {self.misses})', '[d]')
+        shared.put(shared_key, image)
+        self._put(path, key, image)
+        return image
+
+    def _put(self, path: str, key: Union[Tuple[int, int], str], image: Image):
+        self.discard(path)
+        image_size = self._image_size(image)
+        if image_size > self.max_bytes:
+            return
+        while self._images and self.size + image_size > self.max_bytes:
+            self.discard(next(iter(self._images)))
+        self._images[path] = (key, image, image_size)
+        self.size += image_size
+
+    def discard(self, path: str):
+        """Удаляет эталон из кэша"""
+
+        cached = self._images.pop(path, None)
+        if cached:
+            self.size -= cached[2]
+
+    def clear(self):
+        self._images.clear()
+        self.size = 0
@@ -0,0 +1,212 @@
+"""Хранилище эталонов с дедупликацией по содержимому
+
+Эталоны лежат в нескольких pack файлах, каждое уникальное содержимое хранится один раз.
+Индекс (sqlite) сопоставляет логический путь эталона (относительно IMAGE_DIR, как его
+строит _get_file_path) хэшу содержимого, а хэш - месту в pack файле.
+Pack файлы читаются через mmap.
+
+Перенести существующую папку эталонов в хранилище:
+
+    layout_reference_store pack --REFERENCE_STORE capture_store [--remove]
+"""
+import argparse
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from ...config import Config
+from ...logfactory import log
+
+config = Config()
+
+# новый pack файл начинается, когда текущий превысит этот размер
+PACK_SIZE = 512 * 1024 * 1024
+
+
+def link_file(src: str, dst: str):
+    """Жесткая ссылка dst на src, если не получилось (другой диск) - копия"""
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ReferenceStore:
+    """Хранилище эталонов в папке REFERENCE_STORE, выключено если опция не задана"""
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):  # singleton
+        if not cls.instance:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if not hasattr(self, 'root'):
+            root = config.get('REFERENCE_STORE', 'REGRESSION')
+            self.root = os.path.abspath(root) if root else None
+            self._standard_dir = os.path.abspath(config.get('IMAGE_DIR', 'REGRESSION'))
+            self._conn = None
+            # номер pack файла -> (файл, mmap)
+            self._maps: Dict[int, Tuple[io.BufferedReader, mmap.mmap]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            # транзакциями управляем сами, запись в pack идет под блокировкой BEGIN IMMEDIATE
+            self._conn = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30, isolation_level=None)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS objects '
+                               '(digest text PRIMARY KEY, pack integer, offset integer, length integer)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS refs (path text PRIMARY KEY, digest text)')
+        return self._conn
+
+    def logical_path(self, path: str) -> str:
+        """Путь эталона относительно IMAGE_DIR"""
+
+        return os.path.relpath(os.path.abspath(path), self._standard_dir).replace(os.sep, '/')
+
+    def digest(self, path: str) -> Optional[str]:
+        """Хэш содержимого эталона или None, если эталона нет в хранилище"""
+
+        if not self.enabled:
+            return None
+        row = self._db.execute('SELECT digest FROM refs WHERE path = ?', (self.logical_path(path),)).fetchone()
+        return row[0] if row else None
+
+    def paths(self) -> List[str]:
+        """Логические пути всех эталонов хранилища"""
+
+        return [path for path, in self._db.execute('SELECT path FROM refs ORDER BY path').fetchall()]
+
+    def read(self, digest: str) -> bytes:
+        """Байты png по хэшу содержимого"""
+
+        pack, offset, length = self._db.execute('SELECT pack, offset, length FROM objects WHERE digest = ?',
+                                                (digest,)).fetchone()
+        return self._map(pack, offset + length)[offset:offset + length]
+
+    def read_image(self, digest: str) -> Image:
+        with Image.open(io.BytesIO(self.read(digest))) as image:
+            image.load()
+        return image
+
+    def put(self, path: str, data: bytes) -> str:
+        """Сохраняет png эталона, одинаковое содержимое записывается один раз"""
+
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if not db.execute('SELECT 1 FROM objects WHERE digest = ?', (digest,)).fetchone():
+                pack, offset = self._append(data)
+                db.execute('INSERT INTO objects VALUES (?, ?, ?, ?)', (digest, pack, offset, len(data)))
+            db.execute('INSERT OR REPLACE INTO refs VALUES (?, ?)', (self.logical_path(path), digest))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return digest
+
+    def put_image(self, path: str, image: Image) -> str:
+        data = io.BytesIO()
+        image.save(data, format='PNG')
+        return self.put(path, data.getvalue())
+
+    def link(self, path: str, dst: str, objects_dir: str):
+        """Ссылка dst на эталон
+
+        Каждое уникальное содержимое выгружается в objects_dir один раз, dst - жесткая ссылка на него
+        """
+
+        digest = self.digest(path)
+        obj = os.path.join(objects_dir, f'{digest}.png')
+        if not os.path.exists(obj):
+            os.makedirs(objects_dir, exist_ok=True)
+            tmp = f'{obj}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as file:
+                file.write(self.read(digest))
+            os.replace(tmp, obj)
+        link_file(obj, dst)
+
+    def pack_dir(self, image_dir: str, remove: bool = False) -> Tuple[int, int]:
+        """Переносит png из папки эталонов в хранилище
+
+        :return: (число эталонов, число уникальных)
+        """
+
+        count = 0
+        for root, dirs, files in os.walk(image_dir):
+            dirs[:] = [name for name in dirs if os.path.join(root, name) != self.root]
+            for name in files:
+                if not name.endswith('.png'):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, 'rb') as file:
+                    self.put(path, file.read())
+                count += 1
+                if remove:
+                    os.remove(path)
+        unique = self._db.execute('SELECT count(*) FROM objects').fetchone()[0]
+        return count, unique
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.root, f'pack-{pack:04d}.pack')
+
+    def _append(self, data: bytes) -> Tuple[int, int]:
+        """Дописывает данные в последний pack файл, вызывается под блокировкой индекса"""
+
+        pack = self._db.execute('SELECT max(pack) FROM objects').fetchone()[0] or 0
+        if os.path.exists(self._pack_path(pack)) and os.path.getsize(self._pack_path(pack)) + len(data) > PACK_SIZE:
+            pack += 1
+        with open(self._pack_path(pack), 'ab') as file:
+            offset = file.seek(0, os.SEEK_END)
+            file.write(data)
+        return pack, offset
+
+    def _map(self, pack: int, size: int) -> mmap.mmap:
+        """mmap pack файла, переоткрывается, если файл дописали после отображения"""
+
+        mapped = self._maps.get(pack)
+        if mapped and len(mapped[1]) >= size:
+            return mapped[1]
+        if mapped:
+            mapped[1].close()
+            mapped[0].close()
+        file = open(self._pack_path(pack), 'rb')
+        self._maps[pack] = (file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[pack][1]
+
+
+def main():
+    """Точка входа layout_reference_store"""
+
+    parser = argparse.ArgumentParser(description='Хранилище эталонов тестов верстки')
+    parser.add_argument('command', choices=['pack'], help='pack - перенести эталоны из IMAGE_DIR в хранилище')
+    parser.add_argument('--remove', action='store_true', help='удалить перенесенные png из IMAGE_DIR')
+    # остальные аргументы (например --REFERENCE_STORE) разбирает Config
+    options, _ = parser.parse_known_args()
+
+    store = ReferenceStore()
+    if not store.enabled:
+        parser.error('не задана папка хранилища REFERENCE_STORE')
+    image_dir = os.path.abspath(config.get('IMAGE_DIR', 'REGRESSION'))
+    count, unique = store.pack_dir(image_dir, options.remove)
+    log(f'Перенесено эталонов: {count}, уникальных: {unique}')
+
+
+if __name__ == '__main__':
+    main()
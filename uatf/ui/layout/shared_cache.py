@@ -0,0 +1,183 @@
+"""Общий для потоков запуска кэш декодированных эталонов в разделяемой памяти
+
+RunTests создает сегмент shared_memory объемом SHARED_CACHE_SIZE (МБ) и сервер индекса
+(эталон -> место в сегменте), адрес передается процессам pytest в переменной окружения UATF_SHARED_CACHE.
+Процесс, первым декодировавший эталон, записывает пиксели в сегмент, остальные получают
+изображение поверх сегмента без копирования и декодирования, только для чтения.
+Записи не вытесняются: когда место закончилось, новые эталоны в общий кэш не попадают.
+"""
+import json
+import os
+import secrets
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.managers import BaseManager
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ...config import Config
+from ...logfactory import log
+
+config = Config()
+
+ENV_NAME = 'UATF_SHARED_CACHE'
+# выравнивание начала эталона в сегменте
+ALIGN = 64
+# режимы без палитры, пиксели которых восстанавливаются по байтам
+SHARED_MODES = ('RGBA', 'RGB', 'L')
+
+_index = None
+
+
+class _Index:
+    """Индекс сегмента, живет в процессе сервера: ключ эталона -> (смещение, режим, размер)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._ready: Dict[str, Tuple[int, str, Tuple[int, int]]] = {}
+        # место выделено, но пиксели еще пишутся
+        self._pending: Dict[str, int] = {}
+
+    def lookup(self, key: str) -> Optional[Tuple[int, str, Tuple[int, int]]]:
+        with self._lock:
+            entry = self._ready.get(key)
+            if entry:
+                self.hits += 1
+            return entry
+
+    def reserve(self, key: str, size: int) -> Optional[int]:
+        """Смещение для записи эталона или None, если он уже пишется или нет места"""
+
+        with self._lock:
+            if key in self._ready or key in self._pending or self.used + size > self.capacity:
+                return None
+            offset = self.used
+            self.used += -(-size // ALIGN) * ALIGN
+            self._pending[key] = offset
+            return offset
+
+    def commit(self, key: str, mode: str, size: Tuple[int, int]):
+        with self._lock:
+            self._ready[key] = (self._pending.pop(key), mode, tuple(size))
+
+    def stats(self) -> Tuple[int, int, int]:
+        with self._lock:
+            return len(self._ready), self.used, self.hits
+
+
+def _init_index(capacity: int):
+    global _index
+    _index = _Index(capacity)
+
+
+def _get_index() -> _Index:
+    return _index
+
+
+class _IndexManager(BaseManager):
+    pass
+
+
+_IndexManager.register('index', callable=_get_index)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Подключение к сегменту без регистрации в resource_tracker,
+    иначе сегмент удалится при завершении первого же процесса тестов"""
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if os.name == 'posix':
+            resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+        return shm
+
+
+class SharedCacheHost:
+    """Сегмент и сервер индекса, создается в RunTests на время запуска"""
+
+    def __init__(self, size_mb: int):
+        self._shm = shared_memory.SharedMemory(create=True, size=size_mb * 1024 * 1024)
+        authkey = secrets.token_bytes(16)
+        self._manager = _IndexManager(address=('127.0.0.1', 0), authkey=authkey)
+        self._manager.start(_init_index, (self._shm.size,))
+        os.environ[ENV_NAME] = json.dumps({'name': self._shm.name, 'address': list(self._manager.address),
+                                           'authkey': authkey.hex()})
+        log(f'Общий кэш эталонов: {size_mb} МБ в {self._shm.name}')
+
+    def close(self):
+        """Останавливаем сервер индекса и удаляем сегмент"""
+
+        os.environ.pop(ENV_NAME, None)
+        try:
+            entries, used, hits = self._manager.index().stats()
+            log(f'Общий кэш эталонов: эталонов {entries}, занято {used / 1024 / 1024:.1f} МБ, '
+                f'попаданий {hits}')
+        finally:
+            self._manager.shutdown()
+            self._shm.close()
+            self._shm.unlink()
+
+
+class SharedReferenceCache:
+    """Клиент общего кэша в процессе тестов, выключен если запуск не через RunTests или кэш недоступен"""
+
+    instance = None
+
+    def __new__(cls, *args, **kwargs):  # singleton
+        if not cls.instance:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        if not hasattr(self, '_index'):
+            self._index = None
+            self._shm = None
+            settings = os.environ.get(ENV_NAME)
+            if settings:
+                try:
+                    settings = json.loads(settings)
+                    manager = _IndexManager(address=tuple(settings['address']),
+                                            authkey=bytes.fromhex(settings['authkey']))
+                    manager.connect()
+                    self._index = manager.index()
+                    self._shm = _attach(settings['name'])
+                except (OSError, ValueError, KeyError) as error:
+                    self._index = None
+                    log(f'Общий кэш эталонов недоступен: {error}', '[d]')
+
+    @property
+    def enabled(self) -> bool:
+        return self._shm is not None
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Эталон поверх разделяемой памяти или None, изображение нельзя изменять"""
+
+        if not self.enabled:
+            return None
+        entry = self._index.lookup(key)
+        if not entry:
+            return None
+        offset, mode, size = entry
+        length = size[0] * size[1] * Image.getmodebands(mode)
+        pixels = np.ndarray((length,), dtype=np.uint8, buffer=self._shm.buf, offset=offset)
+        pixels.flags.writeable = False
+        return Image.frombuffer(mode, size, pixels, 'raw', mode, 0, 1)
+
+    def put(self, key: str, image: Image.Image):
+        """Кладем декодированный эталон в сегмент, если его там еще нет и хватает места"""
+
+        if not self.enabled or image.mode not in SHARED_MODES:
+            return
+        data = image.tobytes()
+        offset = self._index.reserve(key, len(data))
+        if offset is None:
+            return
+        self._shm.buf[offset:offset + len(data)] = data
+        self._index.commit(key, image.mode, image.size)
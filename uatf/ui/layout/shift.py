@@ -0,0 +1,106 @@
+"""Поиск сдвига содержимого между эталоном и текущим изображением"""
+import hashlib
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def line_signatures(image: np.ndarray) -> np.ndarray:
+    """Хэши сырых байт каждой строки изображения
+
+    Одноцветные края строки отбрасываются, чтобы сигнатура не зависела от сдвига вдоль строки
+    """
+
+    # пиксель RGBA как одно число, так сравнение идёт сразу по всем каналам
+    image = np.ascontiguousarray(image).view(np.uint32)[..., 0]
+    content = (image != image[:, :1]) & (image != image[:, -1:])
+    starts = np.where(content.any(axis=1), content.argmax(axis=1), 0)
+    ends = np.where(content.any(axis=1), content.shape[1] - content[:, ::-1].argmax(axis=1), content.shape[1])
+    return np.array([hashlib.blake2b(row[start:end].tobytes(), digest_size=16).digest()
+                     for row, start, end in zip(image, starts.tolist(), ends.tolist())], dtype='S16')
+
+
+def estimate_offset(current: np.ndarray, standard: np.ndarray, max_shift: int) -> int:
+    """Сдвиг current относительно standard по взаимной корреляции сигнатур строк
+
+    Совпадение строки с сигнатурой, которая часто встречается в эталоне (фон),
+    весит меньше, чем совпадение уникальной строки. Сдвиг выбирается, только если он
+    даёт больше совпадений, чем отсутствие сдвига; при равенстве побеждает меньший сдвиг
+    """
+
+    signatures, codes = np.unique(np.concatenate((current, standard)), return_inverse=True)
+    codes = codes.reshape(-1)
+    current_codes, standard_codes = codes[:len(current)], codes[len(current):]
+    weights = 1 / np.maximum(np.bincount(standard_codes, minlength=len(signatures)), 1)
+
+    best_shift, best_score = 0, None
+    for shift in sorted(range(-max_shift, max_shift + 1), key=abs):
+        # строка r текущего изображения соответствует строке r - shift эталона
+        start, end = max(shift, 0), min(len(current), len(standard) + shift)
+        if end - start <= 0:
+            continue
+        matched = current_codes[start:end] == standard_codes[start - shift:end - shift]
+        score = weights[current_codes[start:end][matched]].sum()
+        if best_score is None or score > best_score:
+            best_shift, best_score = shift, score
+    return best_shift
+
+
+def _estimate_axes(current: np.ndarray, standard: np.ndarray, max_shift: int) -> Tuple[int, int]:
+    """Сдвиг (dx, dy): сначала по строкам общей ширины, затем по столбцам совмещённых строк"""
+
+    width = min(current.shape[1], standard.shape[1])
+    dy = estimate_offset(line_signatures(current[:, :width]), line_signatures(standard[:, :width]), max_shift)
+
+    top, bottom = max(dy, 0), min(current.shape[0], standard.shape[0] + dy)
+    if bottom <= top:
+        return 0, dy
+    dx = estimate_offset(line_signatures(current[top:bottom].transpose(1, 0, 2)),
+                         line_signatures(standard[top - dy:bottom - dy].transpose(1, 0, 2)), max_shift)
+    return dx, dy
+
+
+def matched_pixels(current: np.ndarray, standard: np.ndarray, shift: Tuple[int, int]) -> int:
+    """Число совпавших пикселей при совмещении со сдвигом"""
+
+    current_box, standard_box = overlap(current.shape, standard.shape, shift)
+    return int(np.count_nonzero(np.all(current[current_box] == standard[standard_box], axis=2)))
+
+
+def estimate_shift(current: np.ndarray, standard: np.ndarray, max_shift: int,
+                   differing: Optional[int] = None) -> Tuple[int, int]:
+    """Сдвиг содержимого (dx, dy) текущего изображения относительно эталона
+
+    Сдвиг ищется в двух порядках (сначала по вертикали и сначала по горизонтали),
+    выбирается вариант с наибольшим числом совпавших пикселей, если он лучше отсутствия сдвига
+
+    :param differing: число пикселей, отличающихся без сдвига, если оно уже известно
+    """
+
+    if differing is not None:
+        # сдвиг хотя бы на 1 px выводит из совмещения не меньше min(высота, ширина) пикселей,
+        # поэтому при меньшем числе отличий он не совпадет лучше, чем отсутствие сдвига
+        if differing <= min(current.shape[:2]):
+            return 0, 0
+        best_matched = current.shape[0] * current.shape[1] - differing
+    else:
+        best_matched = matched_pixels(current, standard, (0, 0))
+
+    dx, dy = _estimate_axes(current, standard, max_shift)
+    dy_t, dx_t = _estimate_axes(current.transpose(1, 0, 2), standard.transpose(1, 0, 2), max_shift)
+    best_shift = (0, 0)
+    for shift in {(dx, dy), (dx_t, dy_t)} - {(0, 0)}:
+        matched = matched_pixels(current, standard, shift)
+        if matched > best_matched:
+            best_shift, best_matched = shift, matched
+    return best_shift
+
+
+def overlap(current_shape: tuple, standard_shape: tuple, shift: Tuple[int, int]) -> Tuple[slice, slice]:
+    """Совмещённые области (current, standard) при сдвиге (dx, dy)"""
+
+    dx, dy = shift
+    top, bottom = max(dy, 0), min(current_shape[0], standard_shape[0] + dy)
+    left, right = max(dx, 0), min(current_shape[1], standard_shape[1] + dx)
+    bottom, right = max(bottom, top), max(right, left)
+    return np.s_[top:bottom, left:right], np.s_[top - dy:bottom - dy, left - dx:right - dx]
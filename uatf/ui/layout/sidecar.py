@@ -0,0 +1,163 @@
+"""Предрасчитанные признаки эталонов (sidecar)
+
+Для каждого эталона рядом с png пишется файл <эталон>.png.sidecar: палитра уникальных цветов,
+их Lab и яркость, плоскость индексов палитры и хэши плиток. Массивы лежат подряд в формате npy
+и читаются через memmap, поэтому при сравнении Lab, яркость и хэши плиток эталона не пересчитываются.
+Для эталонов из REFERENCE_STORE sidecar хранится в <REFERENCE_STORE>/sidecars/<хэш>.sidecar.
+
+Записать sidecar для всех эталонов:
+
+    layout_sidecars
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .antialiasing import luma_plane
+from .color_lab import rgb_to_lab_array
+from .pixel_diff import image_to_array, tile_hashes
+from .reference_store import ReferenceStore
+from ...config import Config
+from ...logfactory import log
+
+config = Config()
+
+# меняется при изменении формата, старые sidecar при этом игнорируются
+SIDECAR_VERSION = 1
+
+
+class ReferenceFeatures:
+    """Признаки эталона: цвет пикселя - palette[index], его Lab - lab[index], яркость - luma[index]"""
+
+    def __init__(self, palette: np.ndarray, lab: Optional[np.ndarray], luma: np.ndarray, index: np.ndarray,
+                 tiles: Optional[np.ndarray] = None):
+        self.palette = palette
+        self.lab = lab
+        self.luma = luma
+        self.index = index
+        # хэши плиток TILE_SIZE, None для вырезанной части эталона
+        self.tiles = tiles
+
+    @classmethod
+    def from_array(cls, image: np.ndarray) -> 'ReferenceFeatures':
+        """Считаем признаки по массиву RGBA эталона"""
+
+        packed = np.ascontiguousarray(image).view(np.uint32)[..., 0]
+        colors, index = np.unique(packed.reshape(-1), return_inverse=True)
+        palette = colors.view(np.uint8).reshape(-1, 4)
+        index = index.reshape(packed.shape).astype(np.uint16 if len(colors) <= 1 << 16 else np.uint32)
+        return cls(palette, rgb_to_lab_array(palette), luma_plane(palette), index, tile_hashes(image))
+
+    def crop(self, box: Tuple[slice, slice]) -> 'ReferenceFeatures':
+        """Признаки части эталона, хэши плиток к ней не подходят"""
+
+        return ReferenceFeatures(self.palette, self.lab, self.luma, self.index[box])
+
+    def lab_at(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        return self.lab[self.index[ys, xs]]
+
+    def luma_plane(self, box: Tuple[slice, slice]) -> np.ndarray:
+        return self.luma[self.index[box]]
+
+    def save(self, path: str, meta: Tuple[int, int] = (0, 0)):
+        """Пишем массивы подряд в формате npy, meta - (mtime_ns, размер) png эталона"""
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as file:
+            for array in (np.array((SIDECAR_VERSION, *meta), dtype=np.int64), self.tiles, self.palette,
+                          self.lab, self.luma, self.index):
+                np.lib.format.write_array(file, np.ascontiguousarray(array))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, meta: Optional[Tuple[int, int]] = None, lab: bool = True
+             ) -> Optional['ReferenceFeatures']:
+        """Открываем sidecar через memmap, None если он устарел или другого формата
+
+        :param meta: (mtime_ns, размер) png эталона, None - не проверять
+        :param lab: нужен ли Lab (только для COLOR_SPACE = lab)
+        """
+
+        arrays = []
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            while file.tell() < size:
+                version = np.lib.format.read_magic(file)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(file)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(file)
+                offset = file.tell()
+                arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+                file.seek(offset + arrays[-1].nbytes)
+        header, tiles, palette, lab_array, luma, index = arrays
+        if header[0] != SIDECAR_VERSION or (meta is not None and tuple(header[1:]) != tuple(meta)):
+            return None
+        return cls(palette, lab_array if lab else None, luma, index, tiles)
+
+
+def sidecar_path(src: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+    """Путь до sidecar эталона и (mtime_ns, размер) png для проверки актуальности"""
+
+    if os.path.exists(src):
+        stat = os.stat(src)
+        return f'{src}.sidecar', (stat.st_mtime_ns, stat.st_size)
+    store = ReferenceStore()
+    return os.path.join(store.root, 'sidecars', f'{store.digest(src)}.sidecar'), None
+
+
+def load_features(src: str, lab: bool = True) -> Optional[ReferenceFeatures]:
+    """Признаки эталона из sidecar, None если sidecar нет или он устарел"""
+
+    path, meta = sidecar_path(src)
+    if not os.path.exists(path):
+        return None
+    try:
+        features = ReferenceFeatures.load(path, meta, lab)
+    except (OSError, ValueError) as error:
+        log(f'Не удалось прочитать sidecar {path}: {error}', '[d]')
+        return None
+    if features is None:
+        log(f'Sidecar {path} устарел, признаки эталона будут посчитаны заново', '[d]')
+    return features
+
+
+def write_sidecar(src: str, image: Image) -> str:
+    """Пишем sidecar для эталона src"""
+
+    path, meta = sidecar_path(src)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ReferenceFeatures.from_array(image_to_array(image)).save(path, meta or (0, 0))
+    return path
+
+
+def main():
+    """Точка входа layout_sidecars: sidecar для всех эталонов IMAGE_DIR и REFERENCE_STORE"""
+
+    from .reference_cache import ReferenceCache
+
+    image_dir = os.path.abspath(config.get('IMAGE_DIR', 'REGRESSION'))
+    sources = []
+    for root, _, files in os.walk(image_dir):
+        sources.extend(os.path.join(root, name) for name in files if name.endswith('.png'))
+    store = ReferenceStore()
+    if store.enabled:
+        sources.extend(os.path.join(image_dir, path) for path in store.paths()
+                       if not os.path.exists(os.path.join(image_dir, path)))
+
+    written = 0
+    cache = ReferenceCache()
+    for src in sources:
+        path, meta = sidecar_path(src)
+        if os.path.exists(path) and ReferenceFeatures.load(path, meta) is not None:
+            continue
+        write_sidecar(src, cache.get(src))
+        cache.discard(src)
+        written += 1
+    log(f'Эталонов: {len(sources)}, записано sidecar: {written}')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,16 @@ from selenium import webdriver
 from ..config import Config
 from ..logfactory import log
 
+# устройства для CHROME_MOBILE_EMULATION: (ширина, высота, devicePixelRatio) как в devtools
+MOBILE_DEVICES = {
+    'iPad Mini': (768, 1024, 2),
+    'iPhone SE': (375, 667, 2),
+    'iPhone X': (375, 812, 3),
+    'iPhone XR': (414, 896, 2),
+    'Pixel 5': (393, 851, 2.75),
+    'Galaxy Tab S4': (712, 1138, 2.25),
+}
+
 
 class RunBrowser:
     """Класс для запуска браузеров"""
@@ -26,10 +36,9 @@ class RunBrowser:
 
         if self.config.GENERAL.get('CHROME_MOBILE_EMULATION'):
             chrome_mobile_emulation = self.config.GENERAL.get('CHROME_MOBILE_EMULATION')
-            devices = ('iPad Mini', 'iPhone SE', 'iPhone X', 'iPhone XR', 'Pixel 5', 'Galaxy Tab S4')
-            if chrome_mobile_emulation not in devices:
+            if chrome_mobile_emulation not in MOBILE_DEVICES:
                 raise ValueError(f"Выбрано неверное устройство {chrome_mobile_emulation}, " 
-                                 f"список поддерживаемых устройств:\n{chr(10).join(devices)}")
+                                 f"список поддерживаемых устройств:\n{chr(10).join(MOBILE_DEVICES)}")
             mobile_emulation = {"deviceName": chrome_mobile_emulation}
             options.add_experimental_option('mobileEmulation', mobile_emulation)
 